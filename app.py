@@ -3,17 +3,88 @@ import subprocess
 import random
 import time
 import os
+import signal
 import threading
 import ast  # For safely evaluating the VIDEO_SEGMENTS from file
+import audio_cues
+import prefetch
+import metrics
+import ringlog
+import playback_state
+import player_control
+import input_map
+import trigger_api
+import video_verify
+import renditions
+import play_stats
+import encode_budget
+import loop_health
+import player_tuning
+import popularity
 
 # === Configuration ===
 BUTTON_GPIO = 17  # Video trigger button
 SHUTDOWN_GPIO = 27  # Shutdown button
+# Pin -> "random", "shutdown", "group:<name>" from SEGMENT_GROUPS, or a segment name
+BUTTON_MAP = {
+    BUTTON_GPIO: "random",
+    SHUTDOWN_GPIO: "shutdown",
+    # 22: "group:animals",
+    # 23: "video3",
+}
+SEGMENT_GROUPS = {
+    # "animals": ["video1", "video2"],
+}
+PRESS_DEBOUNCE = 2  # Seconds before the same button is accepted again
+SHUTDOWN_HOLD = 2  # Seconds the shutdown button must be held
+TRIGGER_TOKEN = ""  # Shared secret for the network trigger API; empty disables it
+TRIGGER_BIND = "127.0.0.1"  # Address of the interface the trigger API listens on
+TRIGGER_UDP_PORT = 9106
+TRIGGER_HTTP_PORT = 9107
 VIDEO_FOLDER = "/home/pi-five/pi_video"  # Folder containing video files
 MERGED_VIDEO = "/home/pi-five/pi_video/merged_videos.mp4"  # Single merged video
 BOOT_SOUND_FILE = "/home/pi-five/pi_video/boot_sound.wav"  # Sound to play on boot
 BLACK_SCREEN_VIDEO = "/home/pi-five/pi_video/black.mp4"  # Black screen video file
 VIDEO_TIMINGS_FILE = "/home/pi-five/pi_video/video_timings.txt"  # Video timings file
+MEDIA_RELEASE_LINK = "/home/pi-five/pi_video/current"  # Build published by merge_and_extract.py; media paths resolve through it
+APP_PID_FILE = "/tmp/pi_video_app.pid"  # watch_rebuild.py sends SIGHUP here after publishing a new build
+PLAYING_FLAG_FILE = encode_budget.PLAYING_FLAG  # Exists while a segment plays; background merges pause on it (up to encode_budget.MAX_PAUSE)
+PRESS_CUE_FILE = "/home/pi-five/pi_video/press_cue.wav"  # Short click played on button press
+USE_CUE_PLAYER = True  # Play boot/press cues in-process instead of spawning aplay
+AUTO_RENDITION = True  # Pick the merged-video rendition from a decode benchmark and dropped frames
+RENDITIONS_FILE = "/home/pi-five/pi_video/renditions.json"  # Written by merge_and_extract.py
+RENDITION_BENCH_CACHE = "/home/pi-five/pi_video/rendition_bench.json"
+PLAYER_STATS_INTERVAL = 1.0  # Seconds between player frame-counter samples (0 disables)
+PLAYER_LOG_STATS = True  # Count late-picture/late-audio warnings in cvlc's verbose output
+PLAY_STATS_FILE = "/home/pi-five/pi_video/play_stats.jsonl"  # Per-play quality records (play_stats.py reports)
+PLAY_COUNTS_FILE = "/home/pi-five/pi_video/play_counts.json"  # Plays per clip; merge_and_extract.py --by-popularity puts the most played first
+VERIFY_ON_BOOT = True  # Re-hash changed or long-unchecked chunks of the merged video against its manifest
+VERIFY_BOOT_WAIT = 15  # Seconds boot waits for the check before carrying on (it then finishes in the background)
+PREFETCH_ENABLED = True  # Warm upcoming segments into the page cache while idle
+PREFETCH_BUDGET_MB = 256  # Most bytes kept warm: the queued segment, button targets, then the most played
+PREFETCH_TOP_PLAYED = 5  # Most-played segments warmed after the button targets
+PREFETCH_TO_TMPFS = False  # Copy the merged video to /dev/shm at boot if it fits in RAM
+METRICS_ENABLED = True  # Prometheus endpoint on localhost plus a textfile in /dev/shm
+METRICS_PORT = 9105
+METRICS_TEXTFILE = "/dev/shm/pi_video.prom"
+PLAYBACK_POLICY = "ignore"  # Presses during playback: "ignore", "queue" the next segment, or "switch" immediately
+PLAYER_TUNING_FILE = "/home/pi-five/pi_video/player_tuning.json"  # cvlc caching/thread/output settings from player_tuning.py
+CONTINUOUS_PLAY = False  # Attract loop: chain segments in one player, with no black screen or new process between them
+CHAIN_ORDER = "shuffle"  # Next segment in continuous play: "shuffle", or "sequence" (file order, so no seek at all)
+CHAIN_PREPARE_AHEAD = 2.0  # Seconds before a segment ends that the next one is chosen and read into the page cache
+CHAIN_GAP_WINDOW = 1.0  # Seconds of frame counters sampled after each transition to measure its gap
+CHAIN_RETRY = 5.0  # Seconds between attempts to restart continuous play after the player failed
+CHAIN_END_MARGIN = 0.2  # Seconds early the last segment in the file moves on, before the player reaches the end and exits
+PLAYER_CONTROL_SOCKET = "/tmp/pi_video_vlc.sock"  # cvlc remote control socket (seeks, stats)
+ENDING_GRACE = 3.0  # Seconds a player may keep running after its segment ended before it is stopped
+LOOP_STALL_THRESHOLD = 0.5  # Seconds without a main loop tick before the stalled call is logged with its stack
+LOOP_STALL_DETECTION = True  # Watcher thread for stalls (tick intervals and the systemd heartbeat are always on)
+LOG_RING_SIZE = 4096  # Log entries kept in memory and dumped on crash/SIGUSR1/SIGTERM
+
+# === Logging ===
+# Log lines go to an in-memory ring and are flushed to stdout in batches
+logger = ringlog.RingLog(capacity=LOG_RING_SIZE).start()
+log = logger.log
 
 # Video segments from video_timings.txt
 # VIDEO_SEGMENTS = [
@@ -22,11 +93,6 @@ VIDEO_TIMINGS_FILE = "/home/pi-five/pi_video/video_timings.txt"  # Video timings
 #     {"name": "video3", "start": 88.0, "duration": 22.9},
 # ]
 
-# === Setup ===
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(BUTTON_GPIO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(SHUTDOWN_GPIO, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-
 # === Global Variables ===
 current_video_process = None
 black_screen_process = None
@@ -34,14 +100,87 @@ current_segment = None
 system_running = True
 black_screen_failed = False
 last_black_screen_attempt = 0
-video_playing = False  # Track if video is currently playing
 current_timer = None  # Track the current timer
+ending_since = None  # When the current segment's time ran out
+playback = playback_state.PlaybackStateMachine(PLAYBACK_POLICY)
+player_remote = None  # Remote control of the running video player
+player_stats = None  # Latest frame counters of the running video player
+player_log = None  # Counts warnings in the running player's verbose output
+stats_baseline = None  # Player counters when the current segment started
+segment_started_at = None
+play_quality = play_stats.PlayStats(PLAY_STATS_FILE)
+play_counts = popularity.PlayCounts(PLAY_COUNTS_FILE)
+rendition_selector = None  # Chooses between encoded renditions of the merged video
+cue_player = None  # In-process audio cue mixer
+prefetcher = None  # Page-cache warmer for the merged video
+press_time = None  # When the button press being served was detected
+dispatcher = None  # Queues button edges for the main loop
+shutdown_armed = {}  # Shutdown pin -> when it was pressed
+trigger_server = None  # Network trigger API
+bad_segments = set()  # Segments that failed verification and are never picked
+media_release = None  # Release folder the media paths point into
+reload_requested = False  # Set by SIGHUP
+pending_media = None  # New media prepared in the background, swapped in once idle
+playing_flag = False  # Whether PLAYING_FLAG_FILE currently exists
+loop_monitor = None  # Tick intervals, stalls and the systemd watchdog heartbeat
+player_tuning_args = []  # Extra cvlc options tuned for this unit
+chain_timer = None  # Picks and warms the next segment shortly before the current one ends (continuous play)
+chain_next = None  # Segment prepared to follow the current one
+chain_paused = False  # Stop button pressed: continuous play waits for the next press
+chain_restart_at = 0  # Earliest time continuous play may be restarted
+segment_ends_at = None  # When the current segment's timer is due (continuous play keeps to this timeline)
+
+# === Metrics ===
+registry = metrics.Registry()
+METRIC_PRESSES = registry.counter("pi_video_button_presses_total", "Button presses", ("button", "result"))
+METRIC_PRESS_LATENCY = registry.histogram("pi_video_press_dispatch_seconds", "Button edge to press handled by the main loop",
+                                          ("button",), buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 1.0))
+METRIC_PLAYS = registry.counter("pi_video_segment_plays_total", "Segment plays", ("segment",))
+METRIC_PLAYER_STARTS = registry.counter("pi_video_player_starts_total", "Player processes started", ("player",))
+METRIC_AUDIO_RESETS = registry.counter("pi_video_audio_resets_total", "Audio system resets")
+METRIC_PRESS_TO_SPAWN = registry.histogram("pi_video_press_to_spawn_seconds", "Button press to player process started")
+METRIC_BAD_SEGMENTS = registry.gauge("pi_video_bad_segments", "Segments excluded after failing verification")
+METRIC_VERIFY_RATE = registry.gauge("pi_video_verify_bytes_per_second", "Throughput of the last boot verification")
+METRIC_FRAMES = registry.counter("pi_video_frames_total", "Player pictures per segment",
+                                 ("segment", "kind"))
+METRIC_AUDIO_BUFFERS = registry.counter("pi_video_audio_buffers_total", "Player audio buffers per segment",
+                                        ("segment", "kind"))
+METRIC_LOST_RATIO = registry.gauge("pi_video_lost_frame_ratio", "Lost pictures over the segment's recent plays",
+                                   ("segment",))
+METRIC_RENDITION = registry.gauge("pi_video_rendition_info", "Rendition of the merged video in use", ("rendition",))
+METRIC_MEDIA_RELOADS = registry.counter("pi_video_media_reloads_total", "Media reloads after SIGHUP", ("result",))
+METRIC_TICK = registry.histogram("pi_video_loop_tick_seconds", "Main loop tick interval (0.05s, shorter when woken by a press)",
+                                 buckets=(0.05, 0.055, 0.06, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+METRIC_CHAIN_GAP = registry.histogram("pi_video_chain_gap_seconds", "Longest wait for a new frame around a continuous-play transition",
+                                     ("kind",), buckets=(0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0))
+METRIC_STALLS = registry.counter("pi_video_loop_stalls_total", "Main loop stalls over LOOP_STALL_THRESHOLD, by the call that held it",
+                                 ("call",))
+
+configured_media = {"video": MERGED_VIDEO, "timings": VIDEO_TIMINGS_FILE, "renditions": RENDITIONS_FILE}
+
+def resolve_media():
+    """Media paths inside the current release (read through its link once), or the configured paths"""
+    paths = dict(configured_media, release=None)
+    try:
+        release = os.path.realpath(MEDIA_RELEASE_LINK)
+    except OSError:
+        return paths
+    if not os.path.isdir(release):
+        return paths
+    paths["release"] = release
+    for key in ("video", "timings", "renditions"):
+        paths[key] = os.path.join(release, os.path.basename(paths[key]))
+    return paths
+
+media = resolve_media()
+media_release = media["release"]
+MERGED_VIDEO, VIDEO_TIMINGS_FILE, RENDITIONS_FILE = media["video"], media["timings"], media["renditions"]
 
 def load_video_segments():
     """Load video segments from video_timings.txt file"""
     try:
         if not os.path.exists(VIDEO_TIMINGS_FILE):
-            print(f"Video timings file not found: {VIDEO_TIMINGS_FILE}")
+            log(f"Video timings file not found: {VIDEO_TIMINGS_FILE}", "WARN")
             # Fallback to default segments
             return [
                 {"name": "video1", "start": 0, "duration": 45.9},
@@ -63,10 +202,10 @@ def load_video_segments():
                     list_content = content[content.find('['):content.find(']') + 1]
                     # Safely evaluate the list
                     segments = ast.literal_eval(list_content)
-                    print(f"Loaded {len(segments)} video segments from {VIDEO_TIMINGS_FILE}")
+                    log(f"Loaded {len(segments)} video segments from {VIDEO_TIMINGS_FILE}")
                     return segments
         
-        print("VIDEO_SEGMENTS not found in file, using defaults")
+        log("VIDEO_SEGMENTS not found in file, using defaults", "WARN")
         return [
             {"name": "video1", "start": 0, "duration": 45.9},
             {"name": "video2", "start": 45.9, "duration": 42.2},
@@ -74,7 +213,7 @@ def load_video_segments():
         ]
         
     except Exception as e:
-        print(f"Error loading video segments: {e}")
+        log(f"Error loading video segments: {e}", "ERROR")
         # Fallback to default segments
         return [
             {"name": "video1", "start": 0, "duration": 45.9},
@@ -83,7 +222,8 @@ def load_video_segments():
         ]
 # Load video segments from file
 VIDEO_SEGMENTS = load_video_segments()
-print(VIDEO_SEGMENTS)
+log(f"Segments: {VIDEO_SEGMENTS}")
+play_counts.use_timings(VIDEO_TIMINGS_FILE)
 def get_audio_device():
     """Detect the correct audio device"""
     try:
@@ -105,40 +245,343 @@ def kill_all_vlc():
         pass
 def cancel_current_timer():
     """Cancel the current timer if it exists"""
-    global current_timer
+    global current_timer, chain_timer
     if current_timer:
         current_timer.cancel()
         current_timer = None
+    if chain_timer:
+        chain_timer.cancel()
+        chain_timer = None
         
 def reset_audio_system():
     """Reset audio system if sound drops out"""
     try:
-        print("Resetting audio system...")
+        log("Resetting audio system...")
+        METRIC_AUDIO_RESETS.inc()
         subprocess.call(["sudo", "systemctl", "restart", "alsa-state"], 
                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         time.sleep(1)
     except:
         pass
 
+def setup_metrics():
+    """Start the localhost metrics endpoint and the periodic textfile writer"""
+    if not METRICS_ENABLED:
+        return
+    
+    sampler = metrics.ProcessSampler(registry, "pi_video_player")
+    registry.collectors.append(lambda: sampler.sample({
+        "video": current_video_process.pid if current_video_process else None,
+        "black": black_screen_process.pid if black_screen_process else None,
+    }))
+    
+    try:
+        metrics.serve(registry, port=METRICS_PORT)
+        log(f"Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    except OSError as e:
+        log(f"Metrics endpoint unavailable: {e}", "WARN")
+    metrics.start_textfile_writer(registry, METRICS_TEXTFILE)
+
+def verify_video():
+    """Check the merged video against its chunk-hash manifest and exclude damaged segments"""
+    try:
+        result = video_verify.verify(MERGED_VIDEO)
+    except Exception as e:
+        log(f"Verification error: {e}", "ERROR")
+        return
+    
+    if result["status"] == "no-manifest":
+        log(f"No verification manifest for {MERGED_VIDEO}, run video_verify.py build", "WARN")
+        return
+    if result["status"] == "missing":
+        return
+    if result["bytes"]:
+        METRIC_VERIFY_RATE.set(round(result["throughput"]))
+    log("Verified merged video", status=result["status"], reason=result["reason"], chunks=result["checked"],
+        mb=round(result["bytes"] / (1024*1024), 1), seconds=round(result["seconds"], 2))
+    if result["bad_segments"]:
+        bad_segments.update(result["bad_segments"])
+        METRIC_BAD_SEGMENTS.set(len(bad_segments))
+        log(f"Corrupt chunks {result['bad_chunks']}, excluding segments: {', '.join(result['bad_segments'])}", "ERROR")
+
+def start_verification():
+    """Run verify_video() on a background thread so it overlaps the boot sound"""
+    if not VERIFY_ON_BOOT:
+        return None
+    thread = threading.Thread(target=verify_video, name="verify", daemon=True)
+    thread.start()
+    return thread
+
+def setup_player_tuning():
+    """Load the cvlc settings player_tuning.py measured as best on this unit"""
+    global player_tuning_args
+    tuning = player_tuning.load_tuning(PLAYER_TUNING_FILE)
+    player_tuning_args = player_tuning.player_args(tuning)
+    if player_tuning_args:
+        log(f"Player tuning: {' '.join(player_tuning_args)}")
+
+def setup_rendition():
+    """Pick the best rendition this Pi decodes fast enough (benchmarks are cached per file)"""
+    global rendition_selector, MERGED_VIDEO
+    if not AUTO_RENDITION:
+        return None
+    try:
+        available = renditions.load_renditions(RENDITIONS_FILE, MERGED_VIDEO)
+        rendition_selector = renditions.RenditionSelector(available, RENDITION_BENCH_CACHE, log=log)
+        chosen = rendition_selector.select()
+    except Exception as e:
+        log(f"Rendition selection failed: {e}", "WARN")
+        rendition_selector = None
+        return None
+    MERGED_VIDEO = chosen["path"]
+    METRIC_RENDITION.set(1, chosen["name"])
+    speeds = {name: round(speed, 2) for name, speed in rendition_selector.speeds.items()}
+    log(f"Using rendition {chosen['name']}: {MERGED_VIDEO}", decode_speeds=speeds)
+    return chosen
+
+def switch_rendition(rendition):
+    """Move to another rendition after the current one degraded; takes effect from the next play"""
+    global MERGED_VIDEO, prefetcher
+    previous = MERGED_VIDEO
+    METRIC_RENDITION.remove(rendition_selector.renditions[rendition_selector.index - 1]["name"])
+    METRIC_RENDITION.set(1, rendition["name"])
+    MERGED_VIDEO = rendition["path"]
+    log(f"Switched to rendition {rendition['name']}: {MERGED_VIDEO}", "WARN")
+    
+    bad_segments.clear()
+    METRIC_BAD_SEGMENTS.set(0)
+    if prefetcher:
+        prefetcher.stop()
+        prefetcher = None
+    if os.path.dirname(previous) == prefetch.TMPFS_DIR:
+        try:
+            os.remove(previous)  # Free the RAM held by the old tmpfs copy
+        except OSError:
+            pass
+    setup_prefetch()
+    start_verification()
+
+def sample_player_stats():
+    """Poll the running player's frame counters (runs on its own thread)"""
+    global player_stats
+    wait = threading.Event()
+    while system_running:
+        wait.wait(PLAYER_STATS_INTERVAL)
+        remote = player_remote
+        if remote is None or playback.state != playback_state.PLAYING:
+            continue
+        stats = remote.stats()
+        if stats and remote is player_remote:
+            player_stats = stats
+
+def start_stats_sampler():
+    if PLAYER_STATS_INTERVAL <= 0:
+        return None
+    thread = threading.Thread(target=sample_player_stats, name="player-stats", daemon=True)
+    thread.start()
+    return thread
+
+def record_play_stats(segment_name):
+    """Record quality counters of the segment play that just ended, and feed the rendition selector"""
+    global stats_baseline
+    current = dict(player_stats or {})
+    if player_log:
+        current.update(player_log.snapshot())
+    if not current or not segment_name:
+        return None
+    # The player's counters cover its whole run; a switched-to segment starts from a baseline
+    counters = play_stats.counter_delta(current, stats_baseline)
+    stats_baseline = current
+    
+    seconds = time.time() - segment_started_at if segment_started_at else None
+    rendition = rendition_selector.current["name"] if rendition_selector else None
+    play_quality.record(segment_name, counters, rendition, seconds)
+    for kind in ("video_decoded", "frames_displayed", "frames_lost", "frames_late"):
+        if kind in counters:
+            METRIC_FRAMES.inc((segment_name, kind), counters[kind])
+    for kind in ("buffers_played", "buffers_lost", "audio_late"):
+        if kind in counters:
+            METRIC_AUDIO_BUFFERS.inc((segment_name, kind), counters[kind])
+    rolling = play_quality.rolling(segment_name)
+    METRIC_LOST_RATIO.set(round(rolling["lost_ratio"], 4), segment_name)
+    log("Play stats", segment=segment_name, displayed=counters.get("frames_displayed"),
+        lost=counters.get("frames_lost"), late=counters.get("frames_late"),
+        audio_lost=counters.get("buffers_lost"), audio_late=counters.get("audio_late"),
+        rolling_lost=f"{rolling['lost_ratio']:.2%}")
+    
+    if rendition_selector and "frames_displayed" in counters:
+        fallback = rendition_selector.observe(counters["frames_displayed"], counters.get("frames_lost", 0))
+        if fallback:
+            switch_rendition(fallback)
+    return counters
+
+def setup_prefetch():
+    """Optionally move the merged video to tmpfs, then start idle read-ahead"""
+    global prefetcher, MERGED_VIDEO
+    
+    if not PREFETCH_ENABLED or not os.path.exists(MERGED_VIDEO):
+        return None
+    
+    if PREFETCH_TO_TMPFS:
+        try:
+            tmpfs_path = prefetch.copy_to_tmpfs(MERGED_VIDEO)
+            if tmpfs_path:
+                MERGED_VIDEO = tmpfs_path
+        except Exception as e:
+            log(f"tmpfs copy failed: {e}", "ERROR")
+    
+    try:
+        prefetcher = prefetch.Prefetcher(MERGED_VIDEO, VIDEO_SEGMENTS)
+    except Exception as e:
+        log(f"Prefetch disabled: {e}", "WARN")
+        return None
+    
+    prefetch_upcoming()
+    return prefetcher
+
+def prefetch_upcoming():
+    """Warm the likely next segments, up to PREFETCH_BUDGET_MB
+
+    In order: the queued segment, the segments of single-segment and group
+    buttons ("random" ones could pick anything), then the most played.
+    Warming the whole library would just churn the page cache once it is
+    larger than RAM.
+    """
+    if not prefetcher:
+        return
+    names = [playback.queued] if playback.queued else []
+    if dispatcher:
+        for button in dispatcher.buttons.values():
+            if button.action != input_map.RANDOM and button.segments:
+                names += button.segments
+    with play_counts.lock:
+        weights = popularity.segment_weights(VIDEO_SEGMENTS, play_counts.plays, play_counts.sources)
+    names += [name for name, plays in sorted(weights.items(), key=lambda item: -item[1]) if plays][:PREFETCH_TOP_PLAYED]
+    chosen = []
+    budget = PREFETCH_BUDGET_MB * 1024 * 1024
+    for name in dict.fromkeys(names):
+        size = prefetcher.segment_bytes(name)
+        if size and size <= budget:
+            chosen.append(name)
+            budget -= size
+    prefetcher.schedule(chosen)
+
+def request_media_reload(signum=None, frame=None):
+    """SIGHUP: new media was published; prepare it off the main loop"""
+    global reload_requested
+    reload_requested = True
+    if dispatcher:
+        dispatcher.wake.set()
+
+def prepare_media():
+    """Load, pick a rendition for and verify the newly published release (runs on its own thread)"""
+    global pending_media
+    paths = resolve_media()
+    if paths["release"] == media_release:
+        log("Media reload: release unchanged")
+        METRIC_MEDIA_RELOADS.inc("unchanged")
+        return
+    try:
+        segments = prefetch.read_timings(paths["timings"])
+        if not segments:
+            raise ValueError("no segments")
+        selector = None
+        if AUTO_RENDITION:
+            selector = renditions.RenditionSelector(renditions.load_renditions(paths["renditions"], paths["video"]),
+                                                    RENDITION_BENCH_CACHE, log=log)
+            paths["video"] = selector.select()["path"]
+        if not os.path.exists(paths["video"]):
+            raise OSError(f"{paths['video']} missing")
+        bad = set()
+        result = video_verify.verify(paths["video"])
+        if result["status"] == "bad":
+            bad.update(result["bad_segments"])
+            log(f"New media has corrupt chunks, excluding segments: {', '.join(result['bad_segments'])}", "ERROR")
+        if PREFETCH_TO_TMPFS:
+            tmpfs_path = prefetch.copy_to_tmpfs(paths["video"])
+            if tmpfs_path:
+                paths["video"] = tmpfs_path
+        warmer = prefetch.Prefetcher(paths["video"], segments) if PREFETCH_ENABLED else None
+    except Exception as e:
+        log(f"Media reload failed, keeping {MERGED_VIDEO}: {e}", "ERROR")
+        METRIC_MEDIA_RELOADS.inc("failed")
+        return
+    pending_media = dict(paths, segments=segments, selector=selector, bad=bad, prefetcher=warmer)
+    log(f"Media reload: {len(segments)} segments from {paths['release']} ready, switching when idle")
+    if dispatcher:
+        dispatcher.wake.set()
+
+def start_media_reload():
+    global reload_requested
+    reload_requested = False
+    threading.Thread(target=prepare_media, name="media-reload", daemon=True).start()
+
+def apply_media():
+    """Swap in the prepared media between plays (main loop only)"""
+    global pending_media, MERGED_VIDEO, VIDEO_TIMINGS_FILE, RENDITIONS_FILE, VIDEO_SEGMENTS
+    global media_release, rendition_selector, prefetcher, current_segment
+    new, pending_media = pending_media, None
+    previous = MERGED_VIDEO
+    MERGED_VIDEO, VIDEO_TIMINGS_FILE, RENDITIONS_FILE = new["video"], new["timings"], new["renditions"]
+    VIDEO_SEGMENTS = new["segments"]
+    play_counts.use_timings(VIDEO_TIMINGS_FILE)
+    media_release = new["release"]
+    current_segment = None
+    
+    if rendition_selector:
+        METRIC_RENDITION.remove(rendition_selector.current["name"])
+    rendition_selector = new["selector"]
+    if rendition_selector:
+        METRIC_RENDITION.set(1, rendition_selector.current["name"])
+    bad_segments.clear()
+    bad_segments.update(new["bad"])
+    METRIC_BAD_SEGMENTS.set(len(bad_segments))
+    
+    if prefetcher:
+        prefetcher.stop()
+    prefetcher = new["prefetcher"]
+    if os.path.dirname(previous) == prefetch.TMPFS_DIR and previous != MERGED_VIDEO:
+        try:
+            os.remove(previous)
+        except OSError:
+            pass
+    prefetch_upcoming()
+    
+    # Buttons and triggers pick from the new segment list
+    names = [seg["name"] for seg in VIDEO_SEGMENTS]
+    buttons, errors = input_map.build_buttons(BUTTON_MAP, names, SEGMENT_GROUPS)
+    for error in errors:
+        log(f"Button map: {error}", "WARN")
+    resolved = {button.pin: button for button in buttons}
+    for pin, button in dispatcher.buttons.items():
+        if button.segments is not None:
+            button.segments = resolved[pin].segments if pin in resolved else []
+    if trigger_server:
+        trigger_server.segment_names = names
+    
+    METRIC_MEDIA_RELOADS.inc("ok")
+    log(f"Switched to new media: {MERGED_VIDEO}", segments=len(VIDEO_SEGMENTS))
+
+def find_segment(segment_name):
+    """Segment dict by name, or None"""
+    for seg in VIDEO_SEGMENTS:
+        if seg["name"] == segment_name:
+            return seg
+    return None
+
 def play_video_segment(segment_name):
     """Play a specific segment from the merged video"""
-    global current_video_process, current_segment, video_playing
-    # Prevent starting if already playing
-    if video_playing:
-        return None
+    global current_video_process, current_segment, press_time, player_remote, player_stats
+    global stats_baseline, player_log, segment_started_at
     if not os.path.exists(MERGED_VIDEO):
-        print(f"Merged video not found: {MERGED_VIDEO}")
+        log(f"Merged video not found: {MERGED_VIDEO}", "WARN")
         return None
 
     # Find the segment
-    segment = None
-    for seg in VIDEO_SEGMENTS:
-        if seg["name"] == segment_name:
-            segment = seg
-            break
+    segment = find_segment(segment_name)
     
     if not segment:
-        print(f"Segment not found: {segment_name}")
+        log(f"Segment not found: {segment_name}", "WARN")
         return None
     
     current_segment = segment
@@ -146,7 +589,10 @@ def play_video_segment(segment_name):
     duration = segment["duration"]
     stop_time = start_time + duration
     
-    print(f"Playing: {segment_name} from {start_time}s for {duration}s")
+    log("Playing segment", segment=segment_name, start=start_time, duration=duration)
+    
+    if prefetcher:
+        prefetcher.record_play(segment_name)
     
     # Kill any existing video process
     # if current_video_process:
@@ -162,6 +608,15 @@ def play_video_segment(segment_name):
     
     audio_device = get_audio_device()
     
+    # The control socket serves frame counters and, for the switch policy, seeks.
+    # Switching needs no fixed stop time; the end-of-segment timer stops the player
+    player_control.remove_stale_socket(PLAYER_CONTROL_SOCKET)
+    control_args = player_control.control_args(PLAYER_CONTROL_SOCKET)
+    if PLAYBACK_POLICY == playback_state.POLICY_SWITCH or CONTINUOUS_PLAY:
+        stop_args = []
+    else:
+        stop_args = [f"--stop-time={stop_time}"]
+    
     current_video_process = subprocess.Popen([
         "cvlc", 
         "--fullscreen", 
@@ -176,17 +631,30 @@ def play_video_segment(segment_name):
         "--audio-desync=0",  # Fix audio sync
         "--no-audio-time-stretch",  # Prevent audio stretching
         f"--start-time={start_time}",
-        f"--stop-time={stop_time}",
+    ] + stop_args + [
         "--intf", "dummy",  # No interface
-        "--extraintf", "",  # No extra interfaces
+    ] + control_args + [
         "--no-interact",  # No interaction
         #"--no-keyboard",  # No keyboard shortcuts
         "--no-mouse-events",  # No mouse events
+    ] + (["--verbose=1"] if PLAYER_LOG_STATS else []) + player_tuning_args + [
         MERGED_VIDEO
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, 
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE if PLAYER_LOG_STATS else subprocess.DEVNULL, env=env,
        stdin=subprocess.DEVNULL)  # Close stdin to prevent input
     
-    video_playing = True
+    METRIC_PLAYER_STARTS.inc("video")
+    METRIC_PLAYS.inc(segment_name)
+    play_counts.record(segment_name)
+    if press_time is not None:
+        METRIC_PRESS_TO_SPAWN.observe(time.time() - press_time)
+        press_time = None
+    
+    if player_remote:
+        player_remote.close()
+    player_remote = player_control.VlcRemote(PLAYER_CONTROL_SOCKET)
+    player_stats = stats_baseline = None
+    player_log = player_control.PlayerLogCounter(current_video_process.stderr) if PLAYER_LOG_STATS else None
+    segment_started_at = time.time()
     return current_video_process
 
 def show_black_screen():
@@ -200,6 +668,10 @@ def show_black_screen():
     
     last_black_screen_attempt = current_time
     
+    # Keep using a black screen that is still running
+    if black_screen_process and black_screen_process.poll() is None:
+        return black_screen_process
+    
     # Kill any existing black screen process
     # if black_screen_process:
     #     try:
@@ -210,12 +682,12 @@ def show_black_screen():
     #     black_screen_process = None
     
     if not os.path.exists(BLACK_SCREEN_VIDEO):
-        print(f"Black screen video not found: {BLACK_SCREEN_VIDEO}")
+        log(f"Black screen video not found: {BLACK_SCREEN_VIDEO}", "WARN")
         black_screen_failed = True
         return None
     
     if not black_screen_failed:
-        print("Starting black screen")
+        log("Starting black screen")
         
         env = os.environ.copy()
         env['DISPLAY'] = ':0'
@@ -238,90 +710,239 @@ def show_black_screen():
             BLACK_SCREEN_VIDEO
         ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env,
            stdin=subprocess.DEVNULL)
+        METRIC_PLAYER_STARTS.inc("black")
         
         # Check if it started successfully
         time.sleep(1)
         if black_screen_process.poll() is not None:
-            print("Black screen failed")
+            log("Black screen failed", "ERROR")
             black_screen_failed = True
             black_screen_process = None
     
     return black_screen_process
 
-def switch_to_random_video():
-    """Switch to a random video - only if no video is currently playing"""
-    global current_segment, black_screen_process, video_playing, current_timer
-    
-    # Don't switch if a video is already playing
-    if video_playing or current_timer is not None:
-        print("Video already playing, ignoring button press")
+def pick_random_segment(candidates=None):
+    """Random segment (from `candidates` names if given), avoiding the one currently playing"""
+    available_videos = [seg for seg in VIDEO_SEGMENTS if seg["name"] not in bad_segments]
+    if candidates is not None:
+        available_videos = [seg for seg in available_videos if seg["name"] in candidates]
+    if current_segment and len(available_videos) > 1:
+        available_videos = [seg for seg in available_videos if seg["name"] != current_segment["name"]]
+    if not available_videos:
+        return None
+    random.shuffle(available_videos)
+    return available_videos[0]  # Select the first one after shuffling
+
+def start_segment_timer(segment, generation, ends_at=None):
+    """Schedule the end of a segment (in continuous play, the move to the next one)
+
+    `ends_at` keeps chained segments on the player's timeline, so the time
+    spent handling each transition doesn't add up.
+    """
+    global current_timer, chain_timer, segment_ends_at
+    cancel_current_timer()
+    delay = segment['duration'] if ends_at is None else max(0, ends_at - time.time())
+    if CONTINUOUS_PLAY:
+        if segment['start'] + segment['duration'] >= max(seg['start'] + seg['duration'] for seg in VIDEO_SEGMENTS) - 0.05:
+            delay = max(0, delay - CHAIN_END_MARGIN)
+        chain_timer = threading.Timer(max(0, delay - CHAIN_PREPARE_AHEAD), prepare_chain, args=(generation,))
+        chain_timer.daemon = True
+        chain_timer.start()
+    segment_ends_at = time.time() + delay
+    current_timer = threading.Timer(delay, chain_to_next if CONTINUOUS_PLAY else return_to_idle,
+                                    args=(generation,))
+    current_timer.daemon = True
+    current_timer.start()
+
+def start_playback(segment, generation):
+    """Start a player for a segment the state machine accepted"""
+    log(f"Switching to: {segment['name']}")
+    if play_video_segment(segment['name']) is None:
+        playback.start_failed(generation)
+        return False
+    playback.started(generation)
+    start_segment_timer(segment, generation)
+    return True
+
+def enter_segment(segment, generation, ends_at=None):
+    """Bookkeeping when the running player moves on to another segment (switch or continuous play)"""
+    global current_segment, segment_started_at
+    record_play_stats(current_segment["name"] if current_segment else None)
+    current_segment = segment
+    segment_started_at = time.time()
+    METRIC_PLAYS.inc(segment["name"])
+    play_counts.record(segment["name"])
+    if prefetcher:
+        prefetcher.record_play(segment["name"])
+    start_segment_timer(segment, generation, ends_at)
+
+def switch_playing_segment(segment, generation):
+    """Seek the running player to another segment (switch policy), no new process"""
+    global ending_since
+    log(f"Seeking running player to: {segment['name']}")
+    if player_remote and player_remote.seek(segment["start"]):
+        enter_segment(segment, generation)
+        return True
+
+    # Player can't be controlled: end it and start the segment once it has exited
+    log("Player control unavailable, queueing segment instead", "WARN")
+    if playback.end(generation):
+        ending_since = time.time()
+        playback.queue(segment["name"])
+        stop_video_player()
+    return False
+
+def next_chained_segment():
+    """Segment to follow the current one in continuous play"""
+    if CHAIN_ORDER == "sequence" and current_segment:
+        names = [seg["name"] for seg in VIDEO_SEGMENTS]
+        if current_segment["name"] in names:
+            index = names.index(current_segment["name"])
+            for seg in VIDEO_SEGMENTS[index + 1:] + VIDEO_SEGMENTS[:index + 1]:
+                if seg["name"] not in bad_segments:
+                    return seg
+    return pick_random_segment()
+
+def prepare_chain(generation):
+    """Choose the next segment shortly before the current one ends and warm it into the page cache (Timer thread)"""
+    global chain_next
+    if not system_running or generation != playback.generation:
         return
-    
-    # Stop black screen
-    # if black_screen_process:
-    #     try:
-    #         black_screen_process.terminate()
-    #         black_screen_process.wait(timeout=1)
-    #     except:
-    #         black_screen_process.kill()
-    #     black_screen_process = None
-    
-    # Cancel any existing timer (double check)
+    queued = playback.queued
+    chain_next = find_segment(queued) if queued else next_chained_segment()
+    if chain_next and prefetcher:
+        prefetcher.schedule([chain_next["name"]])
+
+def measure_chain_gap():
+    """Longest wait between new frames in the first CHAIN_GAP_WINDOW after a transition, or None without counters
+
+    Sampled through the control socket, so it resolves to roughly the time
+    one stats reply takes (a few tens of milliseconds).
+    """
+    remote = player_remote
+    if remote is None:
+        return None
+    started = last_change = time.time()
+    last_count = None
+    longest = 0.0
+    while time.time() - started < CHAIN_GAP_WINDOW:
+        count = remote.stats().get("frames_displayed")
+        if count is None:
+            return None
+        now = time.time()
+        if last_count is not None and count > last_count:
+            longest = max(longest, now - last_change)
+            last_change = now
+        last_count = count
+        time.sleep(0.01)
+    return max(longest, time.time() - last_change)
+
+def chain_to_next(generation):
+    """Continuous play: carry the running player on into the next segment with no black screen (Timer thread)"""
+    global chain_next
+    if not system_running or generation != playback.generation:
+        return
+    following, chain_next = chain_next or next_chained_segment(), None
+    # Media swaps happen between plays, so let the player end; so does a stop or a lost control socket
+    if chain_paused or pending_media or player_remote is None or following is None:
+        return_to_idle(generation)
+        return
+    chained = playback.chain(generation, following["name"])
+    if chained is None:
+        return
+    segment = find_segment(chained[0]) or following
+    previous_end = current_segment["start"] + current_segment["duration"] if current_segment else None
+    if previous_end is not None and abs(segment["start"] - previous_end) <= 0.15:  # Timings are rounded to 0.1 s
+        kind = "continue"  # Next in the file: the player is already there
+        ends_at = segment_ends_at + segment["duration"]
+    else:
+        kind = "seek"
+        ends_at = None  # The player jumps now, so the new segment's time starts now
+        length = max(seg["start"] + seg["duration"] for seg in VIDEO_SEGMENTS)
+        if not player_remote.seek_precise(segment["start"], length):
+            log("Player control lost, ending continuous play", "WARN")
+            return_to_idle(chained[1])
+            return
+    log(f"Chained to: {segment['name']} ({kind})")
+    enter_segment(segment, chained[1], ends_at)
+    gap = measure_chain_gap()
+    if gap is not None:
+        METRIC_CHAIN_GAP.observe(gap, kind)
+        log("Chain transition", segment=segment["name"], kind=kind, gap_ms=round(gap * 1000))
+
+def start_continuous_play():
+    """Start (or restart after the player exited) the attract loop from the main loop"""
+    global chain_restart_at
+    if time.time() < chain_restart_at:
+        return
+    chain_restart_at = time.time() + CHAIN_RETRY
+    log("Starting continuous play")
+    request_segment(next_chained_segment())
+
+def request_segment(segment):
+    """Single entry point for play requests; applies the playback policy"""
+    if segment is None:
+        return playback_state.IGNORED
+
+    result, generation = playback.request(segment["name"])
+    if result == playback_state.START:
+        start_playback(segment, generation)
+    elif result == playback_state.SWITCH:
+        switch_playing_segment(segment, generation)
+    elif result == playback_state.QUEUED:
+        log(f"Queued: {segment['name']}")
+    else:
+        log("Video already playing, ignoring button press")
+    return result
+
+def switch_to_random_video(candidates=None):
+    """Request a random segment; what happens during playback depends on PLAYBACK_POLICY"""
+    return request_segment(pick_random_segment(candidates))
+
+def stop_video_player():
+    """Stop the running video player; check_processes() notices the exit"""
+    global player_remote
+    if player_remote:
+        player_remote.quit()
+        player_remote = None
+    if current_video_process and current_video_process.poll() is None:
+        try:
+            current_video_process.terminate()
+        except OSError:
+            pass
+
+def stop_to_idle():
+    """End the current segment, drop any queued one and go back to idle"""
+    global ending_since, chain_paused
+    chain_paused = CONTINUOUS_PLAY
+    playback.queue(None)
+    if not playback.end(playback.generation):
+        return playback_state.IGNORED
+    ending_since = time.time()
     cancel_current_timer()
-    # Select random video (avoid repeating same video)
-    available_videos = VIDEO_SEGMENTS.copy()
-    if current_segment:
-        available_videos = [seg for seg in available_videos if seg["name"] != current_segment["name"]]
-    
-    if available_videos:
-        #selected_segment = random.choice(available_videos)
-        random.shuffle(available_videos)
-        selected_segment = available_videos[0] # Select the first one after shuffling
-        print(f"Switching to: {selected_segment['name']}")
-        
-        # Play the selected segment
-        play_video_segment(selected_segment['name'])
-        
-        # Set up timer to return to idle after video ends
-        # timer = threading.Timer(selected_segment['duration'], return_to_idle)
-        # timer.daemon = True
-        # timer.start()
-        current_timer = threading.Timer(selected_segment['duration'], return_to_idle)
-        current_timer.daemon = True
-        current_timer.start()
-
-def return_to_idle():
-    """Return to idle state after video ends"""
-    global current_video_process, current_segment, video_playing,current_timer
-    # Clear the timer reference since it's completed
-    current_timer = None
-    
-    # Only proceed if we're actually playing a video
-    if not video_playing or not system_running:
+    log("Stopping to idle")
+    stop_video_player()
+    return "stopped"
+
+def return_to_idle(generation):
+    """Segment time is up (runs on the Timer thread)"""
+    global current_timer, ending_since
+    # Only the timer of the current play may end it
+    if not system_running or not playback.end(generation):
         return
-    print("Video finished")
-    
-    # # Stop current video
-    # if current_video_process:
-    #     try:
-    #         current_video_process.terminate()
-    #         current_video_process.wait(timeout=1)
-    #     except:
-    #         current_video_process.kill()
-    #     current_video_process = None
-    
-    current_segment = None
-    video_playing = False
-    
-    # Only show black screen if it's working
-    if not black_screen_failed:
-        show_black_screen()
+    current_timer = None
+    ending_since = time.time()
+    log("Video finished")
+
+    # Without a stop time the player would run on into the next segment
+    if PLAYBACK_POLICY == playback_state.POLICY_SWITCH or CONTINUOUS_PLAY:
+        stop_video_player()
 
 def cleanup_all():
     """Clean up all processes"""
     global system_running, current_video_process, black_screen_process
     
-    print("Cleaning up all processes...")
+    log("Cleaning up all processes...")
     system_running = False
      # Cancel any running timer
     cancel_current_timer()
@@ -341,103 +962,284 @@ def cleanup_all():
         except:
             black_screen_process.kill()
     
+    # Stop read-ahead and report cache hit rates
+    if prefetcher:
+        prefetcher.stop()
+        prefetcher.report()
+    
+    # Stop the cue mixer
+    if cue_player:
+        cue_player.stop()
+    
     # Final cleanup
     kill_all_vlc()
 
+def setup_cue_player():
+    """Decode boot and press cues into memory and start the cue mixer"""
+    global cue_player
+    
+    if not USE_CUE_PLAYER or audio_cues.alsaaudio is None:
+        log("Cue player disabled, boot sound will use aplay", "WARN")
+        return None
+    
+    if audio_cues.audioop is None:
+        log("audioop unavailable (Python 3.13+), mixing cues in pure Python", "WARN")
+    try:
+        player = audio_cues.CuePlayer(audio_cues.AlsaSink(), log)
+    except Exception as e:
+        log(f"Cue player unavailable: {e}", "WARN")
+        return None
+    
+    player.load("boot", BOOT_SOUND_FILE)
+    player.load("press", PRESS_CUE_FILE)
+    player.start()
+    cue_player = player
+    return cue_player
+
+def play_press_cue():
+    """Audible acknowledgement of a button press (no-op without the cue player)"""
+    if cue_player:
+        cue_player.play("press")
+
 def play_boot_sound():
-    """Play boot sound with aplay (more reliable)"""
+    """Play boot sound through the cue player, falling back to aplay"""
+    if cue_player and cue_player.play("boot"):
+        log("Playing boot sound")
+        return
+    
     if not os.path.exists(BOOT_SOUND_FILE):
-        print(f"Boot sound file not found: {BOOT_SOUND_FILE}")
+        log(f"Boot sound file not found: {BOOT_SOUND_FILE}", "WARN")
         return
     
-    print("Playing boot sound")
+    log("Playing boot sound")
     
     try:
         subprocess.run(['aplay', BOOT_SOUND_FILE], 
                       stdout=subprocess.DEVNULL, 
                       stderr=subprocess.DEVNULL, 
                       check=True)
-        print("Boot sound played successfully")
+        log("Boot sound played successfully")
     except Exception as e:
-        print(f"Boot sound error: {e}")
+        log(f"Boot sound error: {e}", "ERROR")
 
 def check_processes():
-    """Check if processes are still running"""
-    global current_video_process, current_segment, video_playing
-    
+    """Check if processes are still running, and move to the next state when the player exits"""
+    global current_video_process, current_segment, ending_since
+
+    if current_video_process and current_video_process.poll() is None:
+        # Player outlived its segment by too long: stop it
+        if (playback.state == playback_state.ENDING and ending_since is not None and
+                time.time() - ending_since > ENDING_GRACE):
+            log("Player still running after segment end, stopping it", "WARN")
+            stop_video_player()
+        return
+
     # Check if video process finished
-    if current_video_process and current_video_process.poll() is not None:
-        print("Video process finished")
+    if current_video_process:
+        log("Video process finished")
         current_video_process = None
-        current_segment = None
-        video_playing = False
-        # Cancel the timer since the video finished early
+        # Player exited before its timer (early end or crash)
+        playback.end(playback.generation)
         cancel_current_timer()
+        ending_since = None
+        record_play_stats(current_segment["name"] if current_segment else None)
+        prefetch_upcoming()
+
+        # Play a queued segment straight away, otherwise go back to idle
+        next_name = playback.finish()
+        if next_name:
+            segment = find_segment(next_name)
+            if segment and start_playback(segment, playback.generation):
+                return
+            playback.start_failed(playback.generation)
+
+        current_segment = None
         time.sleep(0.1)
         # Only restart black screen if it's not failing
-        if not black_screen_failed and not video_playing:
+        if not black_screen_failed and not playback.busy:
             show_black_screen()
 
+def setup_gpio():
+    """Configure button pins from BUTTON_MAP and register their edge callbacks"""
+    global dispatcher
+    GPIO.setmode(GPIO.BCM)
+    buttons, errors = input_map.build_buttons(BUTTON_MAP, [seg["name"] for seg in VIDEO_SEGMENTS], SEGMENT_GROUPS)
+    for error in errors:
+        log(f"Button map: {error}", "WARN")
+    
+    dispatcher = input_map.InputDispatcher(GPIO, clock=time.time)
+    for button in buttons:
+        dispatcher.add(button)
+        log(f"Button GPIO {button.pin}: {button.action}")
+    return dispatcher
+
+def handle_press(button, pressed_at):
+    """Act on one queued button edge"""
+    global press_time, chain_paused
+    current_time = time.time()
+    METRIC_PRESS_LATENCY.observe(current_time - pressed_at, button.name)
+    
+    if button.action == input_map.SHUTDOWN:
+        log("Shutdown button pressed, hold to shut down...")
+        shutdown_armed[button.pin] = pressed_at
+        return
+    
+    if button.action == input_map.STOP:
+        METRIC_PRESSES.inc((button.name, stop_to_idle()))
+        return
+    
+    if button.debounce and pressed_at - button.last_press <= PRESS_DEBOUNCE:
+        METRIC_PRESSES.inc((button.name, "debounced"))
+        return
+    button.last_press = pressed_at
+    press_time = pressed_at
+    chain_paused = False  # A press resumes continuous play after a stop
+    if button.pin is None:
+        log(f"Trigger via {button.name} - {button.action}")
+    else:
+        log(f"Button GPIO {button.pin} pressed - {button.action}")
+    result = switch_to_random_video(button.segments)
+    if result != playback_state.IGNORED and button.pin is not None:
+        play_press_cue()
+    METRIC_PRESSES.inc((button.name, result))
+
+def setup_triggers():
+    """Start the UDP/HTTP trigger API; its triggers go through the same dispatcher as the buttons"""
+    global trigger_server
+    if not TRIGGER_TOKEN:
+        return None
+    try:
+        trigger_server = trigger_api.TriggerServer(
+            dispatcher, TRIGGER_TOKEN, [seg["name"] for seg in VIDEO_SEGMENTS], host=TRIGGER_BIND,
+            udp_port=TRIGGER_UDP_PORT, http_port=TRIGGER_HTTP_PORT, log=log).start()
+    except OSError as e:
+        log(f"Trigger API unavailable: {e}", "WARN")
+        trigger_server = None
+    return trigger_server
+
+def update_playing_flag():
+    """Tell background merges (encode_budget.py) whether a segment is playing"""
+    global playing_flag
+    if playback.busy != playing_flag:
+        playing_flag = playback.busy
+        encode_budget.set_playing_flag(playing_flag, PLAYING_FLAG_FILE)
+
+def check_shutdown_hold():
+    """Shut down once a shutdown button has been held for SHUTDOWN_HOLD seconds"""
+    for pin, pressed_at in list(shutdown_armed.items()):
+        if time.time() - pressed_at < SHUTDOWN_HOLD:
+            continue
+        del shutdown_armed[pin]
+        if dispatcher.is_pressed(pin):
+            log("Shutdown button held. Shutting down...")
+            cleanup_all()
+            os.system("sudo shutdown -h now")
+
 # === Main Loop ===
-try:
-    # Set display environment
-    os.environ['DISPLAY'] = ':0'
+def main():
+    global loop_monitor
+    setup_gpio()
+    logger.install_crash_dump()
+    signal.signal(signal.SIGHUP, request_media_reload)
+    try:
+        with open(APP_PID_FILE, "w") as f:
+            f.write(f"{os.getpid()}\n")
+    except OSError as e:
+        log(f"Could not write {APP_PID_FILE}: {e}", "WARN")
+    try:
+        # Set display environment
+        os.environ['DISPLAY'] = ':0'
     
-    # Kill any existing VLC processes
-    kill_all_vlc()
+        # Kill any existing VLC processes
+        kill_all_vlc()
     
-    # Play boot sound
-    play_boot_sound()
-    time.sleep(2)
+        # Pick a rendition, then check it while the boot sound plays
+        setup_player_tuning()
+        setup_rendition()
+        verify_thread = start_verification()
     
-    # Try to start with black screen
-    show_black_screen()
+        # Play boot sound
+        setup_cue_player()
+        play_boot_sound()
+        time.sleep(2)
     
-    print("System ready. Press button to switch videos...")
+        # Try to start with black screen
+        show_black_screen()
     
-    button_last_state = GPIO.HIGH
-    last_button_time = 0
-    debounce_delay = 2  # Increased debounce delay
-    last_process_check = 0
+        # Give the check a bounded time to finish before accepting presses
+        if verify_thread:
+            verify_thread.join(VERIFY_BOOT_WAIT)
+            if verify_thread.is_alive():
+                log("Verification still running, continuing boot", "WARN")
+    
+        # Start warming segments into the page cache
+        setup_prefetch()
+    
+        # Start exporting metrics
+        setup_metrics()
+    
+        # Accept triggers from the show controller
+        setup_triggers()
+    
+        # Watch dropped frames of each play
+        start_stats_sampler()
+    
+        log("System ready. Press button to switch videos...")
+        loop_health.sd_notify("READY=1")
+    
+        last_process_check = 0
+        loop_monitor = loop_health.LoopMonitor(LOOP_STALL_THRESHOLD, METRIC_TICK, METRIC_STALLS, log)
+        loop_monitor.start(watch=LOOP_STALL_DETECTION)
 
-    while system_running:
-        current_time = time.time()
-        
-        # Handle Shutdown Button
-        if GPIO.input(SHUTDOWN_GPIO) == GPIO.LOW:
-            print("Shutdown button pressed. Shutting down...")
-            time.sleep(2)
-            if GPIO.input(SHUTDOWN_GPIO) == GPIO.LOW:
-                cleanup_all()
-                os.system("sudo shutdown -h now")
-
-        # Handle Video Button with debouncing - only when no video is playing
-        button_current_state = GPIO.input(BUTTON_GPIO)
+        while system_running:
+            current_time = time.time()
+            loop_monitor.tick()
         
-        if (button_current_state == GPIO.LOW and 
-            button_last_state == GPIO.HIGH and 
-            current_time - last_button_time > debounce_delay and
-            not video_playing):  # Only allow when no video is playing
-            
-            last_button_time = current_time
-            print("Button pressed - switching to random video")
-            switch_to_random_video()
+            # Handle button edges queued by the GPIO callback; PLAYBACK_POLICY decides what a press during playback does
+            dispatcher.dispatch(handle_press)
+            if shutdown_armed:
+                check_shutdown_hold()
         
-        button_last_state = button_current_state
+            # New media from watch_rebuild.py: prepare in the background, swap between plays
+            if reload_requested:
+                start_media_reload()
+            if pending_media and not playback.busy:
+                apply_media()
+            if CONTINUOUS_PLAY and not playback.busy and not chain_paused and not pending_media:
+                start_continuous_play()
         
-        # Check process status (rate limited)
-        if current_time - last_process_check > 1.0:
-            check_processes()
-            last_process_check = current_time
-        if int(current_time) % 60 == 0:  # Every 1 minute
-                reset_audio_system()
+            # Check process status (rate limited)
+            if current_time - last_process_check > 1.0:
+                check_processes()
+                play_counts.save_if_due()
+                last_process_check = current_time
+            update_playing_flag()
+            if int(current_time) % 60 == 0:  # Every 1 minute
+                    reset_audio_system()
         
-        time.sleep(0.05)
+            dispatcher.wait(0.05)  # Woken early by a button edge
 
-except KeyboardInterrupt:
-    print("Exiting program...")
+    except KeyboardInterrupt:
+        log("Exiting program...")
+
+    finally:
+        loop_health.sd_notify("STOPPING=1")
+        if loop_monitor:
+            loop_monitor.stop()
+        cleanup_all()
+        play_counts.save()
+        if trigger_server:
+            trigger_server.stop()
+        if dispatcher:
+            dispatcher.close()
+        GPIO.cleanup()
+        encode_budget.set_playing_flag(False, PLAYING_FLAG_FILE)
+        try:
+            os.remove(APP_PID_FILE)
+        except OSError:
+            pass
+        log("Cleanup complete!")
+        logger.close()
 
-finally:
-    cleanup_all()
-    GPIO.cleanup()
-    print("Cleanup complete!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import os
+import sys
+import subprocess
+import threading
+import time
+import wave
+import warnings
+import argparse
+from array import array
+
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop  # PCM mixing / format conversion in C (removed in Python 3.13)
+except ImportError:
+    audioop = None  # Mixed with array below; WAV cues are converted by ffmpeg
+
+try:
+    import alsaaudio  # python3-alsaaudio, optional
+except ImportError:
+    alsaaudio = None
+
+# === Configuration ===
+SAMPLE_RATE = 48000
+CHANNELS = 2
+SAMPLE_WIDTH = 2  # Signed 16-bit little endian
+PERIOD_FRAMES = 256  # ~5.3 ms per mixer period at 48 kHz
+ALSA_PERIODS = 2  # Keep the device buffer at two periods
+ALSA_DEVICE = "default"  # Shared device so cvlc can still open audio
+
+
+def _samples(pcm):
+    samples = array("h", pcm)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def _pcm(samples):
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def mul(pcm, gain):
+    """S16LE samples scaled by gain, clipped (audioop.mul when available)"""
+    if audioop:
+        return audioop.mul(pcm, SAMPLE_WIDTH, gain)
+    return _pcm(array("h", (max(-32768, min(32767, int(x * gain))) for x in _samples(pcm))))
+
+
+def add(a, b):
+    """Sum of two equal-length S16LE buffers, clipped (audioop.add when available)"""
+    if audioop:
+        return audioop.add(a, b, SAMPLE_WIDTH)
+    return _pcm(array("h", (max(-32768, min(32767, x + y)) for x, y in zip(_samples(a), _samples(b)))))
+
+
+def decode_cue(path, rate=SAMPLE_RATE, channels=CHANNELS, log=print):
+    """Decode a sound file to raw PCM in the mixer format (S16LE, rate, channels)"""
+    if path.lower().endswith(".wav") and audioop:
+        try:
+            with wave.open(path, "rb") as wav:
+                pcm = wav.readframes(wav.getnframes())
+                width = wav.getsampwidth()
+                src_channels = wav.getnchannels()
+                src_rate = wav.getframerate()
+
+            # Convert in-process, no subprocess needed for plain WAV files
+            if width != SAMPLE_WIDTH:
+                if width == 1:
+                    pcm = audioop.bias(pcm, 1, -128)  # WAV 8-bit is unsigned
+                pcm = audioop.lin2lin(pcm, width, SAMPLE_WIDTH)
+            if src_channels == 2 and channels == 1:
+                pcm = audioop.tomono(pcm, SAMPLE_WIDTH, 0.5, 0.5)
+            elif src_channels == 1 and channels == 2:
+                pcm = audioop.tostereo(pcm, SAMPLE_WIDTH, 1, 1)
+            elif src_channels != channels:
+                raise ValueError(f"unsupported channel count {src_channels}")
+            if src_rate != rate:
+                pcm, _ = audioop.ratecv(pcm, SAMPLE_WIDTH, channels, src_rate, rate, None)
+            return pcm
+        except (wave.Error, ValueError) as e:
+            log(f"WAV decode failed for {path} ({e}), trying ffmpeg", "WARN")
+
+    # Anything else (mp3, compressed wav...) is decoded once with ffmpeg
+    result = subprocess.run([
+        "ffmpeg", "-v", "quiet", "-i", path,
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ar", str(rate), "-ac", str(channels), "-"
+    ], capture_output=True, check=True)
+    return result.stdout
+
+
+class NullSink:
+    """Discards audio but keeps real-time pacing, like a sound card would"""
+
+    def __init__(self, rate=SAMPLE_RATE, channels=CHANNELS, period_frames=PERIOD_FRAMES, realtime=True):
+        self.rate = rate
+        self.channels = channels
+        self.period_frames = period_frames
+        self.realtime = realtime
+        self.frames_written = 0
+        self._next_deadline = None
+
+    def write(self, data):
+        frames = len(data) // (SAMPLE_WIDTH * self.channels)
+        self.frames_written += frames
+        if self.realtime:
+            now = time.monotonic()
+            if self._next_deadline is None or self._next_deadline < now:
+                self._next_deadline = now
+            self._next_deadline += frames / self.rate
+            delay = self._next_deadline - now - self.period_frames / self.rate
+            if delay > 0:
+                time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class FileSink(NullSink):
+    """Writes the mixed output to a WAV file (for checking cues off-device)"""
+
+    def __init__(self, path, rate=SAMPLE_RATE, channels=CHANNELS, period_frames=PERIOD_FRAMES, realtime=False):
+        super().__init__(rate, channels, period_frames, realtime)
+        self.wav = wave.open(path, "wb")
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(SAMPLE_WIDTH)
+        self.wav.setframerate(rate)
+
+    def write(self, data):
+        self.wav.writeframesraw(data)
+        super().write(data)
+
+    def close(self):
+        self.wav.close()
+
+
+class AlsaSink:
+    """Writes to an ALSA PCM device with a small fixed buffer"""
+
+    def __init__(self, device=ALSA_DEVICE, rate=SAMPLE_RATE, channels=CHANNELS, period_frames=PERIOD_FRAMES):
+        if alsaaudio is None:
+            raise RuntimeError("alsaaudio not installed (sudo apt install python3-alsaaudio)")
+        self.rate = rate
+        self.channels = channels
+        self.period_frames = period_frames
+        self.pcm = alsaaudio.PCM(
+            alsaaudio.PCM_PLAYBACK,
+            device=device,
+            rate=rate,
+            channels=channels,
+            format=alsaaudio.PCM_FORMAT_S16_LE,
+            periodsize=period_frames,
+            periods=ALSA_PERIODS,
+        )
+
+    def write(self, data):
+        self.pcm.write(data)
+
+    def close(self):
+        self.pcm.close()
+
+
+class CuePlayer:
+    """Mixes preloaded PCM cues to a sink from one background thread"""
+
+    def __init__(self, sink, log=print):
+        self.sink = sink
+        self.log = log
+        self.period_bytes = sink.period_frames * sink.channels * SAMPLE_WIDTH
+        self.silence = bytes(self.period_bytes)
+        self.cues = {}
+        self.voices = []  # [name, pcm, offset, gain, requested_at]
+        self.lock = threading.Lock()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.running = False
+        self.thread = None
+        self.last_start_latency = None
+
+    def load(self, name, path):
+        """Decode a cue file into memory, returns True on success"""
+        if not os.path.exists(path):
+            self.log(f"Cue file not found: {path}", "WARN")
+            return False
+        try:
+            pcm = decode_cue(path, self.sink.rate, self.sink.channels, self.log)
+        except Exception as e:
+            self.log(f"Could not decode cue {path}: {e}", "WARN")
+            return False
+        self.cues[name] = pcm
+        seconds = len(pcm) / (self.sink.rate * self.sink.channels * SAMPLE_WIDTH)
+        self.log(f"Loaded cue '{name}': {seconds:.2f}s")
+        return True
+
+    def start(self):
+        """Start the mixer thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._mix_loop, name="cue-mixer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the mixer thread and close the sink"""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1)
+            self.thread = None
+        self.sink.close()
+
+    def play(self, name, gain=1.0):
+        """Queue a cue for playback, returns immediately"""
+        pcm = self.cues.get(name)
+        if pcm is None:
+            return False
+        with self.lock:
+            self.voices.append([name, pcm, 0, gain, time.monotonic()])
+            self.idle.clear()
+        return True
+
+    def wait(self, timeout=None):
+        """Block until all queued cues finished playing"""
+        return self.idle.wait(timeout)
+
+    def _mix_period(self):
+        """Mix one period of all active voices"""
+        size = self.period_bytes
+        with self.lock:
+            if not self.voices:
+                return self.silence
+            out = None
+            for voice in self.voices:
+                name, pcm, offset, gain, requested_at = voice
+                if offset == 0:
+                    self.last_start_latency = time.monotonic() - requested_at
+                chunk = pcm[offset:offset + size]
+                if len(chunk) < size:
+                    chunk += self.silence[:size - len(chunk)]
+                if gain != 1.0:
+                    chunk = mul(chunk, gain)
+                out = chunk if out is None else add(out, chunk)
+                voice[2] = offset + size
+            self.voices = [v for v in self.voices if v[2] < len(v[1])]
+            if not self.voices:
+                self.idle.set()
+            return out
+
+    def _mix_loop(self):
+        while self.running:
+            try:
+                self.sink.write(self._mix_period())
+            except Exception as e:
+                self.log(f"Cue output error: {e}", "ERROR")
+                time.sleep(0.5)
+
+
+def open_sink(device=ALSA_DEVICE, log=print):
+    """Open the ALSA sink, falling back to a null sink when unavailable"""
+    try:
+        return AlsaSink(device)
+    except Exception as e:
+        log(f"ALSA cue output unavailable ({e}), using null sink", "WARN")
+        return NullSink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play audio cues through the in-process mixer")
+    parser.add_argument("cues", nargs="+", help="Cue files to load and play")
+    parser.add_argument("--sink", choices=["alsa", "null", "file"], default="null", help="Output sink")
+    parser.add_argument("--out", default="cue_output.wav", help="Output WAV for --sink file")
+    parser.add_argument("--interval", type=float, default=0.25, help="Seconds between cue triggers")
+    args = parser.parse_args()
+
+    if args.sink == "alsa":
+        sink = AlsaSink()
+    elif args.sink == "file":
+        sink = FileSink(args.out, realtime=True)
+    else:
+        sink = NullSink()
+
+    player = CuePlayer(sink)
+    names = []
+    for i, path in enumerate(args.cues):
+        if player.load(f"cue{i+1}", path):
+            names.append(f"cue{i+1}")
+    if not names:
+        print("No cues loaded")
+        sys.exit(1)
+
+    player.start()
+    latencies = []
+    for name in names:
+        player.play(name)
+        # Wait for the mixer to pick the cue up before measuring
+        while player.last_start_latency is None:
+            time.sleep(0.001)
+        latencies.append(player.last_start_latency * 1000)
+        player.last_start_latency = None
+        time.sleep(args.interval)
+    player.wait()
+    player.stop()
+
+    period_ms = sink.period_frames / sink.rate * 1000
+    print(f"Period: {sink.period_frames} frames ({period_ms:.1f} ms)")
+    print(f"Cue start latency: avg {sum(latencies)/len(latencies):.2f} ms, max {max(latencies):.2f} ms")
+    if args.sink == "file":
+        print(f"Mixed output written to {args.out}")
+
+if __name__ == "__main__":
+    main()
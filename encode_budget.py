@@ -0,0 +1,311 @@
+import os
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import get_timings
+
+# === Configuration ===
+BACKGROUND_THREADS = 2  # Encoder/filter threads in background mode; the rest of the cores stay with the player
+NICE_LEVEL = 19
+IONICE_CLASS = 3  # 3 = idle: the encode only gets the SD card when nothing else is reading it
+CPU_QUOTA = 1.0  # Cores' worth of CPU for the encode, via a cgroup v2 cpu.max (0 disables)
+CGROUP_DIR = "/sys/fs/cgroup/pi_video_encode"  # Needs root or a delegated cgroup; skipped otherwise
+CGROUP_PERIOD = 100000  # Microseconds
+PAUSE_WHILE_PLAYING = True  # SIGSTOP the encoder while app.py plays a segment
+PLAYING_FLAG = "/dev/shm/pi_video.playing"  # app.py keeps its pid in here while a segment plays
+POLL_INTERVAL = 0.1  # Seconds between checks of the playing flag
+MAX_PAUSE = 120  # Seconds of playback after which the encoder resumes, throttled only (a continuous-play loop never idles)
+
+
+def app_playing(flag=PLAYING_FLAG):
+    """Whether app.py is playing a segment (a flag left by a dead app.py doesn't count)"""
+    try:
+        with open(flag) as f:
+            pid = int(f.read().strip() or 0)
+        if pid:
+            os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True  # Alive, just run by another user (app.py as pi, the merge as root)
+    except (OSError, ValueError):
+        return False
+
+
+def playing_for(flag=PLAYING_FLAG):
+    """Seconds since the playing flag was set (app.py only rewrites it when playback starts)"""
+    try:
+        return max(0.0, time.time() - os.stat(flag).st_mtime)
+    except OSError:
+        return 0.0
+
+
+def set_playing_flag(playing, flag=PLAYING_FLAG):
+    """Create or remove the playing flag (called by app.py)"""
+    try:
+        if playing:
+            tmp = f"{flag}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(f"{os.getpid()}\n")
+            os.replace(tmp, flag)
+        elif os.path.exists(flag):
+            os.remove(flag)
+    except OSError:
+        pass
+
+
+def insert_output_args(cmd, args):
+    """Put output options in an ffmpeg command just before its output file (the last argument)"""
+    return cmd[:-1] + list(args) + cmd[-1:]
+
+
+class EncodeBudget:
+    """CPU, thread and I/O limits for merges running next to playback
+
+    Threads cap ffmpeg's encoder and filter graph; nice and the idle I/O class
+    make the scheduler prefer the player; the cgroup quota bounds the total
+    CPU time whatever the thread count; and with pause_while_playing the
+    encoder is stopped outright while a segment plays, for at most
+    max_pause seconds of continuous playback.
+    """
+
+    def __init__(self, threads=BACKGROUND_THREADS, nice=NICE_LEVEL, ionice_class=IONICE_CLASS, cpu_quota=CPU_QUOTA,
+                 pause_while_playing=PAUSE_WHILE_PLAYING, playing_flag=PLAYING_FLAG, max_pause=MAX_PAUSE, log=print):
+        self.threads = threads
+        self.nice = nice
+        self.ionice_class = ionice_class
+        self.cpu_quota = cpu_quota
+        self.pause_while_playing = pause_while_playing
+        self.playing_flag = playing_flag
+        self.max_pause = max_pause
+        self.log = log
+        self.cgroup = None
+        self.paused_seconds = 0.0
+        self.pauses = 0
+
+    def ffmpeg_args(self):
+        if not self.threads:
+            return []
+        return ["-threads", str(self.threads), "-filter_threads", str(self.threads)]
+
+    def command(self, cmd):
+        """ffmpeg command with the thread cap, wrapped in ionice when available"""
+        cmd = insert_output_args(cmd, self.ffmpeg_args())
+        if self.ionice_class and shutil.which("ionice"):
+            cmd = ["ionice", "-c", str(self.ionice_class)] + cmd
+        return cmd
+
+    def _preexec(self):
+        if self.nice:
+            os.nice(self.nice)
+
+    def setup_cgroup(self):
+        """Create the quota cgroup once; returns its path or None if cgroups can't be used here"""
+        if self.cgroup or not self.cpu_quota:
+            return self.cgroup
+        try:
+            os.makedirs(CGROUP_DIR, exist_ok=True)
+            with open(os.path.join(CGROUP_DIR, "cpu.max"), "w") as f:
+                f.write(f"{int(self.cpu_quota * CGROUP_PERIOD)} {CGROUP_PERIOD}")
+            self.cgroup = CGROUP_DIR
+        except OSError as e:
+            self.log(f"CPU quota unavailable ({e}), using threads and nice only")
+            self.cpu_quota = 0
+        return self.cgroup
+
+    def join_cgroup(self, pid):
+        if self.setup_cgroup():
+            try:
+                with open(os.path.join(self.cgroup, "cgroup.procs"), "w") as f:
+                    f.write(str(pid))
+            except OSError as e:
+                self.log(f"Could not move {pid} into {self.cgroup}: {e}")
+
+    def apply_to_self(self):
+        """Budget this process and its future children (for MoviePy, which runs ffmpeg itself)"""
+        self._preexec()
+        if self.ionice_class and shutil.which("ionice"):
+            subprocess.call(["ionice", "-c", str(self.ionice_class), "-p", str(os.getpid())])
+        self.join_cgroup(os.getpid())
+
+    def _hold_while_playing(self, pids, done):
+        """SIGSTOP `pids()` while app.py plays, SIGCONT once it's idle or has played max_pause; returns when done() is true"""
+        stopped = []
+        overdue = False
+        try:
+            while not done():
+                playing = app_playing(self.playing_flag)
+                if playing and self.max_pause and not overdue and playing_for(self.playing_flag) > self.max_pause:
+                    overdue = True
+                    self.log(f"Playback has run over {self.max_pause}s, encoding throttled instead of paused")
+                if playing and not overdue:
+                    if not stopped:
+                        stopped = pids()
+                        for pid in stopped:
+                            self._signal(pid, signal.SIGSTOP)
+                        paused_at = time.monotonic()
+                        self.pauses += 1
+                elif stopped:
+                    for pid in stopped:
+                        self._signal(pid, signal.SIGCONT)
+                    stopped = []
+                    self.paused_seconds += time.monotonic() - paused_at
+                overdue = overdue and playing
+                time.sleep(POLL_INTERVAL)
+        finally:
+            for pid in stopped:
+                self._signal(pid, signal.SIGCONT)
+            if stopped:
+                self.paused_seconds += time.monotonic() - paused_at
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+    def run(self, cmd, check=True):
+        """subprocess.run(cmd, capture_output=True, text=True) within the budget"""
+        cmd = self.command(cmd)
+        with tempfile.TemporaryFile("w+") as out, tempfile.TemporaryFile("w+") as err:
+            proc = subprocess.Popen(cmd, stdout=out, stderr=err, stdin=subprocess.DEVNULL, preexec_fn=self._preexec)
+            self.join_cgroup(proc.pid)
+            try:
+                if self.pause_while_playing:
+                    self._hold_while_playing(lambda: [proc.pid], lambda: proc.poll() is not None)
+                proc.wait()
+            except BaseException:
+                proc.kill()
+                proc.wait()
+                raise
+            out.seek(0)
+            err.seek(0)
+            result = subprocess.CompletedProcess(cmd, proc.returncode, out.read(), err.read())
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
+        return result
+
+    def hold_children_while_playing(self):
+        """Background thread pausing this process's child processes during playback (MoviePy's ffmpeg)"""
+        stop = threading.Event()
+
+        def children():
+            pids = []
+            for task in os.listdir(f"/proc/{os.getpid()}/task"):
+                try:
+                    with open(f"/proc/{os.getpid()}/task/{task}/children") as f:
+                        pids += [int(pid) for pid in f.read().split()]
+                except OSError:
+                    pass
+            return pids
+
+        thread = threading.Thread(target=self._hold_while_playing, args=(children, stop.is_set),
+                                  name="encode-pause", daemon=True)
+        thread.start()
+        return stop
+
+
+def _player_emulation(video_path, seconds, tolerance, rate=1.0, flag=None):
+    """Decode like a player: paced at `rate` x real time, counting frames that miss their display time
+
+    ffmpeg reads at a fixed rate (-readrate) and reports its frame count ten
+    times a second; a frame is late (a player would drop it) if it was decoded
+    more than `tolerance` seconds after it was due.
+    """
+    probe = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries",
+                            "stream=avg_frame_rate,r_frame_rate", "-of", "json", video_path],
+                           capture_output=True, text=True)
+    streams = json.loads(probe.stdout or "{}").get("streams") or [{}]
+    fps = (get_timings.stream_fps(streams[0]) or 25) * rate
+    if flag:
+        set_playing_flag(True, flag)
+    proc = subprocess.Popen(["ffmpeg", "-v", "error", "-nostdin", "-readrate", str(rate), "-stream_loop", "-1",
+                             "-t", str(seconds * rate), "-i", video_path, "-an", "-f", "null", "-",
+                             "-progress", "pipe:1", "-stats_period", "0.1"], stdout=subprocess.PIPE, text=True)
+    started = time.monotonic()
+    decoded = 0
+    late = 0
+    try:
+        for line in proc.stdout:
+            if not line.startswith("frame="):
+                continue
+            now = time.monotonic() - started
+            frames = int(line.split("=")[1])
+            for i in range(decoded, frames):
+                if now - i / fps > tolerance:
+                    late += 1
+            decoded = max(decoded, frames)
+        proc.wait()
+    finally:
+        if flag:
+            set_playing_flag(False, flag)
+    return decoded, late
+
+
+def benchmark(video_path, seconds=20, tolerance=0.25, headroom=1.5):
+    """Late frames of an emulated player while a merge-sized encode runs: unbudgeted, budget, budget + pause
+
+    The player is paced so that decoding needs 1/headroom of this machine's
+    CPU, like a Pi playing the rendition renditions.py picks for it (a fast
+    desktop would otherwise never drop a frame).
+    """
+    import renditions
+    speed = renditions.decode_speed(video_path, 0, min(seconds, 10))
+    rate = max(1.0, speed / headroom)
+    encode = ["ffmpeg", "-y", "-v", "error", "-stream_loop", "-1", "-i", video_path, "-t", "3600",
+              "-c:v", "libx264", "-preset", "medium", "-c:a", "aac", "-f", "mp4", os.devnull]
+    flag = os.path.join(tempfile.gettempdir(), "encode_budget_bench.playing")
+    modes = [
+        ("no encode", None),
+        ("unbudgeted", EncodeBudget(threads=0, nice=0, ionice_class=0, cpu_quota=0, pause_while_playing=False)),
+        ("budget", EncodeBudget(pause_while_playing=False)),
+        ("budget+pause", EncodeBudget(pause_while_playing=True, playing_flag=flag)),
+    ]
+    print(f"{video_path}: decodes at {speed:.1f}x real time on {os.cpu_count()} CPUs; "
+          f"playing {seconds}s at {rate:.1f}x so decoding needs 1/{headroom} of the CPU")
+    print(f"Late = decoded more than {tolerance}s after due")
+    for name, budget in modes:
+        done = threading.Event()
+        encoder = None
+        if budget:
+            encoder = threading.Thread(target=_run_until, args=(budget, encode, done), daemon=True)
+            encoder.start()
+            time.sleep(2)  # Let the encode get going first
+        decoded, late = _player_emulation(video_path, seconds, tolerance, rate,
+                                          flag if budget and budget.pause_while_playing else None)
+        done.set()
+        if encoder:
+            encoder.join()
+        paused = f", encoder paused {budget.pauses}x for {budget.paused_seconds:.1f}s" if budget and budget.pauses else ""
+        print(f"  {name:<14} {decoded:>6} frames  {late:>6} late ({late / max(decoded, 1):6.1%}){paused}")
+
+
+def _run_until(budget, cmd, done):
+    """Run an encode within the budget until `done` is set"""
+    cmd = budget.command(cmd)
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, preexec_fn=budget._preexec)
+    budget.join_cgroup(proc.pid)
+    if budget.pause_while_playing:
+        budget._hold_while_playing(lambda: [proc.pid], lambda: done.is_set() or proc.poll() is not None)
+    done.wait()
+    proc.kill()
+    proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure playback damage from a concurrent encode, with and without the budget")
+    parser.add_argument("video", help="Video to play (and re-encode) during the benchmark")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Seconds late before a frame counts as dropped")
+    parser.add_argument("--headroom", type=float, default=1.5, help="Decode speed margin of the emulated player")
+    args = parser.parse_args()
+    benchmark(args.video, args.seconds, args.tolerance, args.headroom)
+
+if __name__ == "__main__":
+    main()
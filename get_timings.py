@@ -1,13 +1,26 @@
 import subprocess
 import os
+import re
+import json
+import time
+import shutil
+import fnmatch
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # === Configuration ===
 VIDEO_FOLDER = "/home/pi-five/pi_video"
 VIDEO_FILES = [
     "video1.mp4",
-    "video2.mp4", 
+    "video2.mp4",
     "video3.mp4"
 ]
+AUTO_DISCOVER = True  # Scan VIDEO_FOLDER (recursively) instead of using VIDEO_FILES
+INCLUDE_PATTERNS = ["*.mp4", "*.m4v", "*.mov", "*.mkv", "*.avi", "*.webm"]
+EXCLUDE_PATTERNS = ["merged_videos*", "black*", "._*", "*.tmp", "releases/*"]  # Outputs and helper clips aren't segments
+PROBE_WORKERS = min(8, (os.cpu_count() or 1) * 2)  # Concurrent ffprobe processes
+MAX_FPS = 120  # Frame rates above this are container timebase artefacts, not real rates
 
 def get_video_duration(video_path):
     """Get duration of a video file in seconds"""
@@ -16,7 +29,7 @@ def get_video_duration(video_path):
             "ffprobe", "-v", "quiet", "-show_entries", "format=duration",
             "-of", "default=noprint_wrappers=1:nokey=1", video_path
         ], capture_output=True, text=True, check=True)
-        
+
         duration = float(result.stdout.strip())
         return duration
     except Exception as e:
@@ -27,69 +40,234 @@ def get_video_resolution(video_path):
     """Get video resolution"""
     try:
         result = subprocess.run([
-            "ffprobe", "-v", "quiet", "-select_streams", "v:0", 
+            "ffprobe", "-v", "quiet", "-select_streams", "v:0",
             "-show_entries", "stream=width,height",
             "-of", "csv=s=x:p=0", video_path
         ], capture_output=True, text=True, check=True)
-        
+
         return result.stdout.strip()
     except Exception as e:
         print(f"Error getting resolution for {video_path}: {e}")
         return "unknown"
 
+def _rate(value):
+    num, _, den = (value or "0/1").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def stream_fps(stream):
+    """Frame rate of an ffprobe video stream: avg_frame_rate, r_frame_rate only if that's 0/0, at most MAX_FPS
+
+    r_frame_rate is the lowest rate that can represent every timestamp, which
+    for variable-rate phone clips is often the timebase (12800 fps).
+    """
+    fps = _rate(stream.get("avg_frame_rate")) or _rate(stream.get("r_frame_rate"))
+    return round(min(fps, MAX_FPS), 3)
+
+def probe_video(video_path):
+    """Duration, resolution, codecs, frame rate and size from a single ffprobe call"""
+    try:
+        result = subprocess.run([
+            "ffprobe", "-v", "quiet",
+            "-show_entries", "format=duration,size:stream=codec_type,codec_name,width,height,r_frame_rate,avg_frame_rate",
+            "-of", "json", video_path
+        ], capture_output=True, text=True, check=True)
+        data = json.loads(result.stdout)
+    except Exception as e:
+        return {"error": str(e)}
+
+    info = {"duration": float(data.get("format", {}).get("duration", 0) or 0),
+            "size": int(data.get("format", {}).get("size", 0) or 0),
+            "resolution": "unknown"}
+    for stream in data.get("streams", []):
+        if stream.get("codec_type") == "video" and "video_codec" not in info:
+            info["video_codec"] = stream.get("codec_name")
+            info["resolution"] = f"{stream.get('width')}x{stream.get('height')}"
+            info["fps"] = stream_fps(stream)
+        elif stream.get("codec_type") == "audio" and "audio_codec" not in info:
+            info["audio_codec"] = stream.get("codec_name")
+    return info
+
+def natural_key(path):
+    """Sort key that orders video2 before video10"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", path)]
+
+def discover_videos(folder, include=INCLUDE_PATTERNS, exclude=EXCLUDE_PATTERNS):
+    """Media files under folder (relative paths) matching include and not exclude, natural order"""
+    found = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            rel = os.path.relpath(os.path.join(root, name), folder)
+            if not any(fnmatch.fnmatch(name.lower(), p) for p in include):
+                continue
+            if any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p) for p in exclude):
+                continue
+            found.append(rel)
+    return sorted(found, key=natural_key)
+
+def probe_all(folder, files, workers=PROBE_WORKERS, on_result=None):
+    """Probe files in a bounded pool; on_result(file, info, done, total) is called as each finishes"""
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(probe_video, os.path.join(folder, f)): f for f in files}
+        for future in as_completed(futures):
+            video_file = futures[future]
+            results[video_file] = future.result()
+            if on_result:
+                on_result(video_file, results[video_file], len(results), len(files))
+    return results
+
+def segment_names(files, from_paths=False):
+    """Source file -> segment name: video1, video2... by position, or from each file's path
+
+    Discovered folders use the path (without extension, e.g. "beach" or
+    "animals_cat"), so a file added in front doesn't rename every later
+    segment and move their buttons onto other clips.
+    """
+    names = {}
+    for i, video_file in enumerate(files):
+        base = f"video{i+1}"
+        if from_paths:
+            base = re.sub(r"[^A-Za-z0-9_-]+", "_", os.path.splitext(video_file)[0]).strip("_") or base
+        name, n = base, 2
+        while name in names.values():
+            name, n = f"{base}_{n}", n + 1
+        names[video_file] = name
+    return names
+
+def build_segments(files, results, names=None):
+    """Segment table in file order, skipping files that couldn't be probed"""
+    names = names or segment_names(files)
+    segments = []
+    current_start = 0
+    for video_file in files:
+        info = results.get(video_file, {})
+        duration = info.get("duration", 0)
+        if duration <= 0:
+            continue
+        segments.append({
+            "name": names[video_file],
+            "start": round(current_start, 1),
+            "duration": round(duration, 1)
+        })
+        current_start += duration
+    return segments
+
+def print_result(video_file, info, done, total):
+    """Stream one probe result as it completes"""
+    if "error" in info or info.get("duration", 0) <= 0:
+        print(f"[{done}/{total}] Could not get duration for {video_file}")
+    else:
+        print(f"[{done}/{total}] {video_file}: {info['resolution']} - {info['duration']:.1f}s")
+
+def benchmark(count=500, workers=PROBE_WORKERS):
+    """Time the old sequential two-call probe against the pooled single-call scan on a synthetic folder"""
+    folder = tempfile.mkdtemp(prefix="timings_bench_")
+    try:
+        sample = os.path.join(folder, "sample.bin")
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=64x36:rate=24",
+                        "-f", "lavfi", "-i", "sine", "-t", "1", "-c:v", "libx264", "-c:a", "aac",
+                        "-f", "mp4", sample], check=True)
+        for i in range(count):
+            shutil.copyfile(sample, os.path.join(folder, f"clip{i + 1}.mp4"))
+        os.remove(sample)
+
+        started = time.perf_counter()
+        files = discover_videos(folder)
+        for video_file in files:
+            path = os.path.join(folder, video_file)
+            get_video_duration(path)
+            get_video_resolution(path)
+        sequential = time.perf_counter() - started
+
+        started = time.perf_counter()
+        files = discover_videos(folder)
+        results = probe_all(folder, files, workers)
+        pooled = time.perf_counter() - started
+
+        ok = sum(1 for info in results.values() if info.get("duration", 0) > 0)
+        print(f"{count} files, {os.cpu_count()} CPUs")
+        print(f"  sequential, 2 ffprobe calls per file: {sequential:.2f}s ({count / sequential:.0f} files/s)")
+        print(f"  pooled ({workers} workers), 1 call per file: {pooled:.2f}s ({count / pooled:.0f} files/s)")
+        print(f"  speedup: {sequential / pooled:.1f}x, {ok}/{count} probed")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
 def main():
+    parser = argparse.ArgumentParser(description="Probe segment videos and print VIDEO_SEGMENTS")
+    parser.add_argument("--folder", default=VIDEO_FOLDER)
+    parser.add_argument("--include", action="append", help="Glob to include (repeatable)")
+    parser.add_argument("--exclude", action="append", help="Glob to exclude (repeatable)")
+    parser.add_argument("--files", nargs="+", help="Use these files instead of scanning")
+    parser.add_argument("--workers", type=int, default=PROBE_WORKERS)
+    parser.add_argument("--json", help="Also write segments and per-file metadata to this file")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Benchmark the scan on N synthetic files")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.workers)
+        return
+
     print("Video Timing Extractor")
     print("=" * 40)
-    
-    segments = []
-    current_start = 0
-    
-    for i, video_file in enumerate(VIDEO_FILES):
-        video_path = os.path.join(VIDEO_FOLDER, video_file)
-        
-        if os.path.exists(video_path):
-            duration = get_video_duration(video_path)
-            resolution = get_video_resolution(video_path)
-            
-            if duration > 0:
-                segment = {
-                    "name": f"video{i+1}",
-                    "start": round(current_start, 1),
-                    "duration": round(duration, 1)
-                }
-                segments.append(segment)
-                current_start += duration
-                
-                print(f"{video_file}: {resolution} - {duration:.1f}s")
-            else:
-                print(f"Could not get duration for {video_file}")
-        else:
-            print(f"File not found: {video_file}")
-    
+
+    folder = args.folder
+    if args.files:
+        files = args.files
+    elif AUTO_DISCOVER:
+        files = discover_videos(folder, args.include or INCLUDE_PATTERNS, args.exclude or EXCLUDE_PATTERNS)
+        print(f"Found {len(files)} videos in {folder}")
+    else:
+        files = VIDEO_FILES
+    missing = [f for f in files if not os.path.exists(os.path.join(folder, f))]
+    for video_file in missing:
+        print(f"File not found: {video_file}")
+    files = [f for f in files if f not in missing]
+
+    started = time.perf_counter()
+    results = probe_all(folder, files, args.workers, print_result)
+    elapsed = time.perf_counter() - started
+    segments = build_segments(files, results, segment_names(files, from_paths=AUTO_DISCOVER and not args.files))
+    if files:
+        print(f"Probed {len(files)} files in {elapsed:.2f}s")
+
     if segments:
         print("\n" + "="*60)
         print("COPY THIS INTO YOUR app.py FILE:")
         print("="*60)
-        
+
         print("VIDEO_SEGMENTS = [")
         for segment in segments:
             print(f'    {{"name": "{segment["name"]}", "start": {segment["start"]}, "duration": {segment["duration"]}}},')
         print("]")
-        
+
+        print("\n# Per-file metadata:")
+        for segment, video_file in zip(segments, [f for f in files if results[f].get("duration", 0) > 0]):
+            info = results[video_file]
+            print(f"# {segment['name']}: {video_file} {info['resolution']} {info.get('fps', 0)}fps "
+                  f"{info.get('video_codec', '-')}/{info.get('audio_codec', '-')} {info['size'] / (1024*1024):.1f}MB")
+
         print("\n" + "="*60)
-        
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"segments": segments, "files": {f: results[f] for f in files}}, f, indent=2)
+            print(f"Wrote {args.json}")
+
         # Check merged video
-        merged_path = os.path.join(VIDEO_FOLDER, "merged_videos.mp4")
+        merged_path = os.path.join(folder, "merged_videos.mp4")
         if os.path.exists(merged_path):
-            merged_duration = get_video_duration(merged_path)
-            merged_resolution = get_video_resolution(merged_path)
+            info = probe_video(merged_path)
             file_size = os.path.getsize(merged_path) / (1024*1024)
-            
-            print(f"✅ Merged video exists: {merged_resolution} - {merged_duration:.1f}s - {file_size:.1f}MB")
+
+            print(f"✅ Merged video exists: {info.get('resolution')} - {info.get('duration', 0):.1f}s - {file_size:.1f}MB")
         else:
             print("❌ Merged video not found")
     else:
         print("No valid video segments found")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,124 @@
+import time
+import threading
+import collections
+
+# === Configuration ===
+BOUNCE_MS = 30  # Edges closer together than this are contact bounce (RPi.GPIO bouncetime)
+REMOTE_QUEUE = 32  # Remote triggers waiting for the main loop; more are refused
+REMOTE_PER_TICK = 4  # Remote triggers handled per dispatch, so they can't starve the buttons
+
+# Button actions
+RANDOM = "random"  # Any segment
+SHUTDOWN = "shutdown"  # Hold to shut down
+STOP = "stop"  # End the current segment and go back to idle (remote triggers only)
+GROUP_PREFIX = "group:"  # "group:<name>" picks from SEGMENT_GROUPS[name]; anything else is a segment name
+
+
+class Button:
+    """One mapped input pin, or a remote trigger (pin None)"""
+
+    def __init__(self, pin, action, segments=None, name=None, debounce=True):
+        self.pin = pin
+        self.action = action
+        self.segments = segments  # Segment names this button picks from (None for shutdown/stop)
+        self.name = name or f"gpio{pin}"
+        self.debounce = debounce
+        self.last_press = 0  # For press debouncing
+
+
+def build_buttons(button_map, segment_names, groups):
+    """Resolve a {pin: action} map into Buttons; returns (buttons, errors)"""
+    buttons = []
+    errors = []
+    for pin, action in sorted(button_map.items()):
+        if action == SHUTDOWN:
+            buttons.append(Button(pin, action))
+        elif action == RANDOM:
+            buttons.append(Button(pin, action, list(segment_names)))
+        elif action.startswith(GROUP_PREFIX):
+            group = action[len(GROUP_PREFIX):]
+            members = [name for name in groups.get(group, []) if name in segment_names]
+            if not members:
+                errors.append(f"GPIO {pin}: group '{group}' has no known segments")
+                continue
+            buttons.append(Button(pin, action, members))
+        elif action in segment_names:
+            buttons.append(Button(pin, action, [action]))
+        else:
+            errors.append(f"GPIO {pin}: unknown action or segment '{action}'")
+    return buttons, errors
+
+
+class InputDispatcher:
+    """Queues edges from RPi.GPIO's callback thread; the main loop dispatches them
+
+    Every pin shares one edge callback, which only appends to a deque and
+    wakes the main loop, so mapping more buttons adds no threads and no
+    per-tick polling, and a press is handled without waiting out the tick.
+    Remote triggers go through post() into a separate bounded queue that is
+    drained after the buttons and at most REMOTE_PER_TICK at a time.
+    """
+
+    def __init__(self, gpio, clock=time.time, bouncetime=BOUNCE_MS):
+        self.gpio = gpio
+        self.clock = clock
+        self.bouncetime = bouncetime
+        self.buttons = {}
+        self.events = collections.deque()  # append/popleft are thread-safe
+        self.remote = collections.deque()
+        self.wake = threading.Event()
+
+    def add(self, button):
+        self.gpio.setup(button.pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        self.gpio.add_event_detect(button.pin, self.gpio.FALLING, callback=self._on_edge,
+                                   bouncetime=self.bouncetime)
+        self.buttons[button.pin] = button
+
+    def _on_edge(self, pin):
+        button = self.buttons.get(pin)
+        if button:
+            self.events.append((button, self.clock()))
+            self.wake.set()
+
+    def post(self, button):
+        """Queue a remote trigger from any thread; False if the queue is full"""
+        if len(self.remote) >= REMOTE_QUEUE:
+            return False
+        self.remote.append((button, self.clock()))
+        self.wake.set()
+        return True
+
+    def wait(self, timeout):
+        """Sleep until an edge arrives or `timeout` passes (replaces the loop's fixed sleep)"""
+        self.wake.wait(timeout)
+
+    def _dispatch_buttons(self, handler):
+        count = 0
+        while self.events:
+            button, pressed_at = self.events.popleft()
+            handler(button, pressed_at)
+            count += 1
+        return count
+
+    def dispatch(self, handler, remote_limit=REMOTE_PER_TICK):
+        """Call handler(button, pressed_at) for queued edges, buttons first; returns how many"""
+        self.wake.clear()  # Edges arriving from here on wake the next wait()
+        count = self._dispatch_buttons(handler)
+        for _ in range(min(remote_limit, len(self.remote))):
+            button, triggered_at = self.remote.popleft()
+            handler(button, triggered_at)
+            count += 1 + self._dispatch_buttons(handler)
+        if self.remote:
+            self.wake.set()  # More remote triggers waiting: come straight back
+        return count
+
+    def is_pressed(self, pin):
+        return self.gpio.input(pin) == self.gpio.LOW
+
+    def close(self):
+        for pin in self.buttons:
+            try:
+                self.gpio.remove_event_detect(pin)
+            except Exception:
+                pass
+        self.buttons.clear()
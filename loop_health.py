@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import socket
+import threading
+import traceback
+
+# === Configuration ===
+STALL_THRESHOLD = 0.5  # Seconds without a tick before the main loop counts as stalled
+POLL_INTERVAL = 0.05  # How often the watcher thread looks at the last tick
+STACK_DEPTH = 8  # Frames of the stalled call kept in the log
+
+
+def sd_notify(message):
+    """Send a state line to systemd ($NOTIFY_SOCKET); False when not run by systemd with Type=notify"""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]  # Abstract namespace
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.sendto(message.encode(), address)
+        return True
+    except OSError:
+        return False
+
+
+def watchdog_interval():
+    """Seconds between WATCHDOG=1 heartbeats (half of WatchdogSec), or None if the watchdog is off"""
+    usec = os.environ.get("WATCHDOG_USEC")
+    pid = os.environ.get("WATCHDOG_PID")
+    if not usec or (pid and pid.isdigit() and int(pid) != os.getpid()):
+        return None
+    try:
+        return int(usec) / 1e6 / 2
+    except ValueError:
+        return None
+
+
+class LoopMonitor:
+    """Tick-interval and stall tracking for a polling main loop, with the systemd watchdog heartbeat
+
+    The loop calls tick() once per iteration. A watcher thread notices when
+    no tick has come for `stall_threshold` seconds and snapshots the main
+    thread's stack at that moment, which names the call holding the loop up.
+    The heartbeat is only sent from tick(), so a hung loop stops it and
+    systemd restarts the service once WatchdogSec runs out.
+    """
+
+    def __init__(self, stall_threshold=STALL_THRESHOLD, tick_histogram=None, stall_counter=None, log=print,
+                 clock=time.monotonic):
+        self.stall_threshold = stall_threshold
+        self.clock = clock
+        self.tick_histogram = tick_histogram
+        self.stall_counter = stall_counter
+        self.log = log
+        self.thread_id = threading.get_ident()
+        self.loop_code = sys._getframe(1).f_code  # The function running the loop (the caller)
+        self.last_tick = clock()
+        self.ticks = 0
+        self.stalls = 0
+        self.longest = 0.0
+        self.stall = None  # Call the loop is stalled in, once the watcher has seen the stall
+        self.heartbeat = watchdog_interval()
+        self.last_heartbeat = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, watch=True):
+        """Start the stall watcher (watch=False: intervals and heartbeat only)"""
+        self.last_tick = self.clock()
+        if watch:
+            self.thread = threading.Thread(target=self._watch, name="loop-health", daemon=True)
+            self.thread.start()
+        if self.heartbeat:
+            self.log(f"systemd watchdog heartbeat every {self.heartbeat:.1f}s")
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=1)
+
+    def tick(self):
+        """Call once per loop iteration; returns the interval since the previous tick"""
+        now = self.clock()
+        interval = now - self.last_tick
+        self.last_tick = now
+        self.ticks += 1
+        self.longest = max(self.longest, interval)
+        if self.tick_histogram:
+            self.tick_histogram.observe(interval)
+
+        stall = self.stall
+        if stall is not None:
+            self.stall = None
+            self.stalls += 1
+            if self.stall_counter:
+                self.stall_counter.inc(stall)
+            self.log(f"Main loop resumed after a {interval:.2f}s stall in {stall}", "WARN")
+
+        if self.heartbeat and now - self.last_heartbeat >= self.heartbeat:
+            sd_notify("WATCHDOG=1")
+            self.last_heartbeat = now
+        return interval
+
+    def _snapshot(self):
+        """(call the loop is stuck in, formatted innermost frames) of the main thread"""
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return "unknown", ""
+        stack = traceback.extract_stack(frame)
+        call = stack[-1].name
+        for i, entry in enumerate(stack[:-1]):
+            if entry.name == self.loop_code.co_name and entry.filename == self.loop_code.co_filename:
+                call = stack[i + 1].name  # The call made directly from the loop body
+        return call, "".join(traceback.format_list(stack[-STACK_DEPTH:])).rstrip()
+
+    def _watch(self):
+        while not self.stop_event.wait(POLL_INTERVAL):
+            if self.stall is not None:
+                continue
+            last_tick = self.last_tick
+            if self.clock() - last_tick > self.stall_threshold:
+                call, stack = self._snapshot()
+                if self.last_tick != last_tick:
+                    continue  # Ticked while the stack was taken
+                self.stall = call
+                self.log(f"Main loop stalled for over {self.stall_threshold}s in {call}:\n{stack}", "WARN")
+
+    def summary(self):
+        return {"ticks": self.ticks, "stalls": self.stalls, "longest": round(self.longest, 3)}
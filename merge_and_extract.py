@@ -1,6 +1,18 @@
 import subprocess
 import os
 import json
+import time
+import shutil
+import argparse
+import mp4_layout
+import video_verify
+import get_timings
+import encode_budget
+import output_profile
+import trim_detect
+import popularity
+import size_budget
+import merge_workers
 
 # === Configuration ===
 VIDEO_FOLDER = "/home/pi-five/pi_video"
@@ -12,6 +24,48 @@ VIDEO_FILES = [
 MERGED_VIDEO = "merged_videos.mp4"
 TARGET_WIDTH = 1920
 TARGET_HEIGHT = 1080
+FRAGMENTED_OUTPUT = False  # Fragmented MP4 instead of moov-at-front (faststart)
+GOP_SECONDS = 2.0  # Bound keyframe distance so seeks decode little before the first frame
+# Encodes of the same timeline, best first; app.py picks the best one the Pi decodes in time.
+# The first is written to MERGED_VIDEO, the others to merged_videos_<name>.mp4
+RENDITIONS = [
+    {"name": "1080p", "width": TARGET_WIDTH, "height": TARGET_HEIGHT, "crf": 23},
+    # {"name": "720p", "width": 1280, "height": 720, "crf": 23, "maxrate": "3M"},
+    # {"name": "540p", "width": 960, "height": 540, "crf": 25, "maxrate": "1500k"},
+]
+RENDITIONS_FILE = "renditions.json"
+AUTO_DISCOVER = False  # Merge every video get_timings.py finds in VIDEO_FOLDER instead of VIDEO_FILES (segments named after their files)
+# Each build goes into its own folder under RELEASES_DIR and is published by swapping the
+# CURRENT_LINK symlink, so the video, manifest, timings and renditions change together.
+# merged_videos.mp4, video_timings.txt, ... in VIDEO_FOLDER are symlinks through CURRENT_LINK
+RELEASES_DIR = "releases"
+CURRENT_LINK = "current"
+KEEP_RELEASES = 2  # Published builds kept (a player may still have the previous one open)
+# Frame rate, pixel format and audio format the player needs no conversion for; written by
+# "output_profile.py suggest --write". Without it the sources' rate and formats pass through
+OUTPUT_PROFILE_FILE = output_profile.PROFILE_FILE
+TRIM_EDGES = True  # Cut black-and-silent stretches off the start and end of each clip (trim_detect.py)
+POPULARITY_ORDER = False  # Lay the most-played clips out first (app.py's PLAY_COUNTS_FILE), see --by-popularity
+PLAY_COUNTS_FILE = popularity.PLAY_COUNTS_FILE
+# Fit the main rendition into a size instead of using its fixed CRF (size_budget.py): a size in MB,
+# or a share of this unit's RAM so the file stays in the page cache or fits prefetch's tmpfs copy
+SIZE_BUDGET_MB = None  # e.g. 300 (--size-budget)
+SIZE_BUDGET_RAM_PERCENT = None  # e.g. 40 (--fit-ram)
+SIZE_BUDGET_POPULARITY = True  # Spend more of the budget on the most-played clips, when there are play counts
+# Encode each clip on its own and join the parts without re-encoding, sharing the clips with workers
+# that connect over TCP ("python3 merge_workers.py worker --host <this machine> --token <secret>"), see --distributed
+DISTRIBUTED_MERGE = False
+MERGE_WORKERS_HOST = merge_workers.LISTEN_HOST  # "0.0.0.0" to take workers from other machines (with a token)
+MERGE_WORKERS_PORT = merge_workers.PORT
+MERGE_WORKERS_TOKEN = merge_workers.TOKEN
+MERGE_LOCAL_WORKERS = 1  # Clips this machine encodes at a time alongside the workers (0: workers only)
+PART_AUDIO_FILTER = "aresample=48000,aformat=sample_rates=48000:channel_layouts=stereo"  # Same audio in every part, so they join
+PART_FPS = 25  # Frame rate of every part without an output profile (sources' rate metadata can't be trusted to match)
+PART_TIMESCALE = 90000  # Video track timescale of every part, so the stream-copy join keeps timestamps consistent
+JOIN_TOLERANCE = 0.5  # Seconds the joined video or audio stream may differ from the timeline's length
+BACKGROUND = False  # Merge within encode_budget's thread/CPU/I/O limits, pausing while app.py plays (--background)
+
+background_budget = None  # EncodeBudget in use in background mode
 
 def get_video_info(video_path):
     """Get video information including duration and resolution"""
@@ -40,9 +94,54 @@ def get_video_info(video_path):
         print(f"Error getting info for {video_path}: {e}")
         return None
 
-def merge_videos():
-    """Merge all videos into one file with consistent resolution"""
-    print("Merging videos with resolution scaling...")
+def rendition_output(rendition):
+    """Output file name of a rendition"""
+    if rendition is RENDITIONS[0]:
+        return MERGED_VIDEO
+    base, ext = os.path.splitext(MERGED_VIDEO)
+    return f"{base}_{rendition['name']}{ext}"
+
+def source_files(folder=None):
+    """Videos to merge, relative to `folder` (VIDEO_FOLDER), in timeline order"""
+    if AUTO_DISCOVER:
+        return get_timings.discover_videos(folder or VIDEO_FOLDER)
+    return VIDEO_FILES
+
+def output_format(rendition):
+    """(width, height, output profile or None) a rendition is encoded at"""
+    profile = output_profile.load_profile(os.path.join(VIDEO_FOLDER, OUTPUT_PROFILE_FILE))
+    if profile and rendition is RENDITIONS[0]:
+        return profile["width"], profile["height"], profile  # The main rendition matches the display mode
+    return rendition["width"], rendition["height"], profile
+
+def input_video_filter(width, height, profile, fps=None):
+    """Filter chain scaling and padding one input to the output size (and the profile's or a fixed rate and format)"""
+    return (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1"
+            + (f",{output_profile.video_filter(profile)}" if profile else f",fps={fps}" if fps else ""))
+
+def stream_durations(path):
+    """Duration in seconds of each stream type in a file, e.g. {"video": 68.8, "audio": 68.8}"""
+    result = subprocess.run(["ffprobe", "-v", "quiet", "-show_entries", "stream=codec_type,duration",
+                             "-of", "csv=p=0", path], capture_output=True, text=True, check=True)
+    durations = {}
+    for line in result.stdout.split():
+        kind, _, duration = line.partition(",")
+        try:
+            durations.setdefault(kind, float(duration))
+        except ValueError:
+            pass
+    return durations
+
+def merge_videos(segments=None, rendition=None, output_dir=None, rate_control=None):
+    """Merge all videos into one file with consistent resolution
+
+    `rate_control` replaces the rendition's -crf/-maxrate options (size-budget encodes).
+    """
+    rendition = rendition or RENDITIONS[0]
+    width, height, profile = output_format(rendition)
+    output = os.path.join(output_dir or VIDEO_FOLDER, rendition_output(rendition))
+    print(f"Merging videos with resolution scaling ({rendition['name']})...")
     
     # Change to video directory
     os.chdir(VIDEO_FOLDER)
@@ -66,28 +165,58 @@ def merge_videos():
         
         print(f"{video_file}: {info['resolution']} - {info['duration']:.1f}s")
     
+    # Trim points found by extract_timings(): seeking on the input cuts exactly, as everything is re-encoded
+    trims = {seg["file"]: seg["trim"] for seg in segments or [] if seg.get("trim")}
+    for info in video_info:
+        if info["file"] in trims:
+            info["duration"] = trims[info["file"]][1] - trims[info["file"]][0]
+    
+    if DISTRIBUTED_MERGE and segments and not rate_control:
+        return merge_distributed(segments, rendition, output, width, height, profile)
+    
     # Build ffmpeg command with scaling
     input_args = []
     for video_file in VIDEO_FILES:
+        if video_file in trims:
+            start, end = trims[video_file]
+            input_args.extend(["-ss", str(start), "-t", str(round(end - start, 3))])
         input_args.extend(["-i", video_file])
     
     # Create filter complex with proper scaling and padding
     filter_parts = []
     
-    # Scale and pad each video to target resolution
+    # Scale and pad each video to target resolution (and the profile's frame rate and formats)
     for i in range(len(VIDEO_FILES)):
-        filter_parts.append(
-            f"[{i}:v]scale={TARGET_WIDTH}:{TARGET_HEIGHT}:force_original_aspect_ratio=decrease,"
-            f"pad={TARGET_WIDTH}:{TARGET_HEIGHT}:(ow-iw)/2:(oh-ih)/2:black,setsar=1[v{i}]"
-        )
+        filter_parts.append(f"[{i}:v]{input_video_filter(width, height, profile)}[v{i}]")
+        if profile:
+            filter_parts.append(f"[{i}:a]{output_profile.audio_filter(profile)}[a{i}]")
     
     # Concatenate scaled videos
     concat_inputs = ""
     for i in range(len(VIDEO_FILES)):
-        concat_inputs += f"[v{i}][{i}:a]"
+        concat_inputs += f"[v{i}][a{i}]" if profile else f"[v{i}][{i}:a]"
     
     filter_complex = ";".join(filter_parts) + f";{concat_inputs}concat=n={len(VIDEO_FILES)}:v=1:a=1[outv][outa]"
     
+    # Keyframes on every segment start (as app.py seeks to them) and at most GOP_SECONDS apart
+    if segments:
+        segment_starts = [seg["start"] for seg in segments]
+    else:
+        segment_starts = []
+        current_start = 0
+        for info in video_info:
+            segment_starts.append(round(current_start, 1))
+            current_start += info["duration"]
+    total_duration = sum(info["duration"] for info in video_info)
+    
+    # Optional bitrate cap for renditions meant for slower decoders / cards
+    rate_args = []
+    if rendition.get("maxrate"):
+        rate_args = ["-maxrate", rendition["maxrate"], "-bufsize", rendition.get("bufsize", rendition["maxrate"])]
+    rate_args = rate_control or ["-crf", str(rendition.get("crf", 23))] + rate_args
+    profile_args = output_profile.output_args(profile) if profile else []
+    frame_interval = 1 / float(profile["fps"]) if profile else mp4_layout.FRAME_INTERVAL
+    
     # Full ffmpeg command
     ffmpeg_cmd = [
         "ffmpeg", "-y"  # -y to overwrite existing file
@@ -96,20 +225,24 @@ def merge_videos():
         "-map", "[outv]", "-map", "[outa]",
         "-c:v", "libx264", "-c:a", "aac",
         "-preset", "medium",
-        "-crf", "23",
-        MERGED_VIDEO
+    ] + rate_args + profile_args + mp4_layout.layout_args(segment_starts, total_duration, GOP_SECONDS,
+                                                         FRAGMENTED_OUTPUT, frame_interval) + [
+        output
     ]
     
     try:
-        print(f"Scaling all videos to {TARGET_WIDTH}x{TARGET_HEIGHT} and merging...")
+        print(f"Scaling all videos to {width}x{height} and merging...")
         print("This may take a few minutes...")
         
         # Print the command for debugging
         print("FFmpeg command:")
         print(" ".join(ffmpeg_cmd))
         
-        result = subprocess.run(ffmpeg_cmd, check=True, capture_output=True, text=True)
-        print(f"Successfully merged videos into {MERGED_VIDEO}")
+        if background_budget:
+            result = background_budget.run(ffmpeg_cmd)
+        else:
+            result = subprocess.run(ffmpeg_cmd, check=True, capture_output=True, text=True)
+        print(f"Successfully merged videos into {output}")
         return True
     except subprocess.CalledProcessError as e:
         print(f"Error merging videos: {e}")
@@ -117,9 +250,95 @@ def merge_videos():
             print(f"FFmpeg stderr: {e.stderr}")
         return False
 
-def extract_timings():
-    """Extract timing information for each video segment"""
+def merge_distributed(segments, rendition, output, width, height, profile):
+    """Encode every clip separately, here and on merge workers, then join the parts with a stream copy
+
+    Each part gets the keyframes the single-encode merge would put in its
+    stretch of the timeline, and the same frame rate, timescale and audio
+    format, so the joined file seeks and plays like a normal merge. The join
+    is checked against the timeline's length before it counts as merged.
+    """
+    total_duration = sum(seg["duration"] for seg in segments)
+    fps = float(profile["fps"]) if profile else PART_FPS
+    frame_interval = 1 / fps
+    keyframes = mp4_layout.keyframe_times([seg["start"] for seg in segments], total_duration, GOP_SECONDS, frame_interval)
+    rate_args = ["-crf", str(rendition.get("crf", 23))]
+    if rendition.get("maxrate"):
+        rate_args += ["-maxrate", rendition["maxrate"], "-bufsize", rendition.get("bufsize", rendition["maxrate"])]
+    
+    parts_dir = os.path.join(os.path.dirname(output), f".parts-{rendition['name']}")
+    os.makedirs(parts_dir, exist_ok=True)
+    jobs = []
+    for i, seg in enumerate(segments):
+        end = seg["start"] + seg["duration"]
+        times = [round(t - seg["start"], 3) for t in keyframes if seg["start"] <= t < end] or [0]
+        jobs.append({
+            "id": seg["name"], "source": os.path.join(VIDEO_FOLDER, seg["file"]), "duration": seg["duration"],
+            "width": width, "height": height, "output": os.path.join(parts_dir, f"part{i:04d}.mp4"),
+            "input_args": ["-ss", str(seg["trim"][0]), "-t", str(round(seg["trim"][1] - seg["trim"][0], 3))]
+                          if seg.get("trim") else [],
+            "output_args": ["-vf", input_video_filter(width, height, profile, PART_FPS),
+                            "-af", output_profile.audio_filter(profile) if profile else PART_AUDIO_FILTER,
+                            "-c:v", "libx264", "-preset", "medium"] + rate_args
+                           + (output_profile.output_args(profile) if profile else ["-r", str(PART_FPS)])
+                           + ["-video_track_timescale", str(PART_TIMESCALE),
+                              "-force_key_frames", ",".join(str(t) for t in times), "-c:a", "aac"],
+        })
+    
+    print(f"Encoding {len(jobs)} clips on merge workers (port {MERGE_WORKERS_PORT}) "
+          f"and {MERGE_LOCAL_WORKERS} local worker(s)...")
+    try:
+        coordinator = merge_workers.Coordinator(MERGE_WORKERS_HOST, MERGE_WORKERS_PORT, MERGE_WORKERS_TOKEN,
+                                                local_workers=MERGE_LOCAL_WORKERS, workdir=parts_dir,
+                                                run=background_budget.run if background_budget else None)
+    except (OSError, ValueError) as e:
+        print(f"Could not listen for merge workers on {MERGE_WORKERS_HOST}:{MERGE_WORKERS_PORT}: {e}")
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        return False
+    try:
+        wall, failed = coordinator.run(jobs)
+    finally:
+        coordinator.stop()
+    coordinator.report(wall)
+    if failed:
+        print(f"Error merging videos: {', '.join(job['id'] + ' (' + job.get('error', '') + ')' for job in failed)}")
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        return False
+    
+    concat_list = os.path.join(parts_dir, "parts.txt")
+    with open(concat_list, "w") as f:
+        f.writelines(f"file '{job['output']}'\n" for job in jobs)
+    cmd = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", concat_list, "-map", "0", "-c", "copy"] \
+        + mp4_layout.movflags_args(FRAGMENTED_OUTPUT) + [output]
+    try:
+        if background_budget:
+            background_budget.run(cmd)
+        else:
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+        durations = stream_durations(output)
+    except subprocess.CalledProcessError as e:
+        print(f"Error joining the encoded parts: {e.stderr}")
+        return False
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    wrong = {kind: durations.get(kind) for kind in ("video", "audio")
+             if durations.get(kind) is None or abs(durations[kind] - total_duration) > JOIN_TOLERANCE}
+    if wrong:
+        print(f"Error joining the encoded parts: expected {total_duration:.2f}s, got "
+              + ", ".join(f"{kind} {'missing' if d is None else f'{d:.2f}s'}" for kind, d in wrong.items()))
+        return False
+    print(f"Successfully merged videos into {output} (video {durations['video']:.2f}s, audio {durations['audio']:.2f}s)")
+    return True
+
+def extract_timings(trims=None, names=None):
+    """Extract timing information for each video segment (durations after any trims)
+
+    `names` maps source files to segment names, so a clip keeps its name
+    (and its buttons) when the layout order changes.
+    """
     print("\nExtracting video timings...")
+    trims = trims or {}
+    names = names or {}
     
     segments = []
     current_start = 0
@@ -129,13 +348,21 @@ def extract_timings():
         info = get_video_info(video_path)
         
         if info and info["duration"] > 0:
+            trim = trims.get(video_file)
+            if trim and (trim["lead"] or trim["tail"]):
+                info["duration"] = trim["end"] - trim["start"]
+            else:
+                trim = None
             segment = {
-                "name": f"video{i+1}",
+                "name": names.get(video_file, f"video{i+1}"),
                 "start": round(current_start, 1),
                 "duration": round(info["duration"], 1),
                 "end": round(current_start + info["duration"], 1),
-                "original_resolution": info["resolution"]
+                "original_resolution": info["resolution"],
+                "file": video_file,
             }
+            if trim:
+                segment["trim"] = (trim["start"], trim["end"])  # Part of the source clip used, in its own seconds
             segments.append(segment)
             current_start += info["duration"]
             
@@ -145,7 +372,7 @@ def extract_timings():
     
     return segments
 
-def generate_updated_code(segments):
+def generate_updated_code(segments, output_dir=None):
     """Generate the updated Python code with correct timings"""
     print("\n" + "="*60)
     print("COPY THIS INTO YOUR app.py FILE:")
@@ -154,7 +381,8 @@ def generate_updated_code(segments):
     print("# Updated VIDEO_SEGMENTS with correct timings:")
     print("VIDEO_SEGMENTS = [")
     for segment in segments:
-        print(f'    {{"name": "{segment["name"]}", "start": {segment["start"]}, "duration": {segment["duration"]}}},')
+        trim = f', "trim_start": {segment["trim"][0]}, "trim_end": {segment["trim"][1]}' if segment.get("trim") else ""
+        print(f'    {{"name": "{segment["name"]}", "start": {segment["start"]}, "duration": {segment["duration"]}{trim}}},')
     print("]")
     
     print(f"\n# All videos scaled to: {TARGET_WIDTH}x{TARGET_HEIGHT}")
@@ -165,21 +393,26 @@ def generate_updated_code(segments):
     print("\n" + "="*60)
     
     # Also save to a file
-    with open(os.path.join(VIDEO_FOLDER, "video_timings.txt"), "w") as f:
+    output_dir = output_dir or VIDEO_FOLDER
+    with open(os.path.join(output_dir, "video_timings.txt"), "w") as f:
         f.write("VIDEO_SEGMENTS = [\n")
         for segment in segments:
-            f.write(f'    {{"name": "{segment["name"]}", "start": {segment["start"]}, "duration": {segment["duration"]}}},\n')
+            trim = f', "trim_start": {segment["trim"][0]}, "trim_end": {segment["trim"][1]}' if segment.get("trim") else ""
+            f.write(f'    {{"name": "{segment["name"]}", "start": {segment["start"]}, "duration": {segment["duration"]}{trim}}},\n')
         f.write("]\n\n")
         f.write(f"# All videos scaled to: {TARGET_WIDTH}x{TARGET_HEIGHT}\n")
         f.write("# Original resolutions:\n")
         for segment in segments:
             f.write(f"# {segment['name']}: {segment['original_resolution']}\n")
+        f.write("# Source files (app.py keeps play counts by file):\n")
+        for segment in segments:
+            f.write(f"{popularity.SOURCE_PREFIX}{segment['name']}: {segment['file']}\n")
     
-    print(f"Timings also saved to: {VIDEO_FOLDER}/video_timings.txt")
+    print(f"Timings also saved to: {output_dir}/video_timings.txt")
 
-def verify_merged_video():
+def verify_merged_video(output_dir=None):
     """Verify the merged video was created successfully"""
-    merged_path = os.path.join(VIDEO_FOLDER, MERGED_VIDEO)
+    merged_path = os.path.join(output_dir or VIDEO_FOLDER, MERGED_VIDEO)
     
     if not os.path.exists(merged_path):
         print(f"Error: Merged video not found at {merged_path}")
@@ -201,7 +434,223 @@ def verify_merged_video():
         print("Error getting merged video info")
         return False
 
+def write_renditions(renditions, output_dir=None):
+    """Record the renditions that were built, best first, for app.py"""
+    output_dir = output_dir or VIDEO_FOLDER
+    entries = [{"name": r["name"], "file": rendition_output(r), "width": r["width"], "height": r["height"]}
+               for r in renditions]
+    with open(os.path.join(output_dir, RENDITIONS_FILE), "w") as f:
+        json.dump(entries, f, indent=2)
+    print(f"Renditions: {', '.join(r['name'] for r in renditions)} -> {output_dir}/{RENDITIONS_FILE}")
+
+def release_files(renditions=RENDITIONS):
+    """Names of the files a release holds (and VIDEO_FOLDER links to)"""
+    names = ["video_timings.txt", RENDITIONS_FILE]
+    for rendition in renditions:
+        names.append(rendition_output(rendition))
+        names.append(rendition_output(rendition) + video_verify.MANIFEST_SUFFIX)  # A name, not manifest_path()'s resolved path
+    return names
+
+def _replace_symlink(target, path):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(target, tmp)
+    os.replace(tmp, path)  # Atomic: readers see the old link or the new one, never neither
+
+def claim_release(staging, releases):
+    """Move a finished build to releases/<timestamp>, with a -02, -03... suffix if that name is taken"""
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    n = 1
+    while True:
+        release = os.path.join(releases, stamp if n == 1 else f"{stamp}-{n:02d}")
+        try:
+            os.mkdir(release)  # Atomic, so two builds finishing in the same second can't both get the name
+        except FileExistsError:
+            n += 1
+            continue
+        os.rename(staging, release)  # Onto the empty folder just made
+        return release
+
+def publish_release(release_dir):
+    """Point CURRENT_LINK at a finished release in one rename, then prune old releases"""
+    releases = os.path.join(VIDEO_FOLDER, RELEASES_DIR)
+    _replace_symlink(os.path.join(RELEASES_DIR, os.path.basename(release_dir)), os.path.join(VIDEO_FOLDER, CURRENT_LINK))
+    
+    # Old-style paths (and stray links) become links through CURRENT_LINK (a player holding the old file keeps reading it)
+    for name in release_files():
+        path = os.path.join(VIDEO_FOLDER, name)
+        target = os.path.join(CURRENT_LINK, name)
+        if not os.path.islink(path) or os.readlink(path) != target:
+            _replace_symlink(target, path)
+    
+    published = sorted(d for d in os.listdir(releases) if not d.startswith("."))
+    for old in published[:-KEEP_RELEASES]:
+        shutil.rmtree(os.path.join(releases, old), ignore_errors=True)
+    print(f"Published {release_dir}")
+
+def merge_to_size(segments, output_dir):
+    """Merge the main rendition at whatever quality fits the size budget; returns success
+
+    Samples each clip's bitrate, solves for the CRF, then re-encodes with the
+    measured error folded in until the file lands just under the budget.
+    """
+    target = size_budget.budget_bytes(SIZE_BUDGET_MB, SIZE_BUDGET_RAM_PERCENT)
+    width, height, profile = output_format(RENDITIONS[0])
+    vfilter = input_video_filter(width, height, profile)
+    run = background_budget.run if background_budget else None
+    print(f"\nSize budget {target / (1024*1024):.1f}MB"
+          + (f" ({SIZE_BUDGET_RAM_PERCENT}% of {size_budget.ram_total() / (1024*1024):.0f}MB RAM)" if not SIZE_BUDGET_MB else "")
+          + f"; sampling clips at CRF {size_budget.REFERENCE_CRF}...")
+    timings = []
+    started = time.time()
+    clips = size_budget.measure_clips(VIDEO_FOLDER, segments, vfilter, float(profile["fps"]) if profile else None, run=run)
+    timings.append(("sampling", time.time() - started))
+    counts = popularity.load_counts(PLAY_COUNTS_FILE) if SIZE_BUDGET_POPULARITY else {}
+    offsets = size_budget.crf_offsets(clips, counts)
+    if any(offsets.values()):
+        print("Popularity weighting: " + ", ".join(f"{name} -{offset:g} CRF" for name, offset in offsets.items() if offset))
+    
+    output = os.path.join(output_dir, MERGED_VIDEO)
+    correction = rate_correction = 1.0
+    other_bytes = None
+    for attempt in range(1, size_budget.MAX_PASSES + 1):
+        settings = size_budget.plan(clips, target, offsets, correction, other_bytes, rate_correction)
+        if settings["crf"] is None and not settings["bitrate"]:
+            print(f"❌ A {target / (1024*1024):.1f}MB budget doesn't even hold the audio track")
+            return False
+        print(f"Pass {attempt}: {size_budget.describe(settings)}"
+              + (f", predicted {settings['predicted'] / (1024*1024):.1f}MB" if settings["predicted"] else ""))
+        started = time.time()
+        if not merge_videos(segments, output_dir=output_dir,
+                            rate_control=size_budget.encode_args(settings, clips, offsets)):
+            return False
+        timings.append((f"pass {attempt}", time.time() - started))
+        size = os.path.getsize(output)
+        print(f"Pass {attempt}: {size / (1024*1024):.1f}MB")
+        if size_budget.fits(size, target):
+            break
+        if settings["crf"] is not None and settings["crf"] <= size_budget.CRF_MIN + max(offsets.values(), default=0) \
+                and size <= target:
+            break  # Best quality allowed already fits
+        video = size_budget.video_bytes(output)
+        if settings["crf"] is None:
+            rate_correction *= video / settings["video"]
+        else:
+            correction *= video / settings["video"]
+        other_bytes = size - video
+    size = size_budget.report(output, segments, VIDEO_FOLDER, target, settings, offsets, vfilter, timings, run)
+    if size > target:
+        print(f"❌ Still over the {target / (1024*1024):.1f}MB budget after {size_budget.MAX_PASSES} passes, not publishing")
+        return False
+    return True
+
+def use_background_budget(budget=None):
+    """Run the rest of this build (and its ffmpeg children) within a playback-safe budget"""
+    global background_budget
+    background_budget = budget or encode_budget.EncodeBudget()
+    background_budget.apply_to_self()
+    print(f"Background mode: {background_budget.threads} threads, nice {background_budget.nice}, "
+          f"ionice class {background_budget.ionice_class}, CPU quota {background_budget.cpu_quota or 'off'}, "
+          f"{'pausing' if background_budget.pause_while_playing else 'not pausing'} while a segment plays")
+    return background_budget
+
+def build_release():
+    """Probe, merge, hash and write timings into a staging folder, then publish it; returns its path or None"""
+    global VIDEO_FILES
+    releases = os.path.join(VIDEO_FOLDER, RELEASES_DIR)
+    os.makedirs(releases, exist_ok=True)
+    for stale in os.listdir(releases):
+        if stale.startswith(".staging-"):
+            shutil.rmtree(os.path.join(releases, stale), ignore_errors=True)  # Left by an interrupted build
+    staging = os.path.join(releases, f".staging-{os.getpid()}")
+    os.makedirs(staging)
+    
+    try:
+        # Step 1: Extract timings from original videos
+        VIDEO_FILES = source_files()
+        names = get_timings.segment_names(VIDEO_FILES, from_paths=AUTO_DISCOVER)
+        if POPULARITY_ORDER:
+            counts = popularity.load_counts(PLAY_COUNTS_FILE)
+            if counts:
+                VIDEO_FILES = popularity.popularity_order(VIDEO_FILES, counts)
+                print("Popularity order: " + ", ".join(f"{names[f]} ({counts.get(f, 0)} plays)" for f in VIDEO_FILES))
+            else:
+                print(f"No play counts in {PLAY_COUNTS_FILE}, keeping source order")
+        trims = {}
+        if TRIM_EDGES:
+            print("\nLooking for black/silent starts and ends...")
+            trims = trim_detect.detect_all(VIDEO_FOLDER, VIDEO_FILES,
+                                           workers=max(1, background_budget.threads) if background_budget else trim_detect.WORKERS)
+        segments = extract_timings(trims, names)
+        if not segments:
+            print("No valid video segments found. Exiting.")
+            return None
+        
+        # Step 2: Merge videos with scaling (at the quality that fits the size budget, if there is one)
+        if SIZE_BUDGET_MB or SIZE_BUDGET_RAM_PERCENT:
+            merged = merge_to_size(segments, staging)
+        else:
+            merged = merge_videos(segments, output_dir=staging)
+        if not merged:
+            print("❌ Error merging videos")
+            return None
+        
+        # Step 3: Verify merged video
+        if not verify_merged_video(staging):
+            print("❌ Error verifying merged video")
+            return None
+        if trims:
+            merged = os.path.join(staging, MERGED_VIDEO)
+            duration = sum(seg["duration"] for seg in segments)
+            trim_detect.report(trims, os.path.getsize(merged) / duration if duration else None)
+        profile = output_profile.load_profile(os.path.join(VIDEO_FOLDER, OUTPUT_PROFILE_FILE))
+        if profile:
+            problems = output_profile.check_file(os.path.join(staging, MERGED_VIDEO), profile)
+            print("Output profile: " + ("matched" if not problems else "MISMATCH " + "; ".join(problems)))
+        
+        # Step 4: Extra renditions, same timeline and keyframes so they share the segment index
+        built = [RENDITIONS[0]]
+        for rendition in RENDITIONS[1:]:
+            if merge_videos(segments, rendition, staging):
+                built.append(rendition)
+            else:
+                print(f"Warning: rendition {rendition['name']} failed, skipping it")
+        write_renditions(built, staging)
+        
+        # Step 5: Store chunk hashes for app.py's boot-time check (hashing is CPU and I/O too)
+        workers = max(1, background_budget.threads) if background_budget else video_verify.WORKERS
+        for rendition in built:
+            try:
+                video_verify.build_manifest(os.path.join(staging, rendition_output(rendition)), segments, workers=workers)
+            except Exception as e:
+                print(f"Warning: could not write verification manifest: {e}")
+        
+        # Step 6: Generate updated code
+        generate_updated_code(segments, staging)
+        
+        # Step 7: Publish everything at once
+        release = claim_release(staging, releases)
+        publish_release(release)
+        return release
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
 def main():
+    global POPULARITY_ORDER, SIZE_BUDGET_MB, SIZE_BUDGET_RAM_PERCENT, DISTRIBUTED_MERGE
+    parser = argparse.ArgumentParser(description="Merge the videos into a new release and publish it")
+    parser.add_argument("--background", action="store_true", default=BACKGROUND,
+                        help="Limit threads/CPU/I/O and pause while app.py plays a segment")
+    parser.add_argument("--by-popularity", action="store_true", default=POPULARITY_ORDER,
+                        help="Put the most-played clips at the front of the merged file")
+    parser.add_argument("--size-budget", type=float, default=SIZE_BUDGET_MB, metavar="MB",
+                        help="Encode the main rendition to fit this size")
+    parser.add_argument("--fit-ram", type=float, default=SIZE_BUDGET_RAM_PERCENT, metavar="PERCENT",
+                        help="Encode the main rendition to fit this share of RAM")
+    parser.add_argument("--distributed", action="store_true", default=DISTRIBUTED_MERGE,
+                        help="Encode clips one by one, shared with merge workers that connect over TCP")
+    args = parser.parse_args()
+    
     print("Video Merger and Timing Extractor")
     print("=" * 50)
     print(f"Target resolution: {TARGET_WIDTH}x{TARGET_HEIGHT}")
@@ -216,27 +665,16 @@ def main():
         print("Install with: sudo apt install ffmpeg")
         return
     
-    # Step 1: Extract timings from original videos
-    segments = extract_timings()
-    
-    if not segments:
-        print("No valid video segments found. Exiting.")
-        return
-    
-    # Step 2: Merge videos with scaling
-    if merge_videos():
-        # Step 3: Verify merged video
-        if verify_merged_video():
-            # Step 4: Generate updated code
-            generate_updated_code(segments)
-            
-            print(f"\n✅ Success! Merged video created: {VIDEO_FOLDER}/{MERGED_VIDEO}")
-            print("✅ All videos scaled to consistent resolution")
-            print("✅ Copy the VIDEO_SEGMENTS code above into your app.py file")
-        else:
-            print("❌ Error verifying merged video")
-    else:
-        print("❌ Error merging videos")
+    if args.background:
+        use_background_budget()
+    POPULARITY_ORDER = args.by_popularity
+    SIZE_BUDGET_MB, SIZE_BUDGET_RAM_PERCENT = args.size_budget, args.fit_ram
+    DISTRIBUTED_MERGE = args.distributed
+    release = build_release()
+    if release:
+        print(f"\n✅ Success! Merged video created: {VIDEO_FOLDER}/{MERGED_VIDEO} -> {release}")
+        print("✅ All videos scaled to consistent resolution")
+        print("✅ app.py picks up the new video between plays after a SIGHUP (watch_rebuild.py sends it)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
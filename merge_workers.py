@@ -0,0 +1,569 @@
+import os
+import sys
+import json
+import hmac
+import time
+import random
+import socket
+import struct
+import hashlib
+import argparse
+import ipaddress
+import tempfile
+import threading
+import subprocess
+import collections
+
+# === Configuration ===
+LISTEN_HOST = "127.0.0.1"  # Where merge_and_extract.py waits for workers; "0.0.0.0" for other machines (needs a TOKEN)
+PORT = 9110
+TOKEN = ""  # Shared secret a worker must present; the same on every machine (empty: loopback only)
+CHUNK_SIZE = 1024 * 1024  # Bytes per send/receive when moving clips and results
+MAX_ATTEMPTS = 3  # Tries per clip (on different workers where possible) before the merge fails
+JOB_TIMEOUT = 3600  # Seconds a worker may spend on one clip before it counts as lost
+HANDSHAKE_TIMEOUT = 10
+WORKER_WAIT = 60  # Seconds to wait for a first worker when there are no local ones
+RECONNECT_DELAY = 5  # Seconds between a worker's attempts to reach the coordinator
+DURATION_TOLERANCE = 0.25  # Seconds a returned part may differ from the clip's duration
+MAX_HEADER = 1024 * 1024  # Bytes of JSON header accepted in one message
+HELLO_MAX_HEADER = 4096  # Handshake messages are read before the peer is authenticated
+DIGEST_SIZE = hashlib.sha256().digest_size
+# The only ffmpeg options and filters a worker runs (what merge_distributed builds)
+ALLOWED_OPTIONS = {"-ss", "-t", "-vf", "-af", "-c:v", "-preset", "-crf", "-maxrate", "-bufsize", "-r", "-pix_fmt",
+                   "-ar", "-ac", "-video_track_timescale", "-force_key_frames", "-c:a"}
+ALLOWED_FILTERS = {"scale", "pad", "setsar", "fps", "format", "aresample", "aformat"}
+
+# Wire format: a 4-byte big-endian length and a JSON header. When the header's "size" is
+# non-zero, that many bytes of payload follow, then the payload's SHA-256 digest.
+# Handshake: the coordinator sends a challenge nonce, the worker answers with its own nonce
+# and an HMAC of both under TOKEN, and the coordinator proves the token with a second HMAC.
+
+
+class TransferError(Exception):
+    """A message was cut short or its payload did not match its checksum"""
+
+
+def recv_exact(sock, count):
+    data = bytearray()
+    while len(data) < count:
+        chunk = sock.recv(min(CHUNK_SIZE, count - len(data)))
+        if not chunk:
+            raise TransferError("connection closed mid-message")
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock, header, path=None):
+    """Send a header and optionally a file; returns the payload bytes sent"""
+    size = os.path.getsize(path) if path else 0
+    data = json.dumps(dict(header, size=size)).encode()
+    sock.sendall(struct.pack(">I", len(data)) + data)
+    if path:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                sock.sendall(chunk)
+        sock.sendall(digest.digest())
+    return size
+
+
+def recv_message(sock, directory=None, max_header=MAX_HEADER, payload=True):
+    """Receive a header and its payload (into a temporary file in `directory`); returns (header, path or None)
+
+    A header over `max_header` bytes, or any payload when `payload` is
+    false, fails before anything is buffered or written.
+    """
+    (length,) = struct.unpack(">I", recv_exact(sock, 4))
+    if length > max_header:
+        raise TransferError(f"{length}-byte header exceeds {max_header}")
+    header = json.loads(recv_exact(sock, length))
+    if not isinstance(header, dict):
+        raise TransferError("header is not an object")
+    size = header.get("size", 0)
+    if not size:
+        return header, None
+    if not payload or not isinstance(size, int) or size < 0:
+        raise TransferError(f"unexpected {size}-byte payload")
+    fd, path = tempfile.mkstemp(dir=directory, suffix=header.get("suffix", ""))
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as f:
+            remaining = size
+            while remaining:
+                chunk = sock.recv(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise TransferError("connection closed mid-transfer")
+                digest.update(chunk)
+                f.write(chunk)
+                remaining -= len(chunk)
+        if recv_exact(sock, DIGEST_SIZE) != digest.digest():
+            raise TransferError("checksum mismatch")
+    except BaseException:
+        os.remove(path)
+        raise
+    return header, path
+
+
+def sign(token, role, challenge, nonce):
+    """HMAC proving `role` ("worker" or "coordinator") knows the token, bound to both sides' nonces"""
+    return hmac.new(token.encode(), f"{role}:{challenge}:{nonce}".encode(), hashlib.sha256).hexdigest()
+
+
+def check_args(args):
+    """None if a job's ffmpeg options are all ones a merge sends, else what isn't allowed
+
+    Options come in flag/value pairs from ALLOWED_OPTIONS, and filter chains
+    only use ALLOWED_FILTERS, so a job can't name extra outputs or files.
+    """
+    if not isinstance(args, list) or len(args) % 2 or not all(isinstance(arg, str) for arg in args):
+        return "options are not flag/value pairs"
+    for option, value in zip(args[::2], args[1::2]):
+        if option not in ALLOWED_OPTIONS:
+            return f"option {option}"
+        if option in ("-vf", "-af"):
+            if any(c in value for c in ";[]'\\"):
+                return f"filter graph {value}"
+            for name in (part.split("=", 1)[0].strip() for part in value.split(",")):
+                if name not in ALLOWED_FILTERS:
+                    return f"filter {name}"
+    return None
+
+
+def encode_part(source, output, job, run=None):
+    """Run one clip's ffmpeg encode; returns the seconds it took"""
+    cmd = (["ffmpeg", "-y", "-v", "error", "-nostdin"] + job["input_args"] + ["-i", source]
+           + job["output_args"] + ["-f", "mp4", output])
+    started = time.monotonic()
+    if run:
+        run(cmd)
+    else:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return time.monotonic() - started
+
+
+def probe(path):
+    """Format duration and stream list of a file (ffprobe JSON)"""
+    result = subprocess.run(["ffprobe", "-v", "quiet", "-print_format", "json", "-show_entries",
+                             "format=duration:stream=codec_type,width,height", path],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def verify_part(path, job):
+    """None if an encoded part looks right for its job, else what is wrong with it"""
+    try:
+        info = probe(path)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        return f"unreadable ({e})"
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        return "no video stream"
+    if job.get("audio", True) and not any(s.get("codec_type") == "audio" for s in streams):
+        return "no audio stream"
+    if job.get("width") and (video.get("width"), video.get("height")) != (job["width"], job["height"]):
+        return f"{video.get('width')}x{video.get('height')} instead of {job['width']}x{job['height']}"
+    duration = float(info.get("format", {}).get("duration", 0))
+    if job.get("duration") and abs(duration - job["duration"]) > DURATION_TOLERANCE:
+        return f"{duration:.2f}s instead of {job['duration']:.2f}s"
+    return None
+
+
+def is_loopback(host):
+    """Whether every address `host` resolves to is a loopback one ("" and "0.0.0.0" are not)"""
+    if not host:
+        return False
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback for info in socket.getaddrinfo(host, None))
+    except (OSError, ValueError):
+        return False
+
+
+class Coordinator:
+    """Hands clip encodes to local threads and to workers that connect over TCP
+
+    Each job is a source file and the ffmpeg options for it. A remote worker
+    receives the file, encodes it and sends the part back. Both transfers are
+    checksummed, and the part is checked with ffprobe before it is accepted.
+    A job that fails, or whose worker disconnects, goes back in the queue for
+    another worker, up to MAX_ATTEMPTS. Listening beyond loopback needs a
+    token, since any worker that connects can put its parts in the merge.
+    """
+
+    def __init__(self, host=LISTEN_HOST, port=PORT, token=TOKEN, local_workers=1, workdir=None, run=None, log=print):
+        if not token and not is_loopback(host):
+            raise ValueError(f"refusing to accept workers on {host or 'all interfaces'} without a token")
+        self.token = token
+        self.local_workers = local_workers
+        self.workdir = workdir
+        self.run_local = run
+        self.log = log
+        self.listener = socket.create_server((host, port))
+        self.listener.settimeout(0.5)
+        self.port = self.listener.getsockname()[1]
+        self.cond = threading.Condition()
+        self.pending = collections.deque()
+        self.remaining = 0
+        self.failed = []
+        self.workers = set()
+        self.stats = {}  # Worker name -> counters for report()
+        self.closing = False
+        self.threads = []
+        self.accept_thread = threading.Thread(target=self._accept, name="merge-coordinator", daemon=True)
+        self.accept_thread.start()
+
+    def run(self, jobs):
+        """Encode every job into its "output" path; returns (wall seconds, failed jobs)"""
+        for job in jobs:
+            job.setdefault("attempts", 0)
+            job.setdefault("failed_on", set())
+        with self.cond:
+            self.pending.extend(jobs)
+            self.remaining = len(jobs)
+        for i in range(self.local_workers):
+            thread = threading.Thread(target=self._local, args=(f"local{i + 1}",), name=f"merge-local{i + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        started = time.monotonic()
+        with self.cond:
+            while self.remaining:
+                self.cond.wait(1)
+                idle = not self.workers and not self.local_workers
+                if idle and time.monotonic() - started > WORKER_WAIT and len(self.pending) == self.remaining:
+                    self.log(f"No merge workers connected within {WORKER_WAIT}s")
+                    self.failed.extend(self.pending)
+                    self.pending.clear()
+                    self.remaining = 0
+        return time.monotonic() - started, list(self.failed)
+
+    def stop(self):
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+        self.accept_thread.join(timeout=2)
+        self.listener.close()
+        for thread in self.threads:
+            thread.join(timeout=2)
+
+    def _stats(self, name):
+        return self.stats.setdefault(name, {"jobs": 0, "failed": 0, "media_seconds": 0.0, "encode_seconds": 0.0,
+                                            "busy_seconds": 0.0, "bytes_sent": 0, "bytes_received": 0})
+
+    def _next_job(self, name):
+        """The next job for a worker, skipping ones that already failed on it while others could take them"""
+        with self.cond:
+            while not self.closing and self.remaining:
+                active = self.workers | {f"local{i + 1}" for i in range(self.local_workers)}
+                for job in self.pending:
+                    if name not in job["failed_on"] or active <= job["failed_on"]:
+                        self.pending.remove(job)
+                        return job
+                self.cond.wait(0.5)
+            return None
+
+    def _finish(self, job, name, error=None):
+        with self.cond:
+            stats = self._stats(name)
+            if error is None:
+                self.remaining -= 1
+            else:
+                stats["failed"] += 1
+                job["attempts"] += 1
+                job["failed_on"].add(name)
+                job["error"] = error
+                self.log(f"Clip {job['id']} failed on {name} (attempt {job['attempts']}): {error}")
+                if job["attempts"] >= MAX_ATTEMPTS:
+                    self.failed.append(job)
+                    self.remaining -= 1
+                else:
+                    self.pending.append(job)
+            self.cond.notify_all()
+
+    def _accept_part(self, job, name, path, encode_seconds, started):
+        """Check a finished part and move it into place; returns an error or None"""
+        error = verify_part(path, job)
+        if error:
+            os.remove(path)
+            return f"verification: {error}"
+        os.replace(path, job["output"])
+        with self.cond:
+            stats = self._stats(name)
+            stats["jobs"] += 1
+            stats["media_seconds"] += job.get("duration") or 0
+            stats["encode_seconds"] += encode_seconds
+            stats["busy_seconds"] += time.monotonic() - started
+        return None
+
+    def _local(self, name):
+        while True:
+            job = self._next_job(name)
+            if job is None:
+                return
+            started = time.monotonic()
+            fd, path = tempfile.mkstemp(dir=self.workdir, suffix=".mp4")
+            os.close(fd)
+            try:
+                seconds = encode_part(job["source"], path, job, self.run_local)
+                error = self._accept_part(job, name, path, seconds, started)
+            except subprocess.CalledProcessError as e:
+                error = f"ffmpeg: {(e.stderr or '').strip()[-200:]}"
+            if error and os.path.exists(path):
+                os.remove(path)
+            self._finish(job, name, error)
+
+    def _accept(self):
+        while not self.closing:
+            try:
+                conn, address = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            thread = threading.Thread(target=self._serve, args=(conn, address), name="merge-worker", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _serve(self, conn, address):
+        name = None
+        try:
+            conn.settimeout(HANDSHAKE_TIMEOUT)
+            challenge = os.urandom(16).hex()
+            send_message(conn, {"type": "challenge", "nonce": challenge})
+            hello, _ = recv_message(conn, max_header=HELLO_MAX_HEADER, payload=False)
+            nonce = str(hello.get("nonce") or "")
+            if hello.get("type") != "hello" or not nonce or not hmac.compare_digest(
+                    str(hello.get("mac", "")), sign(self.token, "worker", challenge, nonce)):
+                send_message(conn, {"type": "reject", "reason": "bad token"})
+                self.log(f"Rejected merge worker from {address[0]}")
+                return
+            send_message(conn, {"type": "welcome", "mac": sign(self.token, "coordinator", challenge, nonce)})
+            with self.cond:
+                name = f"{hello.get('name') or 'worker'}@{address[0]}"
+                while name in self.workers:
+                    name += "'"
+                self.workers.add(name)
+                self._stats(name)
+                self.cond.notify_all()
+            self.log(f"Merge worker {name} joined ({hello.get('cpus', '?')} CPUs)")
+
+            while True:
+                job = self._next_job(name)
+                if job is None:
+                    send_message(conn, {"type": "done"})
+                    return
+                started = time.monotonic()
+                try:
+                    conn.settimeout(JOB_TIMEOUT)
+                    sent = send_message(conn, {"type": "job", "id": job["id"], "input_args": job["input_args"],
+                                               "output_args": job["output_args"],
+                                               "suffix": os.path.splitext(job["source"])[1]}, job["source"])
+                    reply, path = recv_message(conn, self.workdir)
+                except (OSError, TransferError, ValueError) as e:
+                    self._finish(job, name, f"connection lost ({e})")
+                    return  # The stream is in an unknown state; the worker reconnects
+                with self.cond:
+                    stats = self._stats(name)
+                    stats["bytes_sent"] += sent
+                    stats["bytes_received"] += reply.get("size", 0)
+                try:
+                    if reply.get("type") != "result" or path is None or reply.get("id") != job["id"]:
+                        self._finish(job, name, reply.get("error") or f"unexpected reply {reply.get('type')}")
+                        continue
+                    self._finish(job, name, self._accept_part(job, name, path, reply.get("encode_seconds", 0), started))
+                finally:
+                    if path and os.path.exists(path):
+                        os.remove(path)  # Rejected, or not moved into place
+        except (OSError, TransferError, ValueError, TypeError) as e:
+            self.log(f"Merge worker {name or address[0]}: {e}")
+        finally:
+            conn.close()
+            if name:
+                with self.cond:
+                    self.workers.discard(name)
+                    self.cond.notify_all()
+
+    def report(self, wall, baseline=None):
+        """Per-worker throughput and the overall speedup
+
+        Without a measured `baseline` (one machine encoding every clip in turn),
+        the speedup is estimated from the summed encode times.
+        """
+        mb = 1024 * 1024
+        print(f"{'worker':<24} {'clips':>5} {'failed':>6} {'media s':>8} {'x realtime':>10} {'busy %':>7} {'MB/s':>6}")
+        total_encode = 0.0
+        for name, s in sorted(self.stats.items()):
+            total_encode += s["encode_seconds"]
+            speed = s["media_seconds"] / s["encode_seconds"] if s["encode_seconds"] else 0
+            transfer = (s["bytes_sent"] + s["bytes_received"]) / mb / s["busy_seconds"] if s["busy_seconds"] else 0
+            print(f"{name:<24} {s['jobs']:>5} {s['failed']:>6} {s['media_seconds']:>8.1f} {speed:>10.2f} "
+                  f"{s['busy_seconds'] / wall * 100 if wall else 0:>6.0f}% {transfer:>6.1f}")
+        reference = baseline if baseline else total_encode
+        label = "measured" if baseline else "estimated from encode times"
+        print(f"Wall time {wall:.1f}s; one machine: {reference:.1f}s ({label}); "
+              f"speedup {reference / wall if wall else 0:.2f}x")
+        return reference / wall if wall else 0
+
+
+def handshake(sock, token, name):
+    """Authenticate with a coordinator both ways; returns None, or why the connection can't be used"""
+    challenge, _ = recv_message(sock, max_header=HELLO_MAX_HEADER, payload=False)
+    if challenge.get("type") != "challenge" or not challenge.get("nonce"):
+        return "not a merge coordinator"
+    nonce = os.urandom(16).hex()
+    send_message(sock, {"type": "hello", "name": name, "cpus": os.cpu_count(), "nonce": nonce,
+                        "mac": sign(token, "worker", str(challenge["nonce"]), nonce)})
+    welcome, _ = recv_message(sock, max_header=HELLO_MAX_HEADER, payload=False)
+    if welcome.get("type") == "reject":
+        return f"rejected: {welcome.get('reason')}"
+    if welcome.get("type") != "welcome" or not hmac.compare_digest(
+            str(welcome.get("mac", "")), sign(token, "coordinator", str(challenge["nonce"]), nonce)):
+        return "coordinator failed authentication"
+    return None
+
+
+def worker(host, port, token=TOKEN, name=None, workdir=None, once=False, flaky=0.0):
+    """Connect to a coordinator and encode the clips it sends, reconnecting until stopped (or once)
+
+    The token is never sent: both sides prove they know it, and jobs may only
+    use the options in ALLOWED_OPTIONS. `flaky` drops the connection on that
+    share of jobs, to exercise the coordinator's retries on localhost.
+    """
+    name = name or socket.gethostname()
+    while True:
+        dropped = False
+        try:
+            sock = socket.create_connection((host, port), timeout=HANDSHAKE_TIMEOUT)
+        except OSError as e:
+            if once:
+                print(f"[{name}] Could not reach {host}:{port}: {e}")
+                return
+            time.sleep(RECONNECT_DELAY)
+            continue
+        try:
+            problem = handshake(sock, token, name)
+            if problem:
+                print(f"[{name}] {host}:{port} {problem}")
+                if problem.startswith("rejected") or once:
+                    return
+                time.sleep(RECONNECT_DELAY)
+                continue
+            sock.settimeout(None)
+            while True:
+                job, source = recv_message(sock, workdir)
+                if job["type"] == "done":
+                    break
+                fd, output = tempfile.mkstemp(dir=workdir, suffix=".mp4")
+                os.close(fd)
+                try:
+                    problem = check_args(job.get("input_args")) or check_args(job.get("output_args"))
+                    if problem:
+                        print(f"[{name}] Refusing {job.get('id')}: {problem} not allowed")
+                        send_message(sock, {"type": "failed", "id": job.get("id"), "error": f"{problem} not allowed"})
+                        continue
+                    if flaky and random.random() < flaky:
+                        print(f"[{name}] Dropping the connection during {job['id']} (--flaky)")
+                        sock.shutdown(socket.SHUT_RDWR)
+                        dropped = True
+                        break
+                    try:
+                        seconds = encode_part(source, output, job)
+                    except subprocess.CalledProcessError as e:
+                        send_message(sock, {"type": "failed", "id": job["id"],
+                                            "error": f"ffmpeg: {(e.stderr or '').strip()[-200:]}"})
+                        continue
+                    send_message(sock, {"type": "result", "id": job["id"], "encode_seconds": round(seconds, 3)}, output)
+                    print(f"[{name}] {job['id']}: {seconds:.1f}s")
+                finally:
+                    for path in (source, output):
+                        if path and os.path.exists(path):
+                            os.remove(path)
+        except (OSError, TransferError, ValueError) as e:
+            print(f"[{name}] Connection lost: {e}")
+        finally:
+            sock.close()
+        if once and not dropped:
+            return
+        time.sleep(RECONNECT_DELAY)
+
+
+def bench_jobs(sources, output_dir, width, height):
+    """Normalization jobs like a merge's for a list of clips (scale/pad, fixed audio format)"""
+    jobs = []
+    for i, source in enumerate(sources):
+        duration = float(probe(source)["format"]["duration"])
+        jobs.append({
+            "id": os.path.basename(source), "source": source, "duration": duration, "width": width, "height": height,
+            "output": os.path.join(output_dir, f"part{i:04d}.mp4"), "input_args": [],
+            "output_args": ["-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                                   f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1",
+                            "-af", "aresample=48000", "-ac", "2", "-c:v", "libx264", "-preset", "medium",
+                            "-crf", "23", "-c:a", "aac"],
+        })
+    return jobs
+
+
+def bench(sources, workers=2, width=1280, height=720, flaky=0.0, baseline=True):
+    """Encode the clips with N worker processes on localhost, against one process doing them in turn"""
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = bench_jobs(sources, tmp, width, height)
+        print(f"{len(jobs)} clips, {sum(job['duration'] for job in jobs):.1f}s of media, {width}x{height}, "
+              f"{workers} workers on localhost, {os.cpu_count()} CPUs")
+        reference = None
+        if baseline:
+            started = time.monotonic()
+            for job in jobs:
+                encode_part(job["source"], os.path.join(tmp, "baseline.mp4"), job)
+            reference = time.monotonic() - started
+            print(f"One process, clips in turn: {reference:.1f}s")
+
+        token = "bench"
+        coordinator = Coordinator("127.0.0.1", 0, token, local_workers=0, workdir=tmp)
+        procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", "--host", "127.0.0.1",
+                                   "--port", str(coordinator.port), "--token", token, "--name", f"worker{i + 1}",
+                                   "--once", "--flaky", str(flaky)])
+                 for i in range(workers)]
+        try:
+            wall, failed = coordinator.run(jobs)
+        finally:
+            coordinator.stop()
+            for proc in procs:
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        if failed:
+            print(f"Failed: {', '.join(job['id'] for job in failed)}")
+        coordinator.report(wall, reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge workers: encode clips for merge_and_extract.py over TCP")
+    sub = parser.add_subparsers(dest="command", required=True)
+    w = sub.add_parser("worker", help="Connect to a coordinator and encode clips for it")
+    w.add_argument("--host", required=True, help="Machine running merge_and_extract.py --distributed")
+    w.add_argument("--port", type=int, default=PORT)
+    w.add_argument("--token", default=TOKEN)
+    w.add_argument("--name", default=None, help="Name in the coordinator's report (default: hostname)")
+    w.add_argument("--workdir", default=None, help="Where clips and parts are kept while encoding")
+    w.add_argument("--once", action="store_true", help="Exit after one merge instead of waiting for the next")
+    w.add_argument("--flaky", type=float, default=0.0, help="Testing: drop the connection on this share of jobs")
+    b = sub.add_parser("bench", help="Compare N local worker processes with one process on the same clips")
+    b.add_argument("clips", nargs="+", help="Video files")
+    b.add_argument("--workers", type=int, default=2)
+    b.add_argument("--size", default="1280x720", help="Output WIDTHxHEIGHT")
+    b.add_argument("--flaky", type=float, default=0.0, help="Share of jobs each worker drops (tests retries)")
+    b.add_argument("--no-baseline", action="store_true", help="Skip the one-process run")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        worker(args.host, args.port, args.token, args.name, args.workdir, args.once, args.flaky)
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        bench(args.clips, args.workers, width, height, args.flaky, not args.no_baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# === Configuration ===
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9105
+TEXTFILE_PATH = "/dev/shm/pi_video.prom"  # tmpfs, so exporting never writes to the SD card
+TEXTFILE_INTERVAL = 15  # Seconds between textfile writes / process samples
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Metric:
+    """Base for a metric family with optional labels"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if isinstance(labels, tuple):
+            return labels
+        return (labels,)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, labels=()):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def remove(self, labels=()):
+        with self.lock:
+            self.values.pop(self._key(labels), None)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self.values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and collectors; rendering happens off the hot path"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # Called before every render/textfile write
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class ProcessSampler:
+    """Samples CPU% and RSS of processes from /proc into gauges"""
+
+    def __init__(self, registry, prefix):
+        self.cpu = registry.gauge(f"{prefix}_cpu_percent", "Process CPU usage since last sample", ("process",))
+        self.rss = registry.gauge(f"{prefix}_rss_bytes", "Process resident set size", ("process",))
+        self.last = {}  # label -> (pid, cpu ticks, timestamp)
+
+    def sample(self, processes):
+        """processes: dict of label -> pid (or None when not running)"""
+        for label, pid in processes.items():
+            if pid is None:
+                self.last.pop(label, None)
+                self.cpu.remove(label)
+                self.rss.remove(label)
+                continue
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    # Fields after the command name, which may contain spaces
+                    fields = f.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/{pid}/statm") as f:
+                    rss_pages = int(f.read().split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            ticks = int(fields[11]) + int(fields[12])  # utime + stime
+            now = time.monotonic()
+            previous = self.last.get(label)
+            if previous and previous[0] == pid and now > previous[2]:
+                cpu = (ticks - previous[1]) / CLOCK_TICKS / (now - previous[2]) * 100
+                self.cpu.set(round(cpu, 1), label)
+            self.last[label] = (pid, ticks, now)
+            self.rss.set(rss_pages * PAGE_SIZE, label)
+
+
+def serve(registry, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics over HTTP from a daemon thread, returns the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            registry.collect()
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def write_textfile(registry, path=TEXTFILE_PATH):
+    """Atomically write the current metrics to a .prom textfile"""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+def start_textfile_writer(registry, path=TEXTFILE_PATH, interval=TEXTFILE_INTERVAL, stop_event=None):
+    """Collect and write the textfile every `interval` seconds from a daemon thread"""
+    stop_event = stop_event or threading.Event()
+
+    def run():
+        while not stop_event.wait(interval):
+            registry.collect()
+            try:
+                write_textfile(registry, path)
+            except OSError as e:
+                print(f"Metrics textfile error: {e}")
+
+    threading.Thread(target=run, name="metrics-textfile", daemon=True).start()
+    return stop_event
@@ -1,5 +1,7 @@
 from moviepy import VideoFileClip, concatenate_videoclips
 import os
+import mp4_layout
+import moviepy_pipe
 
 # === Configuration ===
 #VIDEO_FOLDER = "c:/Users/USER/Documents/raspberrypi/pi_video/"
@@ -10,6 +12,8 @@ VIDEO_FILES = [
     "video3.mp4"
 ]
 MERGED_VIDEO = "merged_videos.mp4"
+FRAGMENTED_OUTPUT = False  # Fragmented MP4 instead of moov-at-front (faststart)
+PIPE_WRITER = True  # Encode through moviepy_pipe.py: one multi-threaded ffmpeg, no temporary audio file
 
 def concatenate(video_clip_paths, output_path, method="compose"):
     """Concatenates several video files into one video file
@@ -31,7 +35,8 @@ def concatenate(video_clip_paths, output_path, method="compose"):
         # concatenate the final video with the compose method provided by moviepy
         final_clip = concatenate_videoclips(clips, method="compose")
     # write the output video file
-    final_clip.write_videofile(output_path)
+    moviepy_pipe.write_clip(final_clip, output_path, pipe=PIPE_WRITER,
+                            ffmpeg_params=mp4_layout.movflags_args(FRAGMENTED_OUTPUT))
 
 def get_video_info(video_path):
     """Get video information using moviepy"""
@@ -1,5 +1,8 @@
 from moviepy import VideoFileClip, concatenate_videoclips
 import os
+import mp4_layout
+import encode_budget
+import moviepy_pipe
 
 # === Configuration ===
 VIDEO_FOLDER = "c:/Users/USER/Documents/raspberrypi/pi_video/"
@@ -9,6 +12,9 @@ VIDEO_FILES = [
     "video3.mp4"
 ]
 MERGED_VIDEO = "merged_videos.mp4"
+FRAGMENTED_OUTPUT = False  # Fragmented MP4 instead of moov-at-front (faststart)
+PIPE_WRITER = True  # Encode through moviepy_pipe.py: one multi-threaded ffmpeg, no temporary audio file
+BACKGROUND = False  # Merging on a unit that is playing: limit threads/CPU/I/O and pause while app.py plays
 
 def get_video_info(video_path):
     """Get video information using moviepy"""
@@ -85,7 +91,19 @@ def merge_videos():
         
         # Write with minimal settings
         print(f"Writing merged video to {MERGED_VIDEO}...")
-        final_clip.write_videofile(MERGED_VIDEO)
+        if BACKGROUND:
+            # MoviePy runs ffmpeg itself: budget this process (children inherit it) and stop its ffmpegs during plays
+            budget = encode_budget.EncodeBudget()
+            budget.apply_to_self()
+            holding = budget.hold_children_while_playing()
+            try:
+                moviepy_pipe.write_clip(final_clip, MERGED_VIDEO, pipe=PIPE_WRITER, threads=budget.threads,
+                                        ffmpeg_params=mp4_layout.movflags_args(FRAGMENTED_OUTPUT))
+            finally:
+                holding.set()
+        else:
+            moviepy_pipe.write_clip(final_clip, MERGED_VIDEO, pipe=PIPE_WRITER,
+                                    ffmpeg_params=mp4_layout.movflags_args(FRAGMENTED_OUTPUT))
         
         # Clean up
         final_clip.close()
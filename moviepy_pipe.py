@@ -0,0 +1,176 @@
+import os
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+# === Configuration ===
+ENCODE_THREADS = os.cpu_count() or 1  # libx264 threads (encode_budget.py's cap applies in background mode)
+ENCODE_PRESET = "medium"  # libx264 preset, MoviePy's default; "veryfast" encodes ~3x faster for ~20-30% more bytes at the same CRF
+ENCODE_CRF = 23
+AUDIO_FPS = 44100  # MoviePy's default audio rate
+AUDIO_BITRATE = "192k"
+FRAME_QUEUE = 8  # Decoded frames buffered between the MoviePy thread and the ffmpeg writer
+AUDIO_CHUNK = 4096  # Samples per audio write
+
+
+def write_piped(clip, output_path, fps=None, threads=ENCODE_THREADS, preset=ENCODE_PRESET, crf=ENCODE_CRF,
+                ffmpeg_params=None, codec="libx264", audio_codec="aac"):
+    """Encode a MoviePy clip with one ffmpeg process fed through pipes, writing no temporary files
+
+    Video frames go to ffmpeg's stdin and audio samples to a second pipe, each
+    from its own thread, so MoviePy decodes and resizes the next frames while
+    ffmpeg encodes the last ones (write_videofile renders the audio to a temp
+    file on disk first and then runs a single encode thread).
+    """
+    fps = fps or clip.fps
+    width, height = clip.size
+    audio = clip.audio
+    audio_read, audio_write = os.pipe() if audio is not None else (None, None)
+
+    cmd = ["ffmpeg", "-y", "-v", "error", "-nostdin",
+           "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0"]
+    if audio is not None:
+        cmd += ["-f", "s16le", "-ar", str(AUDIO_FPS), "-ac", str(audio.nchannels), "-i", f"pipe:{audio_read}"]
+    cmd += ["-map", "0:v"] + (["-map", "1:a", "-c:a", audio_codec, "-b:a", AUDIO_BITRATE] if audio is not None else [])
+    cmd += ["-c:v", codec, "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p", "-threads", str(threads)]
+    cmd += list(ffmpeg_params or []) + [output_path]
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+                            pass_fds=(audio_read,) if audio is not None else ())
+    if audio is not None:
+        os.close(audio_read)
+    frames = queue.Queue(maxsize=FRAME_QUEUE)
+    stop = threading.Event()
+    errors = []
+
+    def decode():
+        try:
+            for frame in clip.iter_frames(fps=fps, dtype="uint8"):
+                if stop.is_set():
+                    break
+                frames.put(frame[:, :, :3].tobytes())
+        except Exception as e:
+            errors.append(e)
+        finally:
+            frames.put(None)
+
+    def write_audio():
+        try:
+            with os.fdopen(audio_write, "wb") as out:
+                for chunk in audio.iter_chunks(chunksize=AUDIO_CHUNK, fps=AUDIO_FPS, quantize=True, nbytes=2):
+                    out.write(chunk.tobytes())
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=decode, name="mpy-decode", daemon=True)]
+    if audio is not None:
+        workers.append(threading.Thread(target=write_audio, name="mpy-audio", daemon=True))
+    for worker in workers:
+        worker.start()
+
+    written = 0
+    try:
+        while True:
+            frame = frames.get()
+            if frame is None:
+                break
+            proc.stdin.write(frame)
+            written += 1
+    except BrokenPipeError:
+        pass  # ffmpeg exited; its error is reported below
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        stderr = proc.stderr.read()  # Only errors (-v error), so it can wait until the end
+        proc.wait()
+        stop.set()
+        while not frames.empty():  # Unblock the decode thread if ffmpeg stopped early
+            frames.get_nowait()
+        for worker in workers:
+            worker.join(timeout=5)
+    if errors:
+        raise errors[0]
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+    return written
+
+
+def write_clip(clip, output_path, pipe=True, threads=ENCODE_THREADS, preset=ENCODE_PRESET, ffmpeg_params=None):
+    """write_piped(), or MoviePy's own write_videofile() with the same threads and preset"""
+    if pipe:
+        return write_piped(clip, output_path, threads=threads, preset=preset, ffmpeg_params=ffmpeg_params)
+    clip.write_videofile(output_path, threads=threads, preset=preset, ffmpeg_params=ffmpeg_params)
+
+
+def _blocks_written():
+    """Bytes this process and its waited-for children have written to block devices"""
+    import resource
+    return sum(resource.getrusage(who).ru_oublock for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) * 512
+
+
+def benchmark(folder=None, clips=3, seconds=10, size="1280x720"):
+    """Time write_videofile() against write_piped() on synthetic clips, with bytes written to storage
+
+    The work folder has to be on a real disk (the SD card, not tmpfs), or
+    the kernel counts no writes.
+    """
+    from moviepy import VideoFileClip, concatenate_videoclips
+    work = tempfile.mkdtemp(prefix="mpy_bench_", dir=folder)
+    try:
+        paths = []
+        for i in range(clips):
+            path = os.path.join(work, f"clip{i + 1}.mp4")
+            subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30",
+                            "-f", "lavfi", "-i", f"sine=frequency={440 + 110 * i}", "-t", str(seconds),
+                            "-c:v", "libx264", "-c:a", "aac", "-shortest", path], check=True)
+            paths.append(path)
+        subprocess.run(["sync"])
+        print(f"{clips} clips of {seconds}s at {size}, {os.cpu_count()} CPUs, work folder {work}")
+
+        modes = [
+            ("write_videofile (defaults)", dict(pipe=False, threads=None, preset="medium")),
+            (f"write_videofile ({ENCODE_THREADS} threads, {ENCODE_PRESET})", dict(pipe=False)),
+            (f"piped ({ENCODE_THREADS} threads, {ENCODE_PRESET})", dict(pipe=True)),
+        ]
+        for name, options in modes:
+            sources = [VideoFileClip(p) for p in paths]
+            final = concatenate_videoclips(sources)
+            output = os.path.join(work, "out.mp4")
+            before = _blocks_written()
+            started = time.perf_counter()
+            write_clip(final, output, **options)
+            elapsed = time.perf_counter() - started
+            for clip in sources + [final]:
+                clip.close()
+            size_bytes = os.path.getsize(output)
+            os.sync()
+            written = _blocks_written() - before
+            print(f"  {name:<40} {elapsed:6.1f}s ({final.duration * final.fps / elapsed:5.1f} fps)  "
+                  f"written {written / (1024*1024):6.1f}MB for a {size_bytes / (1024*1024):.1f}MB output")
+            os.remove(output)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MoviePy's write_videofile against the piped writer")
+    parser.add_argument("--folder", help="Work folder (default: the system temp folder; use the SD card to count writes)")
+    parser.add_argument("--clips", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--size", default="1280x720")
+    args = parser.parse_args()
+    benchmark(args.folder, args.clips, args.seconds, args.size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import os
+import struct
+import bisect
+import argparse
+
+
+def read_boxes(f, start, end):
+    """Yield (type, offset, size, header_size) for boxes between start and end"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset  # Box runs to the end of the file
+        if size < header_size:
+            break
+        yield box_type, offset, size, header_size
+        offset += size
+
+
+def _read_full_box(f, offset, header_size, size):
+    """Read a full box payload, returns (version, flags, payload)"""
+    f.seek(offset + header_size)
+    data = f.read(size - header_size)
+    return data[0], int.from_bytes(data[1:4], "big"), data[4:]
+
+
+class Track:
+    """Per-sample timing and byte layout for one track"""
+
+    def __init__(self):
+        self.track_id = None
+        self.handler = None
+        self.timescale = 1
+        self.sample_times = []  # Decode timestamp of each sample, in timescale units
+        self.sample_offsets = []  # File offset of each sample
+        self.sample_sizes = []
+        self.sync_samples = None  # Sorted sample indexes, None means every sample is sync
+        self.trex = (0, 0, 0)  # Fragment defaults: duration, size, flags
+        self.last_duration = 0
+
+    @property
+    def is_video(self):
+        return self.handler == b"vide"
+
+    def sample_at(self, seconds):
+        """Index of the sample being decoded at the given time"""
+        ts = seconds * self.timescale
+        return max(0, bisect.bisect_right(self.sample_times, ts) - 1)
+
+    def sync_sample_before(self, index):
+        """Index of the nearest sync sample at or before the given sample"""
+        if self.sync_samples is None:
+            return index
+        pos = bisect.bisect_right(self.sync_samples, index) - 1
+        return self.sync_samples[max(pos, 0)]
+
+
+def _parse_stbl(f, track, start, end):
+    stts = stsc = stco = stsz = stss = None
+    for box_type, offset, size, header_size in read_boxes(f, start, end):
+        if box_type in (b"stts", b"stsc", b"stco", b"co64", b"stsz", b"stz2", b"stss"):
+            version, flags, payload = _read_full_box(f, offset, header_size, size)
+            if box_type == b"stts":
+                stts = payload
+            elif box_type == b"stsc":
+                stsc = payload
+            elif box_type in (b"stco", b"co64"):
+                stco = (box_type, payload)
+            elif box_type in (b"stsz", b"stz2"):
+                stsz = (box_type, payload)
+            elif box_type == b"stss":
+                stss = payload
+
+    if not (stts and stsc and stco and stsz):
+        return
+
+    # Sample sizes
+    kind, payload = stsz
+    if kind == b"stsz":
+        sample_size, count = struct.unpack(">II", payload[:8])
+        if sample_size:
+            sizes = [sample_size] * count
+        else:
+            sizes = list(struct.unpack(f">{count}I", payload[8:8 + 4 * count]))
+    else:
+        field_size, count = payload[3], struct.unpack(">I", payload[4:8])[0]
+        raw = payload[8:]
+        if field_size == 16:
+            sizes = list(struct.unpack(f">{count}H", raw[:2 * count]))
+        elif field_size == 8:
+            sizes = list(raw[:count])
+        else:
+            sizes = []
+            for i in range(count):
+                byte = raw[i // 2]
+                sizes.append(byte >> 4 if i % 2 == 0 else byte & 0x0F)
+
+    # Decode times
+    times = []
+    entries = struct.unpack(">I", stts[:4])[0]
+    t = 0
+    for i in range(entries):
+        count, delta = struct.unpack(">II", stts[4 + 8 * i:12 + 8 * i])
+        for _ in range(count):
+            times.append(t)
+            t += delta
+
+    # Chunk offsets
+    kind, payload = stco
+    count = struct.unpack(">I", payload[:4])[0]
+    if kind == b"stco":
+        chunk_offsets = struct.unpack(f">{count}I", payload[4:4 + 4 * count])
+    else:
+        chunk_offsets = struct.unpack(f">{count}Q", payload[4:4 + 8 * count])
+
+    # Sample-to-chunk mapping gives each sample's file offset
+    entries = struct.unpack(">I", stsc[:4])[0]
+    runs = [struct.unpack(">III", stsc[4 + 12 * i:16 + 12 * i]) for i in range(entries)]
+    offsets = []
+    sample = 0
+    for i, (first_chunk, per_chunk, _desc) in enumerate(runs):
+        last_chunk = runs[i + 1][0] - 1 if i + 1 < len(runs) else len(chunk_offsets)
+        for chunk in range(first_chunk, last_chunk + 1):
+            pos = chunk_offsets[chunk - 1]
+            for _ in range(per_chunk):
+                if sample >= len(sizes):
+                    break
+                offsets.append(pos)
+                pos += sizes[sample]
+                sample += 1
+
+    n = min(len(times), len(offsets), len(sizes))
+    track.sample_times = times[:n]
+    track.sample_offsets = offsets[:n]
+    track.sample_sizes = sizes[:n]
+
+    if stss is not None:
+        count = struct.unpack(">I", stss[:4])[0]
+        # stss is 1-based
+        track.sync_samples = [s - 1 for s in struct.unpack(f">{count}I", stss[4:4 + 4 * count])]
+
+
+def _parse_trak(f, start, end):
+    track = Track()
+    for box_type, offset, size, header_size in read_boxes(f, start, end):
+        if box_type == b"tkhd":
+            version, flags, payload = _read_full_box(f, offset, header_size, size)
+            track.track_id = struct.unpack(">I", payload[16:20] if version == 1 else payload[8:12])[0]
+        elif box_type == b"mdia":
+            for sub_type, sub_off, sub_size, sub_hdr in read_boxes(f, offset + header_size, offset + size):
+                if sub_type == b"mdhd":
+                    version, flags, payload = _read_full_box(f, sub_off, sub_hdr, sub_size)
+                    track.timescale = struct.unpack(">I", payload[16:20] if version == 1 else payload[8:12])[0]
+                elif sub_type == b"hdlr":
+                    version, flags, payload = _read_full_box(f, sub_off, sub_hdr, sub_size)
+                    track.handler = payload[4:8]
+                elif sub_type == b"minf":
+                    for stbl_type, stbl_off, stbl_size, stbl_hdr in read_boxes(f, sub_off + sub_hdr, sub_off + sub_size):
+                        if stbl_type == b"stbl":
+                            _parse_stbl(f, track, stbl_off + stbl_hdr, stbl_off + stbl_size)
+    return track
+
+
+def _parse_traf(f, index, moof_offset, start, end):
+    """Append the samples of one track fragment to its track"""
+    track = None
+    base_offset = moof_offset
+    default_duration = default_size = default_flags = 0
+    decode_time = None
+    for box_type, offset, size, header_size in read_boxes(f, start, end):
+        version, flags, payload = _read_full_box(f, offset, header_size, size)
+        if box_type == b"tfhd":
+            track_id = struct.unpack(">I", payload[:4])[0]
+            track = index.track(track_id)
+            if track is None:
+                return
+            default_duration, default_size, default_flags = track.trex
+            pos = 4
+            if flags & 0x1:
+                base_offset = struct.unpack(">Q", payload[pos:pos + 8])[0]
+                pos += 8
+            if flags & 0x2:
+                pos += 4
+            if flags & 0x8:
+                default_duration = struct.unpack(">I", payload[pos:pos + 4])[0]
+                pos += 4
+            if flags & 0x10:
+                default_size = struct.unpack(">I", payload[pos:pos + 4])[0]
+                pos += 4
+            if flags & 0x20:
+                default_flags = struct.unpack(">I", payload[pos:pos + 4])[0]
+        elif box_type == b"tfdt" and track is not None:
+            decode_time = struct.unpack(">Q" if version == 1 else ">I", payload[:8 if version == 1 else 4])[0]
+        elif box_type == b"trun" and track is not None:
+            count = struct.unpack(">I", payload[:4])[0]
+            pos = 4
+            data_offset = 0
+            first_flags = None
+            if flags & 0x1:
+                data_offset = struct.unpack(">i", payload[pos:pos + 4])[0]
+                pos += 4
+            if flags & 0x4:
+                first_flags = struct.unpack(">I", payload[pos:pos + 4])[0]
+                pos += 4
+            if decode_time is None:
+                decode_time = track.sample_times[-1] + track.last_duration if track.sample_times else 0
+            if track.sync_samples is None:
+                track.sync_samples = list(range(len(track.sample_times)))
+            sample_offset = base_offset + data_offset
+            for i in range(count):
+                duration, sample_size, sample_flags = default_duration, default_size, default_flags
+                if flags & 0x100:
+                    duration = struct.unpack(">I", payload[pos:pos + 4])[0]
+                    pos += 4
+                if flags & 0x200:
+                    sample_size = struct.unpack(">I", payload[pos:pos + 4])[0]
+                    pos += 4
+                if flags & 0x400:
+                    sample_flags = struct.unpack(">I", payload[pos:pos + 4])[0]
+                    pos += 4
+                if flags & 0x800:
+                    pos += 4
+                if i == 0 and first_flags is not None:
+                    sample_flags = first_flags
+                if not sample_flags & 0x10000:  # sample_is_non_sync_sample
+                    track.sync_samples.append(len(track.sample_times))
+                track.sample_times.append(decode_time)
+                track.sample_offsets.append(sample_offset)
+                track.sample_sizes.append(sample_size)
+                track.last_duration = duration
+                decode_time += duration
+                sample_offset += sample_size
+
+
+class Mp4Index:
+    """Top-level layout and sample tables of an MP4 file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        self.boxes = []  # (type, offset, size) of top-level boxes
+        self.tracks = []
+        self.fragments = []  # (moof offset, moof size) for fragmented files
+        with open(path, "rb") as f:
+            for box_type, offset, size, header_size in read_boxes(f, 0, self.file_size):
+                self.boxes.append((box_type, offset, size))
+                if box_type == b"moov":
+                    for sub_type, sub_off, sub_size, sub_hdr in read_boxes(f, offset + header_size, offset + size):
+                        if sub_type == b"trak":
+                            self.tracks.append(_parse_trak(f, sub_off + sub_hdr, sub_off + sub_size))
+                        elif sub_type == b"mvex":
+                            for ex_type, ex_off, ex_size, ex_hdr in read_boxes(f, sub_off + sub_hdr, sub_off + sub_size):
+                                if ex_type == b"trex":
+                                    version, flags, payload = _read_full_box(f, ex_off, ex_hdr, ex_size)
+                                    track = self.track(struct.unpack(">I", payload[:4])[0])
+                                    if track is not None:
+                                        track.trex = struct.unpack(">III", payload[8:20])
+                elif box_type == b"moof":
+                    self.fragments.append((offset, size))
+                    for sub_type, sub_off, sub_size, sub_hdr in read_boxes(f, offset + header_size, offset + size):
+                        if sub_type == b"traf":
+                            _parse_traf(f, self, offset, sub_off + sub_hdr, sub_off + sub_size)
+
+    def track(self, track_id):
+        """Track with the given id, or None"""
+        for track in self.tracks:
+            if track.track_id == track_id:
+                return track
+        return None
+
+    @property
+    def fragmented(self):
+        return bool(self.fragments)
+
+    def box(self, box_type):
+        """First top-level box of the given type as (offset, size), or None"""
+        for t, offset, size in self.boxes:
+            if t == box_type:
+                return offset, size
+        return None
+
+    def byte_ranges(self, start, end, merge_gap=64 * 1024):
+        """Byte ranges needed to decode [start, end) seconds, coalesced
+
+        Video tracks start from the sync sample before `start`, since the
+        decoder has to read from there to reach the first frame.
+        """
+        ranges = []
+        for track in self.tracks:
+            if not track.sample_times:
+                continue
+            first = track.sample_at(start)
+            if track.is_video:
+                first = track.sync_sample_before(first)
+            last = min(track.sample_at(end), len(track.sample_times) - 1)
+            for i in range(first, last + 1):
+                ranges.append((track.sample_offsets[i], track.sample_sizes[i]))
+        return coalesce(ranges, merge_gap)
+
+
+def coalesce(ranges, merge_gap=0):
+    """Merge (offset, length) ranges that overlap or sit within merge_gap bytes"""
+    merged = []
+    for offset, length in sorted(ranges):
+        if merged and offset <= merged[-1][0] + merged[-1][1] + merge_gap:
+            prev_offset, prev_length = merged[-1]
+            merged[-1] = (prev_offset, max(prev_length, offset + length - prev_offset))
+        else:
+            merged.append((offset, length))
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show MP4 layout and sample table summary")
+    parser.add_argument("video", help="MP4 file")
+    args = parser.parse_args()
+
+    index = Mp4Index(args.video)
+    print(f"{args.video}: {index.file_size / (1024*1024):.1f} MB")
+    for box_type, offset, size in index.boxes:
+        print(f"  {box_type.decode('latin-1')} @ {offset} ({size} bytes)")
+    if index.fragmented:
+        print(f"  {len(index.fragments)} fragments")
+    for track in index.tracks:
+        duration = track.sample_times[-1] / track.timescale if track.sample_times else 0
+        syncs = "all" if track.sync_samples is None else len(track.sync_samples)
+        print(f"  track {track.track_id} {track.handler.decode('latin-1') if track.handler else '?'}: "
+              f"{len(track.sample_times)} samples, {duration:.1f}s, sync samples: {syncs}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import os
+import subprocess
+import argparse
+
+from mp4_index import Mp4Index
+from prefetch import read_timings
+
+# === Configuration ===
+VIDEO_FOLDER = "/home/pi-five/pi_video"
+MERGED_VIDEO = "merged_videos.mp4"
+VIDEO_TIMINGS_FILE = "video_timings.txt"
+GOP_SECONDS = 2.0  # Longest distance between keyframes when re-encoding
+FRAME_INTERVAL = 1 / 24  # Longest expected frame duration (24 fps sources)
+FASTSTART_FLAGS = "+faststart"
+FRAGMENT_FLAGS = "+frag_keyframe+empty_moov+default_base_moof"
+
+
+def movflags_args(fragmented=False):
+    """ffmpeg args for the container layout: moov at the front, or fragmented"""
+    return ["-movflags", FRAGMENT_FLAGS if fragmented else FASTSTART_FLAGS]
+
+
+def keyframe_times(segment_starts, total_duration, gop_seconds=GOP_SECONDS, frame_interval=FRAME_INTERVAL):
+    """Keyframe times: every segment start, then at most gop_seconds apart
+
+    ffmpeg forces a keyframe on the first frame at or after each time, so the
+    times are pulled back by just under one frame. That way the frame on
+    screen at a segment's start time (the one a seek lands on) is the keyframe.
+    """
+    starts = sorted(segment_starts) + [total_duration]
+    times = []
+    for start, end in zip(starts, starts[1:]):
+        t = start
+        while t < end - 0.001:
+            times.append(round(max(0, t - frame_interval + 0.001), 3))
+            t += gop_seconds
+    return times
+
+
+def layout_args(segment_starts, total_duration, gop_seconds=GOP_SECONDS, fragmented=False, frame_interval=FRAME_INTERVAL):
+    """ffmpeg args for a re-encode: bounded GOP with keyframes on segment starts, plus layout
+
+    Segment starts should be the (rounded) values written to video_timings.txt,
+    since those are the times app.py seeks to. With a fragmented layout a new
+    fragment starts at every keyframe, so every segment starts a fragment.
+    """
+    times = keyframe_times(segment_starts, total_duration, gop_seconds, frame_interval)
+    return ["-force_key_frames", ",".join(str(t) for t in times)] + movflags_args(fragmented)
+
+
+def optimize(src, dst=None, fragmented=False):
+    """Remux a merged video (no re-encode) into the random-access layout, atomically"""
+    dst = os.path.realpath(dst or src)  # Keep merged_videos.mp4 a link into the current release
+    tmp = dst + ".layout.tmp.mp4"
+    cmd = ["ffmpeg", "-y", "-v", "error", "-i", src, "-map", "0", "-c", "copy"] + movflags_args(fragmented) + [tmp]
+    print(" ".join(cmd))
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Layout remux failed: {e.stderr}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    os.replace(tmp, dst)
+    return True
+
+
+def seek_cost(index, start):
+    """Bytes a cold seek to `start` has to read: (index bytes, preroll bytes, frames from keyframe)"""
+    preroll = 0
+    frames_from_key = 0
+    first_data_offset = None
+    for track in index.tracks:
+        if not track.sample_times:
+            continue
+        first = track.sample_at(start)
+        sync = track.sync_sample_before(first) if track.is_video else first
+        if track.is_video:
+            frames_from_key = first - sync
+        preroll += sum(track.sample_sizes[sync:first + 1])
+        offset = track.sample_offsets[sync]
+        if first_data_offset is None or offset < first_data_offset:
+            first_data_offset = offset
+
+    moov = index.box(b"moov")
+    index_bytes = moov[1] if moov else 0
+    if index.fragmented:
+        random_access = index.box(b"sidx") or index.box(b"mfra")
+        if random_access:
+            index_bytes += random_access[1]
+        elif first_data_offset is not None:
+            # No random access index: the demuxer walks every moof before the target
+            index_bytes += sum(size for offset, size in index.fragments if offset < first_data_offset)
+    return index_bytes, preroll, frames_from_key
+
+
+def index_location(index):
+    """Where the sample index lives: 'front', 'end' or 'fragmented'"""
+    if index.fragmented:
+        return "fragmented"
+    moov = index.box(b"moov")
+    mdat = index.box(b"mdat")
+    if moov is None:
+        return "missing"
+    return "front" if mdat is None or moov[0] < mdat[0] else "end"
+
+
+def inspect(video_path, segments):
+    """Print where the index lives and the worst-case bytes read per segment seek"""
+    index = Mp4Index(video_path)
+    location = index_location(index)
+    moov = index.box(b"moov")
+    print(f"{video_path}: {index.file_size / (1024*1024):.1f}MB, index at {location}"
+          f" (moov {moov[1] if moov else 0} bytes"
+          f"{f', {len(index.fragments)} fragments' if index.fragmented else ''})")
+    if location == "end":
+        print("  moov after mdat: every cold open seeks to the end of the file first")
+
+    print(f"{'segment':<12} {'start':>8} {'index':>10} {'preroll':>10} {'total':>10} {'frames':>7}")
+    worst = None
+    for seg in segments:
+        index_bytes, preroll, frames = seek_cost(index, seg["start"])
+        total = index_bytes + preroll
+        print(f"{seg['name']:<12} {seg['start']:>8} {index_bytes:>10} {preroll:>10} {total:>10} {frames:>7}")
+        if worst is None or total > worst[1]:
+            worst = (seg["name"], total)
+    if worst:
+        print(f"Worst case: {worst[0]} reads {worst[1] / 1024:.0f}KB before its first frame")
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize or inspect the merged video container layout")
+    parser.add_argument("command", choices=["inspect", "optimize"])
+    parser.add_argument("--video", default=os.path.join(VIDEO_FOLDER, MERGED_VIDEO), help="Merged video file")
+    parser.add_argument("--timings", default=os.path.join(VIDEO_FOLDER, VIDEO_TIMINGS_FILE), help="video_timings.txt")
+    parser.add_argument("--fragmented", action="store_true", help="Write a fragmented MP4 instead of faststart")
+    args = parser.parse_args()
+
+    if args.command == "optimize":
+        if optimize(args.video, fragmented=args.fragmented):
+            print(f"Layout optimized: {args.video}")
+        else:
+            return
+    inspect(args.video, read_timings(args.timings))
+
+if __name__ == "__main__":
+    main()
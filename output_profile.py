@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import glob
+import argparse
+import subprocess
+
+import get_timings
+
+# === Configuration ===
+VIDEO_FOLDER = "/home/pi-five/pi_video"
+PROFILE_FILE = "output_profile.json"  # In VIDEO_FOLDER; merge_and_extract.py encodes to it when present
+DEFAULT_PROFILE = {
+    "width": 1920,
+    "height": 1080,
+    "fps": 30,
+    "pix_fmt": "yuv420p",  # What the Pi's decoders and VLC's GL output take without a chroma converter
+    "sample_rate": 48000,  # HDMI audio runs at 48 kHz
+    "channels": 2,
+    "channel_layout": "stereo",
+}
+PLAYER_CHECK_SECONDS = 5
+# cvlc --verbose=2 lines naming a conversion stage it had to insert
+CONVERSION_PATTERN = re.compile(r'using (video converter|audio converter|audio resampler|chroma converter|'
+                                r'video filter|audio filter) module "([^"]+)"')
+PASSTHROUGH_MODULES = {"none", "dummy", "scaletempo", "trivial_channel_mixer"}  # Loaded on every play, no conversion
+
+
+def load_profile(path=None):
+    """The saved output profile, or None if there isn't one"""
+    path = path or os.path.join(VIDEO_FOLDER, PROFILE_FILE)
+    try:
+        with open(path) as f:
+            return dict(DEFAULT_PROFILE, **json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def save_profile(profile, path=None):
+    path = path or os.path.join(VIDEO_FOLDER, PROFILE_FILE)
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+    return path
+
+
+def _run(cmd):
+    try:
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def probe_display():
+    """Current display mode as {"width", "height", "refresh", "source"}, or None"""
+    # X11 (app.py runs cvlc on DISPLAY :0): the active mode is marked with '*'
+    env = dict(os.environ, DISPLAY=os.environ.get("DISPLAY", ":0"))
+    try:
+        xrandr = subprocess.run(["xrandr", "--current"], capture_output=True, text=True, timeout=5, env=env).stdout
+    except (OSError, subprocess.SubprocessError):
+        xrandr = ""
+    for line in xrandr.splitlines():
+        if "*" in line:
+            size = line.split()[0]
+            rate = re.search(r"([\d.]+)\*", line)
+            width, height = size.split("x")
+            return {"width": int(width), "height": int(height.rstrip("i")),
+                    "refresh": float(rate.group(1)) if rate else None, "source": "xrandr"}
+
+    # Legacy firmware display stack: "state 0xa [HDMI CEA (16) RGB lim 16:9], 1920x1080 @ 60.00Hz, progressive"
+    match = re.search(r"(\d+)x(\d+) @ ([\d.]+)Hz", _run(["tvservice", "-s"]))
+    if match:
+        return {"width": int(match.group(1)), "height": int(match.group(2)),
+                "refresh": float(match.group(3)), "source": "tvservice"}
+
+    # KMS console: the connected connector's preferred mode (no refresh rate here)
+    for status in sorted(glob.glob("/sys/class/drm/card*-HDMI-A-*/status")):
+        try:
+            with open(status) as f:
+                if f.read().strip() != "connected":
+                    continue
+            with open(os.path.join(os.path.dirname(status), "modes")) as f:
+                mode = f.readline().strip()
+        except OSError:
+            continue
+        match = re.match(r"(\d+)x(\d+)", mode)
+        if match:
+            return {"width": int(match.group(1)), "height": int(match.group(2)), "refresh": None, "source": "drm"}
+    return None
+
+
+def probe_sink():
+    """Default audio sink's native format as {"sample_rate", "channels", "source"}, or None"""
+    # PulseAudio / PipeWire: "0  alsa_output.platform-...hdmi-stereo  module-alsa-card.c  s16le 2ch 48000Hz  IDLE"
+    default = _run(["pactl", "get-default-sink"]).strip()
+    for line in _run(["pactl", "list", "sinks", "short"]).splitlines():
+        match = re.search(r"(\d+)ch (\d+)Hz", line)
+        if match and (not default or default in line):
+            return {"sample_rate": int(match.group(2)), "channels": int(match.group(1)), "source": "pactl"}
+
+    # Plain ALSA: the rates the HDMI device accepts; prefer 48 kHz
+    dump = _run(["aplay", "-D", "hw:0,0", "--dump-hw-params", "-d", "1", "/dev/zero"])
+    rate = re.search(r"RATE:\s*\[?(\d+)\s*(\d+)?", dump)
+    channels = re.search(r"CHANNELS:\s*\[?(\d+)", dump)
+    if rate:
+        low, high = int(rate.group(1)), int(rate.group(2) or rate.group(1))
+        native = 48000 if low <= 48000 <= high else low
+        return {"sample_rate": native, "channels": max(2, int(channels.group(1))) if channels else 2, "source": "aplay"}
+    return None
+
+
+def _multiple(rate, of):
+    """Whether `rate` is a whole multiple of `of` (within 0.5%, so 29.97 counts as 30)"""
+    k = rate / of
+    return round(k) >= 1 and abs(k - round(k)) < 0.005 * round(k)
+
+
+def matched_fps(refresh, source_fps):
+    """Frame rate for the display: the lowest rate dividing the refresh that repeats every source frame evenly
+
+    60 Hz shows 30 fps content as exact doubles (no judder and no rate
+    conversion in the player); 50 Hz suits 25, 59.94 Hz suits 29.97 and 144 Hz
+    shows 24 fps as it is. Sources faster than the display are halved (or
+    more) when their rate is a multiple of the refresh. Otherwise, e.g. 24 or
+    25 fps at 60 Hz, the source rate is kept: converting would drop or repeat
+    frames for good, which looks worse than the player's own cadence.
+    """
+    if not refresh:
+        return None
+    ntsc = abs(refresh * 1001 / 1000 - round(refresh * 1001 / 1000)) < 0.02  # 59.94, 29.97, 23.976
+    base = round(refresh * 1001 / 1000) if ntsc else round(refresh)
+    if not source_fps:
+        fps = base
+    else:
+        source_fps = min(source_fps, get_timings.MAX_FPS)
+        source = source_fps * 1001 / 1000 if ntsc else source_fps  # In the display's (whole-number) family
+        candidates = sorted(base // n for n in range(1, base + 1) if base % n == 0)
+        fps = next((c for c in candidates if c >= source * 0.995 and _multiple(c, source)), None)
+        if fps is None and _multiple(source, base):
+            fps = base
+        if fps is None:
+            return round(source_fps, 3)
+    return round(fps * 1000 / 1001, 3) if ntsc else fps
+
+
+def divides_refresh(fps, refresh):
+    """Whether every frame at `fps` lasts the same whole number of display refreshes"""
+    return bool(fps and refresh) and _multiple(refresh, float(fps))
+
+
+def suggest_profile(display=None, sink=None, source_fps=None):
+    """Output profile matched to the display mode and audio sink (defaults where they can't be probed)"""
+    profile = dict(DEFAULT_PROFILE)
+    if display:
+        profile["width"], profile["height"] = display["width"], display["height"]
+        profile["fps"] = matched_fps(display["refresh"], source_fps) or profile["fps"]
+    elif source_fps:
+        profile["fps"] = round(min(source_fps, get_timings.MAX_FPS), 3)
+    if sink:
+        profile["sample_rate"] = sink["sample_rate"]
+        profile["channels"] = sink["channels"]
+        profile["channel_layout"] = {1: "mono", 2: "stereo", 6: "5.1", 8: "7.1"}.get(sink["channels"], "stereo")
+    return profile
+
+
+def fps_expr(fps):
+    """ffmpeg rate for a profile fps: exact 30000/1001 style for the NTSC rates"""
+    fps = float(fps)
+    if fps != int(fps) and abs(fps * 1.001 - round(fps * 1.001)) < 0.01:
+        return f"{round(fps * 1.001) * 1000}/1001"
+    return f"{fps:g}"
+
+
+def video_filter(profile):
+    """Filter chain appended to each input's scale/pad so every frame has the profile's rate and format"""
+    return f"fps={fps_expr(profile['fps'])},format={profile['pix_fmt']}"
+
+
+def audio_filter(profile):
+    return (f"aresample={profile['sample_rate']},"
+            f"aformat=sample_rates={profile['sample_rate']}:channel_layouts={profile['channel_layout']}")
+
+
+def output_args(profile):
+    """Output options pinning the encoded streams to the profile"""
+    return ["-r", fps_expr(profile["fps"]), "-pix_fmt", profile["pix_fmt"],
+            "-ar", str(profile["sample_rate"]), "-ac", str(profile["channels"])]
+
+
+def probe_streams(video_path):
+    """Stream properties of a file, compared against a profile by check_file()"""
+    result = subprocess.run(["ffprobe", "-v", "quiet", "-show_entries",
+                             "stream=codec_type,width,height,pix_fmt,r_frame_rate,avg_frame_rate,"
+                             "sample_rate,channels,channel_layout",
+                             "-of", "json", video_path], capture_output=True, text=True, check=True)
+    info = {}
+    for stream in json.loads(result.stdout).get("streams", []):
+        if stream.get("codec_type") == "video" and "fps" not in info:
+            info.update(width=stream.get("width"), height=stream.get("height"), pix_fmt=stream.get("pix_fmt"),
+                        fps=get_timings.stream_fps(stream))
+        elif stream.get("codec_type") == "audio" and "sample_rate" not in info:
+            info.update(sample_rate=int(stream.get("sample_rate", 0)), channels=stream.get("channels"),
+                        channel_layout=stream.get("channel_layout"))
+    return info
+
+
+def check_file(video_path, profile):
+    """Mismatches between a file's streams and the profile, as ["field: file != profile"]"""
+    info = probe_streams(video_path)
+    problems = []
+    for field in ("width", "height", "pix_fmt", "sample_rate", "channels"):
+        if info.get(field) != profile[field]:
+            problems.append(f"{field}: {info.get(field)} != {profile[field]}")
+    if abs((info.get("fps") or 0) - float(profile["fps"])) > 0.01:
+        problems.append(f"fps: {info.get('fps')} != {profile['fps']}")
+    return problems
+
+
+def check_player(video_path, seconds=PLAYER_CHECK_SECONDS, start=0):
+    """Play with cvlc's debug log for a few seconds; returns the conversion stages it inserted"""
+    try:
+        result = subprocess.run([
+            "cvlc", "--verbose=2", "--play-and-exit", "--no-video-title-show", "--intf", "dummy",
+            f"--start-time={start}", f"--run-time={seconds}", video_path
+        ], capture_output=True, text=True, timeout=seconds + 20, env=dict(os.environ, DISPLAY=":0"))
+    except FileNotFoundError:
+        raise RuntimeError("cvlc not found")
+    except subprocess.TimeoutExpired as e:
+        result = e
+    stages = []
+    for line in (result.stderr or "").splitlines():
+        match = CONVERSION_PATTERN.search(line)
+        if match and match.group(2) not in PASSTHROUGH_MODULES and match.groups() not in stages:
+            stages.append(match.groups())
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suggest or check the merged video's output profile")
+    parser.add_argument("command", choices=["suggest", "check"])
+    parser.add_argument("video", nargs="?", default=os.path.join(VIDEO_FOLDER, "merged_videos.mp4"))
+    parser.add_argument("--folder", default=VIDEO_FOLDER, help="suggest: source videos (for their frame rate)")
+    parser.add_argument("--write", action="store_true", help=f"suggest: save as {PROFILE_FILE}")
+    parser.add_argument("--profile", help=f"Profile file (default: {PROFILE_FILE} in the video folder)")
+    parser.add_argument("--player", action="store_true", help="check: also play with cvlc and list conversion stages")
+    args = parser.parse_args()
+
+    if args.command == "suggest":
+        display = probe_display()
+        sink = probe_sink()
+        files = get_timings.discover_videos(args.folder) if os.path.isdir(args.folder) else []
+        results = get_timings.probe_all(args.folder, files)
+        rates = [info["fps"] for info in results.values() if info.get("fps")]
+        source_fps = max(rates) if rates else None
+        print(f"Display: {display or 'not detected'}")
+        print(f"Audio sink: {sink or 'not detected'}")
+        print(f"Sources: {len(files)} files, frame rates {sorted(set(rates)) or 'unknown'}")
+        profile = suggest_profile(display, sink, source_fps)
+        if display and source_fps and not divides_refresh(profile["fps"], display["refresh"]):
+            print(f"Keeping the sources' {profile['fps']} fps: no multiple of it divides the {display['refresh']} Hz "
+                  f"refresh evenly, so the player handles the cadence instead of the merge dropping or repeating frames")
+        print(json.dumps(profile, indent=2))
+        if args.write:
+            print(f"Saved {save_profile(profile, args.profile or os.path.join(args.folder, PROFILE_FILE))}")
+        return
+
+    profile = load_profile(args.profile)
+    if profile is None:
+        print(f"No {PROFILE_FILE}, checking against the default profile")
+        profile = DEFAULT_PROFILE
+    problems = check_file(args.video, profile)
+    print(f"{args.video}: {probe_streams(args.video)}")
+    print("Matches the profile" if not problems else "Differs from the profile: " + "; ".join(problems))
+    if args.player:
+        stages = check_player(args.video)
+        if stages:
+            for kind, module in stages:
+                print(f"  player inserted {kind}: {module}")
+        else:
+            print("Player ran with no conversion stages")
+
+if __name__ == "__main__":
+    main()
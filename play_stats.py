@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import socket
+import argparse
+import threading
+import collections
+
+# === Configuration ===
+PLAY_STATS_FILE = "/home/pi-five/pi_video/play_stats.jsonl"  # One JSON line per play
+ROLLING_PLAYS = 20  # Plays per segment in the rolling aggregates
+
+# Player counters kept per play: names from cvlc's rc "stats" output,
+# plus the warnings counted from its verbose output (frames_late, audio_late)
+COUNTERS = ("video_decoded", "frames_displayed", "frames_lost", "frames_late",
+            "buffers_played", "buffers_lost", "audio_late")
+
+
+def counter_delta(current, baseline=None):
+    """Counters accumulated since `baseline` (the player's counters run for the whole process)"""
+    baseline = baseline or {}
+    return {name: max(0, current.get(name, 0) - baseline.get(name, 0)) for name in COUNTERS if name in current}
+
+
+def lost_ratio(counters):
+    displayed = counters.get("frames_displayed", 0)
+    lost = counters.get("frames_lost", 0)
+    return lost / (displayed + lost) if displayed + lost else 0.0
+
+
+def underrun_ratio(counters):
+    played = counters.get("buffers_played", 0)
+    lost = counters.get("buffers_lost", 0)
+    return lost / (played + lost) if played + lost else 0.0
+
+
+class PlayStats:
+    """Per-segment play quality with rolling aggregates, appended to a JSON-lines file"""
+
+    def __init__(self, path=PLAY_STATS_FILE, window=ROLLING_PLAYS, unit=None):
+        self.path = path
+        self.unit = unit or socket.gethostname()
+        self.recent = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.lock = threading.Lock()
+
+    def record(self, segment, counters, rendition=None, seconds=None):
+        """Store one finished play; returns the record"""
+        record = {"time": round(time.time(), 1), "unit": self.unit, "segment": segment}
+        if rendition:
+            record["rendition"] = rendition
+        if seconds is not None:
+            record["seconds"] = round(seconds, 1)
+        record.update(counters)
+        with self.lock:
+            self.recent[segment].append(record)
+        if self.path:
+            try:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError:
+                pass
+        return record
+
+    def rolling(self, segment):
+        """Aggregate of the segment's recent plays"""
+        with self.lock:
+            plays = list(self.recent.get(segment, ()))
+        return aggregate(plays)
+
+
+def aggregate(plays):
+    """Sum counters over plays and derive loss/underrun ratios"""
+    totals = {name: sum(p.get(name, 0) for p in plays) for name in COUNTERS}
+    totals["plays"] = len(plays)
+    totals["lost_ratio"] = lost_ratio(totals)
+    totals["underrun_ratio"] = underrun_ratio(totals)
+    totals["worst_lost_ratio"] = max((lost_ratio(p) for p in plays), default=0.0)
+    return totals
+
+
+def read_records(paths, since=None):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is None or record.get("time", 0) >= since:
+                    records.append(record)
+    return records
+
+
+def report(records, key="segment"):
+    """Print aggregates grouped by `key` (segment, unit or rendition), worst first"""
+    groups = collections.defaultdict(list)
+    for record in records:
+        groups[record.get(key, "?")].append(record)
+    rows = sorted(((name, aggregate(plays)) for name, plays in groups.items()),
+                  key=lambda row: row[1]["lost_ratio"], reverse=True)
+    print(f"{key:<16} {'plays':>6} {'displayed':>10} {'lost':>7} {'lost%':>7} {'worst%':>7} {'late':>6} "
+          f"{'audio lost':>10} {'underrun%':>9} {'audio late':>10}")
+    for name, totals in rows:
+        print(f"{str(name):<16} {totals['plays']:>6} {totals['frames_displayed']:>10} {totals['frames_lost']:>7} "
+              f"{totals['lost_ratio'] * 100:>6.2f}% {totals['worst_lost_ratio'] * 100:>6.2f}% "
+              f"{totals['frames_late']:>6} {totals['buffers_lost']:>10} {totals['underrun_ratio'] * 100:>8.2f}% "
+              f"{totals['audio_late']:>10}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise per-play quality stats (from one or more units)")
+    parser.add_argument("files", nargs="*", default=[PLAY_STATS_FILE], help="play_stats.jsonl files")
+    parser.add_argument("--by", default="segment", choices=["segment", "unit", "rendition"])
+    parser.add_argument("--days", type=float, help="Only plays from the last N days")
+    args = parser.parse_args()
+
+    since = time.time() - args.days * 86400 if args.days else None
+    records = read_records([f for f in args.files if os.path.exists(f)], since)
+    if not records:
+        print("No plays recorded")
+        return
+    report(records, args.by)
+
+if __name__ == "__main__":
+    main()
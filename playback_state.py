@@ -0,0 +1,122 @@
+import threading
+
+# Playback states
+IDLE = "IDLE"  # Black screen, ready for a press
+ARMING = "ARMING"  # Press accepted, player being started
+PLAYING = "PLAYING"  # Player running the current segment
+ENDING = "ENDING"  # Segment time is up, waiting for the player to exit
+
+# What to do with a press that arrives while not idle
+POLICY_IGNORE = "ignore"  # Drop it (original behaviour)
+POLICY_QUEUE = "queue"  # Remember the latest one and play it when the current segment ends
+POLICY_SWITCH = "switch"  # Seek the running player to the new segment immediately
+POLICIES = (POLICY_IGNORE, POLICY_QUEUE, POLICY_SWITCH)
+
+# Results of request()
+START = "start"
+SWITCH = "switch"
+QUEUED = "queued"
+IGNORED = "ignored"
+
+
+class PlaybackStateMachine:
+    """Locked playback state shared by the main loop and timer threads
+
+    Every transition takes the lock and bumps `generation` when a new segment
+    takes over, so callbacks that belong to an earlier play (a late Timer,
+    a player that exits after being replaced) can tell they are stale.
+    """
+
+    def __init__(self, policy=POLICY_IGNORE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown playback policy: {policy}")
+        self.policy = policy
+        self.lock = threading.RLock()
+        self.state = IDLE
+        self.segment = None
+        self.queued = None
+        self.generation = 0
+
+    def request(self, segment):
+        """A press asked for `segment`; returns (result, generation)"""
+        with self.lock:
+            if self.state == IDLE:
+                self.state = ARMING
+                self.segment = segment
+                self.generation += 1
+                return START, self.generation
+            if self.policy == POLICY_IGNORE:
+                return IGNORED, self.generation
+            if self.policy == POLICY_SWITCH and self.state == PLAYING:
+                self.segment = segment
+                self.queued = None
+                self.generation += 1
+                return SWITCH, self.generation
+            # Queue policy, or a switch that arrives while the player is starting/ending
+            self.queued = segment
+            return QUEUED, self.generation
+
+    def queue(self, segment):
+        """Play `segment` once the current player has exited"""
+        with self.lock:
+            self.queued = segment
+
+    def started(self, generation):
+        """The player for `generation` is running"""
+        with self.lock:
+            if generation == self.generation and self.state == ARMING:
+                self.state = PLAYING
+                return True
+            return False
+
+    def start_failed(self, generation):
+        """The player for `generation` could not be started"""
+        with self.lock:
+            if generation == self.generation and self.state == ARMING:
+                self.state = IDLE
+                self.segment = None
+                return True
+            return False
+
+    def chain(self, generation, segment):
+        """Continuous play: the running player carries on into `segment`, or the queued one if a press queued one
+
+        Returns (segment, new generation), or None if `generation` is stale.
+        """
+        with self.lock:
+            if generation != self.generation or self.state != PLAYING:
+                return None
+            if self.queued is not None:
+                segment, self.queued = self.queued, None
+            self.segment = segment
+            self.generation += 1
+            return segment, self.generation
+
+    def end(self, generation):
+        """The segment's time is up (or its player exited); False if `generation` is stale"""
+        with self.lock:
+            if generation != self.generation or self.state not in (ARMING, PLAYING):
+                return False
+            self.state = ENDING
+            return True
+
+    def finish(self):
+        """The player has exited; returns the queued segment to start next, or None"""
+        with self.lock:
+            if self.queued is not None:
+                segment, self.queued = self.queued, None
+                self.state = ARMING
+                self.segment = segment
+                self.generation += 1
+                return segment
+            self.state = IDLE
+            self.segment = None
+            return None
+
+    @property
+    def busy(self):
+        return self.state != IDLE
+
+    def snapshot(self):
+        with self.lock:
+            return self.state, self.segment, self.queued, self.generation
@@ -0,0 +1,176 @@
+import os
+import math
+import socket
+import time
+import threading
+
+# === Configuration ===
+CONTROL_SOCKET = "/tmp/pi_video_vlc.sock"
+CONNECT_TIMEOUT = 2.0  # Seconds to wait for a freshly started cvlc to open its socket
+COMMAND_TIMEOUT = 0.5
+
+
+def control_args(socket_path=CONTROL_SOCKET):
+    """cvlc arguments that expose the remote-control interface on a unix socket"""
+    return ["--extraintf", "oldrc", f"--rc-unix={socket_path}", "--rc-fake-tty"]
+
+
+class VlcRemote:
+    """Client for cvlc's remote-control (oldrc) interface on a unix socket"""
+
+    def __init__(self, socket_path=CONTROL_SOCKET):
+        self.socket_path = socket_path
+        self.sock = None
+        self.lock = threading.Lock()  # The main loop and the stats sampler share the connection
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """Connect, retrying until cvlc has created its socket"""
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(COMMAND_TIMEOUT)
+                sock.connect(self.socket_path)
+                self.sock = sock
+                self._read_reply(0.05)  # Discard the greeting
+                return True
+            except OSError:
+                sock.close()
+                if time.monotonic() > deadline:
+                    return False
+                time.sleep(0.05)
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def _read_reply(self, wait):
+        chunks = []
+        self.sock.settimeout(wait)
+        try:
+            while True:
+                data = self.sock.recv(4096)
+                if not data:
+                    break
+                chunks.append(data)
+                self.sock.settimeout(0.02)  # Reply is complete once the socket goes quiet
+        except socket.timeout:
+            pass
+        return b"".join(chunks).decode(errors="replace")
+
+    def command(self, line, wait=COMMAND_TIMEOUT):
+        """Send one command, returns the reply text ('' if not connected)"""
+        with self.lock:
+            if self.sock is None and not self.connect():
+                return ""
+            try:
+                self.sock.sendall(line.encode() + b"\n")
+                return self._read_reply(wait)
+            except OSError:
+                self.close()
+                return ""
+
+    def seek(self, seconds):
+        """Seek to an absolute position; True if the command was sent
+
+        oldrc only takes whole seconds, so round up: better to skip the first
+        fraction of a segment than to show the tail of the previous one.
+        """
+        with self.lock:
+            if self.sock is None and not self.connect():
+                return False
+            try:
+                self.sock.sendall(f"seek {math.ceil(seconds)}\n".encode())
+                return True
+            except OSError:
+                self.close()
+                return False
+
+    def seek_precise(self, seconds, length):
+        """Seek to a fractional position given the media length; True if the command was sent
+
+        oldrc parses 'seek N%' as a float, so a percentage lands within a
+        frame where 'seek N' would round to whole seconds.
+        """
+        if not length:
+            return self.seek(seconds)
+        with self.lock:
+            if self.sock is None and not self.connect():
+                return False
+            try:
+                self.sock.sendall(f"seek {seconds / length * 100:.6f}%\n".encode())
+                return True
+            except OSError:
+                self.close()
+                return False
+
+    def get_time(self):
+        """Current position in seconds, or None"""
+        reply = self.command("get_time").strip().splitlines()
+        for line in reversed(reply):
+            line = line.strip("> ").strip()
+            if line.lstrip("-").isdigit():
+                return int(line)
+        return None
+
+    def stats(self):
+        """Counters from the 'stats' command, e.g. frames_displayed, frames_lost; {} if unavailable"""
+        counters = {}
+        for line in self.command("stats").splitlines():
+            key, sep, value = line.strip("|+ ").partition(":")
+            if not sep:
+                continue
+            number = value.split()[0] if value.split() else ""
+            try:
+                counters[key.strip().replace(" ", "_")] = float(number) if "." in number else int(number)
+            except ValueError:
+                continue
+        return counters
+
+    def stop(self):
+        self.command("stop", wait=0.05)
+
+    def quit(self):
+        self.command("quit", wait=0.05)
+        self.close()
+
+
+# Warnings in cvlc's verbose output that the rc stats don't cover
+LOG_PATTERNS = {
+    "frames_late": (b"picture is too late",),
+    "audio_late": (b"playback too late", b"buffer too late"),
+}
+
+
+class PlayerLogCounter:
+    """Counts late-picture and late-audio warnings in a player's verbose stderr on a reader thread"""
+
+    def __init__(self, stream):
+        self.counts = dict.fromkeys(LOG_PATTERNS, 0)
+        self.thread = threading.Thread(target=self._run, args=(stream,), name="player-log", daemon=True)
+        self.thread.start()
+
+    def _run(self, stream):
+        try:
+            for line in stream:
+                for key, patterns in LOG_PATTERNS.items():
+                    if any(p in line for p in patterns):
+                        self.counts[key] += 1
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
+
+    def snapshot(self):
+        return dict(self.counts)
+
+def remove_stale_socket(socket_path=CONTROL_SOCKET):
+    """cvlc refuses to bind if a socket file from a previous run is still there"""
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import socket
+import argparse
+import itertools
+import statistics
+import subprocess
+
+import player_control
+import play_stats
+from prefetch import read_timings
+
+# === Configuration ===
+VIDEO_FOLDER = "/home/pi-five/pi_video"
+MERGED_VIDEO = "merged_videos.mp4"
+VIDEO_TIMINGS_FILE = "video_timings.txt"
+TUNING_FILE = "/home/pi-five/pi_video/player_tuning.json"  # app.py adds the saved options to its cvlc command
+TUNING_SOCKET = "/tmp/pi_video_tune.sock"
+# Settings tried; the first value of each is VLC's default
+FILE_CACHING = [300, 100, 600, 1200]  # --file-caching (ms read ahead before playback starts)
+DECODER_THREADS = [0, 1, 2, 4]  # --avcodec-threads (0 = VLC picks)
+VIDEO_OUTPUTS = ["", "gles2", "xcb_x11", "drm_vout"]  # --vout ("" = VLC picks)
+TRIAL_SECONDS = 6  # Seconds played per trial
+TRIAL_SEGMENTS = 3  # Segment starts per setting, spread over the file
+MAX_LOST_RATIO = 0.01  # Settings losing more frames than this are only picked if nothing does better
+STARTUP_TIMEOUT = 10  # Seconds to wait for the first frame
+
+# The parts of app.py's cvlc command that affect decode and display
+BASE_ARGS = ["--fullscreen", "--no-osd", "--play-and-exit", "--no-video-title-show", "--no-snapshot-preview",
+             "--no-spu", "--no-disable-screensaver", "--audio-desync=0", "--no-audio-time-stretch",
+             "--no-interact", "--no-mouse-events"]
+DEFAULT_TUNING = {"file_caching": FILE_CACHING[0], "decoder_threads": DECODER_THREADS[0], "vout": VIDEO_OUTPUTS[0]}
+
+
+def load_tuning(path=TUNING_FILE):
+    """Saved settings as a dict (see DEFAULT_TUNING), or None"""
+    try:
+        with open(path) as f:
+            return dict(DEFAULT_TUNING, **json.load(f)["settings"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def player_args(tuning):
+    """cvlc options for a set of tuned settings (nothing for VLC's defaults)"""
+    if not tuning:
+        return []
+    args = []
+    if tuning.get("file_caching") and tuning["file_caching"] != FILE_CACHING[0]:
+        args.append(f"--file-caching={tuning['file_caching']}")
+    if tuning.get("decoder_threads"):
+        args.append(f"--avcodec-threads={tuning['decoder_threads']}")
+    if tuning.get("vout"):
+        args.append(f"--vout={tuning['vout']}")
+    return args
+
+
+def device_model():
+    try:
+        with open("/proc/device-tree/model") as f:
+            return f.read().strip("\0\n ")
+    except OSError:
+        return "unknown"
+
+
+def trial(video_path, start, tuning, seconds=TRIAL_SECONDS):
+    """Play `seconds` from `start` with the settings; returns first-frame latency and frame counters
+
+    The first frame is the moment cvlc's displayed-frames counter (polled
+    through its control socket) leaves zero, so socket startup is included
+    the same way for every setting.
+    """
+    player_control.remove_stale_socket(TUNING_SOCKET)
+    cmd = (["cvlc"] + BASE_ARGS + player_args(tuning) + [f"--start-time={start}", f"--stop-time={start + seconds}",
+           "--intf", "dummy"] + player_control.control_args(TUNING_SOCKET) + ["--verbose=1", video_path])
+    started = time.monotonic()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                            env=dict(os.environ, DISPLAY=os.environ.get("DISPLAY", ":0")))
+    log_counter = player_control.PlayerLogCounter(proc.stderr)
+    remote = player_control.VlcRemote(TUNING_SOCKET)
+    first_frame = None
+    counters = {}
+    try:
+        remote.connect(timeout=STARTUP_TIMEOUT)
+        deadline = started + STARTUP_TIMEOUT + seconds
+        while proc.poll() is None and time.monotonic() < deadline:
+            stats = remote.stats()
+            if stats:
+                counters = stats
+                if first_frame is None and stats.get("frames_displayed", 0) > 0:
+                    first_frame = time.monotonic() - started
+            time.sleep(0.02 if first_frame is None else 0.5)
+    finally:
+        remote.quit()
+        try:
+            proc.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    counters = play_stats.counter_delta(dict(counters, **log_counter.snapshot()))
+    return {"first_frame": first_frame, "failed": first_frame is None or proc.returncode not in (0, None),
+            "lost_ratio": play_stats.lost_ratio(counters), "late": counters.get("frames_late", 0),
+            "displayed": counters.get("frames_displayed", 0)}
+
+
+def evaluate(video_path, starts, tuning, seconds=TRIAL_SECONDS):
+    """Trials at each start; returns the median first frame, worst lost ratio and late frames"""
+    results = [trial(video_path, start, tuning, seconds) for start in starts]
+    if any(r["failed"] for r in results):
+        return {"failed": True}
+    return {"failed": False,
+            "first_frame": round(statistics.median(r["first_frame"] for r in results), 3),
+            "worst_first_frame": round(max(r["first_frame"] for r in results), 3),
+            "lost_ratio": round(max(r["lost_ratio"] for r in results), 4),
+            "late": sum(r["late"] for r in results)}
+
+
+def rank(result):
+    """Sort key: working settings that keep frames first, then the fastest first frame"""
+    if result["failed"]:
+        return (2, 0, 0)
+    return (0 if result["lost_ratio"] <= MAX_LOST_RATIO else 1, result["first_frame"], result["lost_ratio"])
+
+
+def trial_starts(segments, count=TRIAL_SEGMENTS):
+    """Segment starts spread over the file (first, last and evenly between)"""
+    if len(segments) <= count:
+        return [seg["start"] for seg in segments]
+    step = (len(segments) - 1) / (count - 1)
+    return [segments[round(i * step)]["start"] for i in range(count)]
+
+
+def tune(video_path, segments, full=False, seconds=TRIAL_SECONDS):
+    """Best settings for this device and file, plus every measurement
+
+    By default one setting is varied at a time, keeping the best value found
+    so far for the others (about a dozen trials); full=True tries the whole
+    matrix.
+    """
+    starts = trial_starts(segments)
+    measured = {}
+
+    def measure(tuning):
+        key = json.dumps(tuning, sort_keys=True)
+        if key not in measured:
+            result = evaluate(video_path, starts, tuning, seconds)
+            measured[key] = (tuning, result)
+            status = "failed" if result["failed"] else (
+                f"first frame {result['first_frame'] * 1000:.0f}ms (worst {result['worst_first_frame'] * 1000:.0f}ms), "
+                f"lost {result['lost_ratio']:.2%}, late {result['late']}")
+            print(f"  {' '.join(player_args(tuning)) or '(VLC defaults)':<60} {status}")
+        return measured[key][1]
+
+    dimensions = [("file_caching", FILE_CACHING), ("decoder_threads", DECODER_THREADS), ("vout", VIDEO_OUTPUTS)]
+    if full:
+        for values in itertools.product(*(options for _, options in dimensions)):
+            measure(dict(zip((name for name, _ in dimensions), values)))
+    else:
+        best = dict(DEFAULT_TUNING)
+        for name, options in dimensions:
+            results = {value: measure(dict(best, **{name: value})) for value in options}
+            best[name] = min(options, key=lambda value: rank(results[value]))
+
+    tuning, result = min(measured.values(), key=lambda item: rank(item[1]))
+    return tuning, result, list(measured.values())
+
+
+def save_tuning(tuning, result, measured, video_path, path=TUNING_FILE):
+    record = {"settings": tuning, "result": result, "device": device_model(), "host": socket.gethostname(),
+              "video": os.path.basename(video_path), "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+              "trials": [{"settings": t, "result": r} for t, r in measured]}
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(record, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cvlc caching/decoder-thread/output settings on this unit")
+    parser.add_argument("--video", default=os.path.join(VIDEO_FOLDER, MERGED_VIDEO), help="Merged video file")
+    parser.add_argument("--timings", default=os.path.join(VIDEO_FOLDER, VIDEO_TIMINGS_FILE), help="video_timings.txt")
+    parser.add_argument("--seconds", type=float, default=TRIAL_SECONDS, help="Seconds played per trial")
+    parser.add_argument("--full", action="store_true", help="Try every combination instead of one setting at a time")
+    parser.add_argument("--output", default=TUNING_FILE)
+    parser.add_argument("--no-save", action="store_true", help="Only print the results")
+    args = parser.parse_args()
+
+    segments = read_timings(args.timings)
+    print(f"Tuning cvlc on {device_model()} with {args.video}, "
+          f"starts {trial_starts(segments)}, {args.seconds:g}s per trial")
+    try:
+        tuning, result, measured = tune(args.video, segments, args.full, args.seconds)
+    except FileNotFoundError:
+        print("cvlc not found")
+        return
+    if result["failed"]:
+        print("Every setting failed to show a frame; is cvlc installed and the display available?")
+        return
+    default = next((r for t, r in measured if t == DEFAULT_TUNING), None)
+    print(f"Best: {' '.join(player_args(tuning)) or 'VLC defaults'}: first frame {result['first_frame'] * 1000:.0f}ms, "
+          f"lost {result['lost_ratio']:.2%}"
+          + (f" (defaults: {default['first_frame'] * 1000:.0f}ms, lost {default['lost_ratio']:.2%})"
+             if default and not default["failed"] else ""))
+    if not args.no_save:
+        print(f"Saved {save_tuning(tuning, result, measured, args.video, args.output)}; app.py uses it from the next start")
+
+if __name__ == "__main__":
+    main()
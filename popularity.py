@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import collections
+
+import prefetch
+import seek_bench
+from mp4_index import Mp4Index
+from prefetch import read_timings
+
+# === Configuration ===
+VIDEO_FOLDER = "/home/pi-five/pi_video"
+MERGED_VIDEO = "merged_videos.mp4"
+VIDEO_TIMINGS_FILE = "video_timings.txt"
+PLAY_COUNTS_FILE = "/home/pi-five/pi_video/play_counts.json"  # Kept outside the releases, so counts survive rebuilds
+SAVE_INTERVAL = 60  # Seconds between writes of the counts while app.py runs
+SOURCE_PREFIX = "# source "  # video_timings.txt comment line: "# source <segment name>: <source file>"
+HOT_FRACTION = 0.8  # The hot set is the most-played segments that account for this share of plays
+# Page-cache model for the comparison: LRU over readahead-sized blocks, with the next block read ahead on a miss
+CACHE_MB = 64
+READAHEAD_KB = 128
+TRACE_PLAYS = 2000  # Plays replayed through the model, drawn by play count
+TRACE_SEED = 1
+
+
+def load_counts(path=PLAY_COUNTS_FILE):
+    """Plays per source file (or segment name, for timings without source lines)"""
+    try:
+        with open(path) as f:
+            return {key: int(value) for key, value in json.load(f)["plays"].items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return {}
+
+
+def read_sources(timings_path):
+    """Segment name -> source file, from the source lines merge_and_extract.py writes into video_timings.txt"""
+    sources = {}
+    try:
+        with open(timings_path) as f:
+            for line in f:
+                if line.startswith(SOURCE_PREFIX):
+                    name, _, source = line[len(SOURCE_PREFIX):].rstrip("\n").partition(": ")
+                    if source:
+                        sources[name] = source
+    except OSError:
+        pass
+    return sources
+
+
+class PlayCounts:
+    """Per-segment play counts, stored by source file so they still apply after a rebuild reorders the file"""
+
+    def __init__(self, path=PLAY_COUNTS_FILE, save_interval=SAVE_INTERVAL):
+        self.path = path
+        self.save_interval = save_interval
+        self.sources = {}  # Segment name -> source file of the media in use
+        self.plays = collections.Counter(load_counts(path) if path else {})
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.saved_at = time.monotonic()
+
+    def use_timings(self, timings_path):
+        """Map segment names through the source lines of the timings in use"""
+        self.sources = read_sources(timings_path)
+
+    def record(self, name):
+        with self.lock:
+            self.plays[self.sources.get(name, name)] += 1
+            self.dirty = True
+
+    def save_if_due(self):
+        if self.dirty and time.monotonic() - self.saved_at >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Write the counts (atomically); nothing to do without a path or new plays"""
+        with self.lock:
+            if not self.path or not self.dirty:
+                return False
+            record = {"plays": dict(self.plays.most_common()), "updated": time.strftime("%Y-%m-%d %H:%M:%S")}
+            self.dirty = False
+        self.saved_at = time.monotonic()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(record, f, indent=2)
+            os.replace(tmp, self.path)
+            return True
+        except OSError as e:
+            print(f"Could not save play counts to {self.path}: {e}")
+            return False
+
+
+def popularity_order(files, counts):
+    """Source files with the most played first; unplayed and tied files keep their order"""
+    return sorted(files, key=lambda name: -counts.get(name, 0))
+
+
+def segment_weights(segments, counts, sources):
+    """Plays per segment name, from counts kept by source file or by name"""
+    return {seg["name"]: counts.get(sources.get(seg["name"], seg["name"]), counts.get(seg["name"], 0))
+            for seg in segments}
+
+
+def hot_set(weights, fraction=HOT_FRACTION):
+    """Most-played segment names that together account for `fraction` of all plays"""
+    total = sum(weights.values())
+    names = []
+    covered = 0
+    for name, plays in sorted(weights.items(), key=lambda item: -item[1]):
+        if total and covered >= fraction * total or not plays:
+            break
+        names.append(name)
+        covered += plays
+    return names
+
+
+def hot_span(ranges, names):
+    """(bytes of the hot segments, bytes from the first to the last of them in the file)"""
+    spans = [(offset, offset + length) for name in names for offset, length in ranges[name]]
+    if not spans:
+        return 0, 0
+    return sum(end - start for start, end in spans), max(end for _, end in spans) - min(start for start, _ in spans)
+
+
+def play_trace(weights, plays=TRACE_PLAYS, seed=TRACE_SEED):
+    """Segment names drawn with probability proportional to their play counts"""
+    names = [name for name, count in weights.items() if count > 0]
+    if not names:
+        return []
+    return random.Random(seed).choices(names, weights=[weights[name] for name in names], k=plays)
+
+
+def simulate_cache(ranges, trace, cache_bytes=CACHE_MB * 1024 * 1024, block=READAHEAD_KB * 1024):
+    """Fraction of blocks already cached when a play reads them, for an LRU cache of `cache_bytes`
+
+    Blocks are readahead-sized. A miss also brings in the following block,
+    like the kernel's readahead, so a hot segment's neighbour gets cached
+    with it whether or not it is ever played.
+    """
+    capacity = max(1, cache_bytes // block)
+    cache = collections.OrderedDict()
+
+    def load(b):
+        cache[b] = True
+        cache.move_to_end(b)
+        while len(cache) > capacity:
+            cache.popitem(last=False)
+
+    blocks = {name: sorted({b for offset, length in rs for b in range(offset // block, (offset + length - 1) // block + 1)})
+              for name, rs in ranges.items()}
+    hits = total = 0
+    for name in trace:
+        for b in blocks[name]:
+            total += 1
+            if b in cache:
+                hits += 1
+                cache.move_to_end(b)
+            else:
+                load(b)
+                load(b + 1)
+    return hits / total if total else 0.0
+
+
+def cold_seeks(video_path, segments, names, runs=1):
+    """Median cold first-frame time (ffmpeg startup removed) per segment name"""
+    startup = seek_bench.ffmpeg_startup()
+    starts = {seg["name"]: seg["start"] for seg in segments}
+    results = {}
+    for name in names:
+        times = []
+        for _ in range(runs):
+            seek_bench.drop_cache(video_path)
+            times.append(seek_bench.ffmpeg_first_frame(video_path, starts[name]) - startup)
+        results[name] = max(0.0, sorted(times)[len(times) // 2])
+    return results
+
+
+def measure_layout(release_dir, counts, cache_bytes, runs, seek=True):
+    """Hot-set size and span, modelled cache hit rate and play-weighted cold seek time of one build"""
+    video = os.path.join(release_dir, MERGED_VIDEO)
+    timings = os.path.join(release_dir, VIDEO_TIMINGS_FILE)
+    segments = read_timings(timings)
+    weights = segment_weights(segments, counts, read_sources(timings))
+    ranges = prefetch.segment_byte_ranges(Mp4Index(video), segments)
+    hot = hot_set(weights)
+    hot_bytes, span = hot_span(ranges, hot)
+    result = {"video": video, "weights": weights, "hot": hot, "hot_bytes": hot_bytes, "hot_span": span,
+              "order": [seg["name"] for seg in sorted(segments, key=lambda seg: seg["start"])],
+              "hit_rate": simulate_cache(ranges, play_trace(weights), cache_bytes)}
+    if seek:
+        played = [name for name in weights if weights[name] > 0]
+        seeks = cold_seeks(video, segments, played, runs)
+        total = sum(weights[name] for name in played)
+        result["seeks"] = seeks
+        result["cold_seek"] = sum(seeks[name] * weights[name] for name in played) / total if total else None
+    return result
+
+
+def compare(before_dir, after_dir, counts, cache_mb=CACHE_MB, runs=1, seek=True):
+    """Print the layout measurements of two builds of the same clips side by side"""
+    cache_bytes = int(cache_mb * 1024 * 1024)
+    before = measure_layout(before_dir, counts, cache_bytes, runs, seek)
+    after = measure_layout(after_dir, counts, cache_bytes, runs, seek)
+    mb = 1024 * 1024
+    print(f"Plays: {', '.join(f'{name} {plays}' for name, plays in sorted(after['weights'].items(), key=lambda i: -i[1]))}")
+    print(f"Hot set ({HOT_FRACTION:.0%} of plays): {', '.join(after['hot'])}; "
+          f"cache model {cache_mb:g}MB LRU, {READAHEAD_KB}KB readahead, {TRACE_PLAYS} plays")
+    print(f"{'':<14} {'order':<40} {'hot MB':>8} {'span MB':>8} {'hit rate':>9} {'cold seek':>10}")
+    for label, result in (("before", before), ("after", after)):
+        order = " ".join(result["order"])
+        order = order if len(order) <= 40 else order[:37] + "..."
+        seek_time = f"{result['cold_seek'] * 1000:.0f}ms" if result.get("cold_seek") is not None else "-"
+        print(f"{label:<14} {order:<40} {result['hot_bytes'] / mb:>8.1f} {result['hot_span'] / mb:>8.1f} "
+              f"{result['hit_rate']:>8.1%} {seek_time:>10}")
+    if seek:
+        print(f"{'segment':<12} {'plays':>6} {'before':>9} {'after':>9}")
+        for name in sorted(after["seeks"], key=lambda n: -after["weights"][n]):
+            print(f"{name:<12} {after['weights'][name]:>6} {before['seeks'].get(name, 0) * 1000:>7.0f}ms "
+                  f"{after['seeks'][name] * 1000:>7.0f}ms")
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment play counts, and what a popularity-ordered layout changes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="Print play counts by segment of the current build")
+    show.add_argument("--timings", default=os.path.join(VIDEO_FOLDER, VIDEO_TIMINGS_FILE))
+    cmp = sub.add_parser("compare", help="Compare two release folders (e.g. releases/<old> and current)")
+    cmp.add_argument("--before", required=True, help="Release folder with the old layout")
+    cmp.add_argument("--after", default=os.path.join(VIDEO_FOLDER, "current"), help="Release folder with the new layout")
+    cmp.add_argument("--cache-mb", type=float, default=CACHE_MB, help="Page cache available to the video in the model")
+    cmp.add_argument("--runs", type=int, default=1, help="Cold seeks per segment (median)")
+    cmp.add_argument("--no-seek", action="store_true", help="Skip the timed cold seeks")
+    for p in (show, cmp):
+        p.add_argument("--counts", default=PLAY_COUNTS_FILE)
+    args = parser.parse_args()
+
+    counts = load_counts(args.counts)
+    if not counts:
+        print(f"No play counts in {args.counts}")
+        return
+    if args.command == "show":
+        segments = read_timings(args.timings)
+        weights = segment_weights(segments, counts, read_sources(args.timings))
+        hot = hot_set(weights)
+        for seg in sorted(segments, key=lambda seg: -weights[seg["name"]]):
+            print(f"{seg['name']:<12} {weights[seg['name']]:>6} plays  at {seg['start']:>8}s"
+                  f"{'  hot' if seg['name'] in hot else ''}")
+        return
+    compare(args.before, args.after, counts, args.cache_mb, args.runs, not args.no_seek)
+
+if __name__ == "__main__":
+    main()
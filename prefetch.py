@@ -0,0 +1,259 @@
+import os
+import ast
+import mmap
+import shutil
+import ctypes
+import ctypes.util
+import threading
+import argparse
+
+from mp4_index import Mp4Index
+
+# === Configuration ===
+MERGED_VIDEO = "/home/pi-five/pi_video/merged_videos.mp4"
+VIDEO_TIMINGS_FILE = "/home/pi-five/pi_video/video_timings.txt"
+TMPFS_DIR = "/dev/shm"
+TMPFS_MAX_RAM_FRACTION = 0.5  # Only copy to tmpfs if the file uses at most this much of available RAM
+WARM_CHUNK = 1024 * 1024  # Bytes advised/read per step, so a play can interrupt warming quickly
+
+PAGE_SIZE = mmap.PAGESIZE
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_libc.mmap.restype = ctypes.c_void_p
+_libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+_libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+_libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.POINTER(ctypes.c_ubyte)]
+
+
+def read_timings(path):
+    """Read VIDEO_SEGMENTS from a video_timings.txt file"""
+    with open(path, "r") as file:
+        content = file.read()
+    return ast.literal_eval(content[content.find('['):content.find(']') + 1])
+
+
+def segment_byte_ranges(index, segments):
+    """Map each segment name to the byte ranges it reads from the merged file"""
+    return {
+        seg["name"]: index.byte_ranges(seg["start"], seg["start"] + seg["duration"])
+        for seg in segments
+    }
+
+
+def _page_align(offset, length):
+    start = offset - offset % PAGE_SIZE
+    return start, offset + length - start
+
+
+def resident_pages(fd, offset, length):
+    """Return (resident, total) page counts for a byte range, using mincore()"""
+    start, length = _page_align(offset, length)
+    if length <= 0:
+        return 0, 0
+    addr = _libc.mmap(None, length, mmap.PROT_READ, mmap.MAP_SHARED, fd, start)
+    if addr in (None, ctypes.c_void_p(-1).value):
+        raise OSError(ctypes.get_errno(), "mmap failed")
+    try:
+        pages = (length + PAGE_SIZE - 1) // PAGE_SIZE
+        vec = (ctypes.c_ubyte * pages)()
+        if _libc.mincore(addr, length, vec) != 0:
+            raise OSError(ctypes.get_errno(), "mincore failed")
+        return sum(b & 1 for b in vec), pages
+    finally:
+        _libc.munmap(addr, length)
+
+
+def residency(path, ranges):
+    """Fraction of pages of the given ranges currently in the page cache"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        resident = total = 0
+        for offset, length in ranges:
+            r, t = resident_pages(fd, offset, length)
+            resident += r
+            total += t
+        return resident, total
+    finally:
+        os.close(fd)
+
+
+def warm_ranges(path, ranges, read=False, cancel=None):
+    """Ask the kernel to pull byte ranges into the page cache
+
+    With read=True the data is also read, for filesystems that ignore
+    POSIX_FADV_WILLNEED. Returns the number of bytes warmed.
+    """
+    warmed = 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for offset, length in ranges:
+            end = offset + length
+            while offset < end:
+                if cancel is not None and cancel.is_set():
+                    return warmed
+                step = min(WARM_CHUNK, end - offset)
+                os.posix_fadvise(fd, offset, step, os.POSIX_FADV_WILLNEED)
+                if read:
+                    os.pread(fd, step, offset)
+                offset += step
+                warmed += step
+    finally:
+        os.close(fd)
+    return warmed
+
+
+def copy_to_tmpfs(path, tmpfs_dir=TMPFS_DIR, max_fraction=TMPFS_MAX_RAM_FRACTION):
+    """Copy the merged video into tmpfs if it fits, returns the new path or None"""
+    size = os.path.getsize(path)
+    available = 0
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                available = int(line.split()[1]) * 1024
+                break
+    st = os.statvfs(tmpfs_dir)
+    free = st.f_bavail * st.f_frsize
+
+    if size > available * max_fraction or size > free:
+        print(f"Not copying to tmpfs: {size / (1024*1024):.0f}MB, "
+              f"{available / (1024*1024):.0f}MB RAM available, {free / (1024*1024):.0f}MB free in {tmpfs_dir}")
+        return None
+
+    target = os.path.join(tmpfs_dir, os.path.basename(path))
+    if os.path.exists(target) and os.path.getsize(target) == size and \
+            os.path.getmtime(target) >= os.path.getmtime(path):
+        return target
+
+    tmp = target + ".tmp"
+    shutil.copyfile(path, tmp)
+    os.replace(tmp, target)
+    print(f"Copied {path} to {target} ({size / (1024*1024):.1f}MB)")
+    return target
+
+
+class Prefetcher:
+    """Warms upcoming segments while idle and tracks page-cache hit rates"""
+
+    def __init__(self, video_path, segments, read=False):
+        self.video_path = video_path
+        self.read = read
+        self.ranges = segment_byte_ranges(Mp4Index(video_path), segments)
+        self.pending = []
+        self.measure = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.cancel = threading.Event()
+        self.running = True
+        self.bytes_warmed = 0
+        self.hit_pages = 0
+        self.total_pages = 0
+        self.plays = {}  # name -> [plays, hit pages, total pages]
+        self.thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self.thread.start()
+
+    def schedule(self, names):
+        """Warm the given segments in order, replacing any earlier schedule"""
+        with self.lock:
+            self.pending = [n for n in names if n in self.ranges]
+        self.cancel.clear()
+        self.wake.set()
+
+    def segment_bytes(self, name):
+        """Bytes warming a segment reads (0 for an unknown name)"""
+        return sum(length for _, length in self.ranges.get(name, []))
+
+    def pause(self):
+        """Stop warming (a play is starting and needs the storage)"""
+        self.cancel.set()
+        with self.lock:
+            self.pending = []
+
+    def record_play(self, name):
+        """Note that a segment is about to play; its cache residency is sampled off-thread"""
+        self.pause()
+        with self.lock:
+            self.measure.append(name)
+        self.wake.set()
+
+    def stop(self):
+        self.running = False
+        self.cancel.set()
+        self.wake.set()
+
+    def hit_rate(self):
+        """Overall fraction of segment pages already cached when the segment started"""
+        return self.hit_pages / self.total_pages if self.total_pages else 0.0
+
+    def report(self):
+        print(f"Prefetch: {self.bytes_warmed / (1024*1024):.1f}MB warmed, "
+              f"page-cache hit rate {self.hit_rate() * 100:.1f}%")
+        for name, (plays, hits, total) in sorted(self.plays.items()):
+            rate = hits / total * 100 if total else 0
+            print(f"  {name}: {plays} plays, {rate:.1f}% cached at start")
+
+    def _run(self):
+        while self.running:
+            self.wake.wait()
+            self.wake.clear()
+
+            with self.lock:
+                measure, self.measure = self.measure, []
+            for name in measure:
+                try:
+                    hits, total = residency(self.video_path, self.ranges[name])
+                except (OSError, KeyError):
+                    continue
+                self.hit_pages += hits
+                self.total_pages += total
+                stats = self.plays.setdefault(name, [0, 0, 0])
+                stats[0] += 1
+                stats[1] += hits
+                stats[2] += total
+
+            while self.running and not self.cancel.is_set():
+                with self.lock:
+                    if not self.pending:
+                        break
+                    name = self.pending.pop(0)
+                try:
+                    self.bytes_warmed += warm_ranges(self.video_path, self.ranges[name], self.read, self.cancel)
+                except OSError as e:
+                    print(f"Prefetch error for {name}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment byte ranges, page-cache residency and warming")
+    parser.add_argument("--video", default=MERGED_VIDEO, help="Merged video file")
+    parser.add_argument("--timings", default=VIDEO_TIMINGS_FILE, help="video_timings.txt")
+    parser.add_argument("--warm", action="store_true", help="Warm all segments into the page cache")
+    parser.add_argument("--read", action="store_true", help="Read data while warming, not just advise")
+    parser.add_argument("--drop", action="store_true", help="Drop the file from the page cache first")
+    parser.add_argument("--tmpfs", action="store_true", help="Copy the video into tmpfs if it fits")
+    args = parser.parse_args()
+
+    segments = read_timings(args.timings)
+    ranges = segment_byte_ranges(Mp4Index(args.video), segments)
+
+    if args.drop:
+        fd = os.open(args.video, os.O_RDONLY)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+    if args.tmpfs:
+        target = copy_to_tmpfs(args.video)
+        print(f"tmpfs copy: {target}")
+
+    if args.warm:
+        total = sum(warm_ranges(args.video, r, args.read) for r in ranges.values())
+        print(f"Warmed {total / (1024*1024):.1f}MB")
+
+    print(f"{'segment':<12} {'ranges':>7} {'bytes':>12} {'cached':>8}")
+    for seg in segments:
+        r = ranges[seg["name"]]
+        hits, total = residency(args.video, r)
+        size = sum(length for _, length in r)
+        cached = hits / total * 100 if total else 0
+        print(f"{seg['name']:<12} {len(r):>7} {size:>12} {cached:>7.1f}%")
+
+if __name__ == "__main__":
+    main()
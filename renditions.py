@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import argparse
+import subprocess
+import collections
+
+# === Configuration ===
+RENDITIONS_FILE = "/home/pi-five/pi_video/renditions.json"  # Written by merge_and_extract.py
+BENCH_CACHE_FILE = "/home/pi-five/pi_video/rendition_bench.json"
+BENCH_SECONDS = 4  # Seconds of video decoded per benchmark
+MIN_DECODE_SPEED = 1.5  # Software decode must run this many times faster than real time
+DROP_WINDOW = 5  # Plays averaged when judging the dropped-frame rate
+MAX_DROP_RATE = 0.02  # Fall back to the next rendition above this fraction of frames lost
+
+
+def load_renditions(path=RENDITIONS_FILE, default_video=None):
+    """Renditions best first as dicts with name/file/width/height; just the default video if none"""
+    try:
+        with open(path) as f:
+            renditions = json.load(f)
+        folder = os.path.dirname(path)
+        for rendition in renditions:
+            rendition["path"] = os.path.join(folder, rendition["file"])
+        renditions = [r for r in renditions if os.path.exists(r["path"])]
+        if renditions:
+            return renditions
+    except (OSError, ValueError, KeyError) as e:
+        if default_video is None:
+            raise
+        print(f"No renditions list ({e}), using {default_video}")
+    return [{"name": "default", "file": os.path.basename(default_video), "path": default_video}]
+
+
+def decode_speed(video_path, start=0, seconds=BENCH_SECONDS):
+    """Software-decode `seconds` of video as fast as possible; returns multiple of real time"""
+    started = time.monotonic()
+    result = subprocess.run([
+        "ffmpeg", "-v", "error", "-nostdin",
+        "-ss", str(start), "-t", str(seconds),
+        "-i", video_path, "-an", "-f", "null", "-"
+    ], capture_output=True, text=True)
+    elapsed = time.monotonic() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "ffmpeg failed")
+    return seconds / elapsed if elapsed > 0 else float("inf")
+
+
+def _identity(path):
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+class RenditionSelector:
+    """Picks the best rendition this Pi decodes fast enough, and steps down when plays drop frames
+
+    Benchmark results are cached per file (size + mtime), so only a boot
+    after a re-merge pays for decoding.
+    """
+
+    def __init__(self, renditions, cache_path=BENCH_CACHE_FILE, min_speed=MIN_DECODE_SPEED,
+                 window=DROP_WINDOW, max_drop_rate=MAX_DROP_RATE, log=print):
+        self.renditions = renditions
+        self.cache_path = cache_path
+        self.min_speed = min_speed
+        self.max_drop_rate = max_drop_rate
+        self.log = log
+        self.index = len(renditions) - 1
+        self.speeds = {}
+        self.plays = collections.deque(maxlen=window)  # (frames displayed, frames lost)
+
+    @property
+    def current(self):
+        return self.renditions[self.index]
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache):
+        try:
+            tmp = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(cache, f)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            self.log(f"Could not save rendition benchmarks: {e}")
+
+    def benchmark(self, start=0):
+        """Measure (or recall) the decode speed of every rendition"""
+        cache = self._load_cache()
+        dirty = False
+        for rendition in self.renditions:
+            key = f"{rendition['path']}@{_identity(rendition['path'])}"
+            speed = cache.get(key)
+            if speed is None:
+                try:
+                    speed = decode_speed(rendition["path"], start)
+                except Exception as e:
+                    self.log(f"Benchmark of {rendition['name']} failed: {e}")
+                    speed = 0.0
+                cache[key] = speed
+                dirty = True
+            self.speeds[rendition["name"]] = speed
+        if dirty:
+            self._save_cache(cache)
+        return self.speeds
+
+    def select(self):
+        """Best rendition at or above min_speed, else the fastest; returns it"""
+        if len(self.renditions) > 1:
+            self.benchmark()
+            fast_enough = [i for i, r in enumerate(self.renditions) if self.speeds[r["name"]] >= self.min_speed]
+            if fast_enough:
+                self.index = fast_enough[0]
+            else:
+                self.index = max(range(len(self.renditions)), key=lambda i: self.speeds[self.renditions[i]["name"]])
+        else:
+            self.index = 0
+        self.plays.clear()
+        return self.current
+
+    def drop_rate(self):
+        displayed = sum(d for d, _ in self.plays)
+        lost = sum(l for _, l in self.plays)
+        return lost / (displayed + lost) if displayed + lost else 0.0
+
+    def observe(self, displayed, lost):
+        """Record a finished play; returns the new rendition if this one has degraded, else None"""
+        self.plays.append((displayed, lost))
+        if len(self.plays) < self.plays.maxlen or self.drop_rate() <= self.max_drop_rate:
+            return None
+        if self.index + 1 >= len(self.renditions):
+            return None
+        rate = self.drop_rate()
+        self.index += 1
+        self.plays.clear()
+        self.log(f"Dropped {rate:.1%} of frames, falling back to rendition {self.current['name']}")
+        return self.current
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark renditions and show which one app.py would pick")
+    parser.add_argument("--renditions", default=RENDITIONS_FILE)
+    parser.add_argument("--cache", default=BENCH_CACHE_FILE)
+    parser.add_argument("--fresh", action="store_true", help="Ignore cached benchmark results")
+    args = parser.parse_args()
+
+    renditions = load_renditions(args.renditions)
+    if args.fresh and os.path.exists(args.cache):
+        os.remove(args.cache)
+    selector = RenditionSelector(renditions, args.cache)
+    selector.select()
+    for rendition in renditions:
+        speed = selector.speeds.get(rendition["name"], 0.0)
+        marker = "*" if rendition is selector.current else " "
+        print(f"{marker} {rendition['name']:<8} {rendition['file']:<32} {speed:6.2f}x real time")
+    print(f"Selected: {selector.current['name']} (needs >= {selector.min_speed}x)")
+
+if __name__ == "__main__":
+    main()
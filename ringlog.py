@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import signal
+import atexit
+import threading
+import argparse
+
+# === Configuration ===
+RING_CAPACITY = 4096  # Entries kept in memory
+FLUSH_INTERVAL = 2.0  # Seconds between background flushes
+FLUSH_BATCH = 512  # Flush early once this many entries are pending
+DUMP_ENTRIES = 200  # Entries dumped on crash or signal
+
+LEVELS = ("DEBUG", "INFO", "WARN", "ERROR")
+
+
+def format_entry(entry):
+    """Render one ring entry as a log line"""
+    if entry is None:
+        return "(entry lost)"
+    timestamp, level, message, fields = entry
+    line = time.strftime("%H:%M:%S", time.localtime(timestamp)) + f".{int(timestamp * 1000) % 1000:03d} {level} {message}"
+    if fields:
+        line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+    return line
+
+
+class RingLog:
+    """Structured log that appends to a preallocated ring and flushes in batches
+
+    log() only stores a tuple in the next slot, under a lock that is held
+    for two assignments; formatting and writing happen on the flush thread.
+    If the flusher falls more than `capacity` entries behind, the oldest
+    entries are dropped and counted. The lock is reentrant so the crash-dump
+    signal handler can read the ring even if it interrupted a log() call.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, stream=None, flush_interval=FLUSH_INTERVAL, batch=FLUSH_BATCH):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0  # Total entries ever written
+        self.flushed = 0  # Total entries handed to the stream
+        self.dropped = 0
+        self.stream = stream or sys.stdout
+        self.flush_interval = flush_interval
+        self.batch = batch
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def log(self, message, level="INFO", **fields):
+        """Record an entry; cheap enough for the control loop"""
+        entry = (time.time(), level, message, fields)
+        with self.lock:
+            index = self.head
+            self.slots[index % self.capacity] = entry
+            self.head = index + 1
+        if index - self.flushed >= self.batch and not self.wake.is_set():
+            self.wake.set()
+
+    def start(self):
+        """Start the background flush thread"""
+        if self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="ringlog-flush", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+        return self
+
+    def close(self):
+        """Stop the flush thread and write out everything pending"""
+        self.running = False
+        self.wake.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        self.flush()
+
+    def _pending(self):
+        with self.lock:
+            head = self.head
+            start = max(self.flushed, head - self.capacity)
+            if start > self.flushed:
+                self.dropped += start - self.flushed
+            entries = [self.slots[i % self.capacity] for i in range(start, head)]
+            self.flushed = head
+        return entries
+
+    def flush(self):
+        """Write all pending entries to the stream in one write"""
+        with self.flush_lock:
+            entries = self._pending()
+            if not entries:
+                return 0
+            try:
+                self.stream.write("\n".join(format_entry(e) for e in entries) + "\n")
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass
+            return len(entries)
+
+    def _run(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def last(self, count=DUMP_ENTRIES):
+        """Most recent entries still in the ring, oldest first"""
+        with self.lock:
+            head = self.head
+            start = max(0, head - min(count, self.capacity))
+            return [self.slots[i % self.capacity] for i in range(start, head)]
+
+    def dump(self, count=DUMP_ENTRIES, stream=None, reason="dump"):
+        """Write the last `count` entries (flushed or not) to stderr"""
+        stream = stream or sys.stderr
+        entries = self.last(count)
+        try:
+            stream.write(f"=== ringlog {reason}: last {len(entries)} entries (dropped {self.dropped}) ===\n")
+            stream.write("".join(format_entry(e) + "\n" for e in entries))
+            stream.write("=== end ringlog ===\n")
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    def install_crash_dump(self, count=DUMP_ENTRIES, dump_signals=(signal.SIGUSR1,), exit_signals=(signal.SIGTERM,)):
+        """Dump the ring on uncaught exceptions and signals
+
+        dump_signals only dump; exit_signals dump and then raise SystemExit so
+        the caller's cleanup (finally blocks) still runs. Must be called from
+        the main thread.
+        """
+        previous_hook = sys.excepthook
+        previous_thread_hook = threading.excepthook
+
+        def excepthook(exc_type, exc, tb):
+            self.log(f"Uncaught {exc_type.__name__}: {exc}", "ERROR")
+            self.flush()
+            self.dump(count, reason="crash")
+            previous_hook(exc_type, exc, tb)
+
+        def thread_excepthook(args):
+            name = args.thread.name if args.thread else "?"
+            self.log(f"Uncaught {args.exc_type.__name__} in thread {name}: {args.exc_value}", "ERROR")
+            self.flush()
+            self.dump(count, reason="thread crash")
+            previous_thread_hook(args)
+
+        def on_dump_signal(signum, frame):
+            self.dump(count, reason=signal.Signals(signum).name)
+
+        def on_exit_signal(signum, frame):
+            self.log(f"Received {signal.Signals(signum).name}", "WARN")
+            self.flush()
+            self.dump(count, reason=signal.Signals(signum).name)
+            raise SystemExit(128 + signum)
+
+        sys.excepthook = excepthook
+        threading.excepthook = thread_excepthook
+        for signum in dump_signals:
+            signal.signal(signum, on_dump_signal)
+        for signum in exit_signals:
+            signal.signal(signum, on_exit_signal)
+
+
+def _time_calls(call, events):
+    """Per-call latencies in microseconds, sorted"""
+    timings = []
+    clock = time.perf_counter
+    for i in range(events):
+        t = clock()
+        call(i)
+        timings.append((clock() - t) * 1e6)
+        if i % 100 == 99:
+            time.sleep(0.001)  # Let the flusher run, like the 50 ms control loop does
+    timings.sort()
+    return timings
+
+
+def benchmark(events=20000, pipe_delay=0.01):
+    """Compare per-event cost of print() against RingLog.log() on the calling thread
+
+    The pipe case drains stdout slowly (pipe_delay per read) to stand in for a
+    stalled journald/SD card: print() blocks once the pipe fills, log() doesn't.
+    """
+    read_fd, write_fd = os.pipe()
+    draining = True
+
+    def drain():
+        while draining:
+            if not os.read(read_fd, 4096):
+                break
+            time.sleep(pipe_delay)
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    pipe = os.fdopen(write_fd, "w", buffering=1)
+
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        results["print (devnull)"] = _time_calls(
+            lambda i: print(f"Playing: video{i % 3} from {i}s", file=devnull, flush=True), events)
+        results["print (slow pipe)"] = _time_calls(
+            lambda i: print(f"Playing: video{i % 3} from {i}s", file=pipe, flush=True), events)
+
+        ring = RingLog(stream=pipe).start()
+        results["RingLog.log (slow pipe)"] = _time_calls(
+            lambda i: ring.log("Playing", segment=f"video{i % 3}", start=i), events)
+        ring.close()
+        draining = False
+
+    print(f"Per-event cost over {events} events (us):")
+    print(f"  {'':<26} {'p50':>8} {'p99':>8} {'max':>10}")
+    for name, timings in results.items():
+        p50 = timings[len(timings) // 2]
+        p99 = timings[int(len(timings) * 0.99)]
+        print(f"  {name:<26} {p50:8.2f} {p99:8.2f} {timings[-1]:10.1f}")
+    print(f"  dropped by ring: {ring.dropped}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ring buffer logger benchmark")
+    parser.add_argument("--events", type=int, default=20000, help="Events per benchmark run")
+    args = parser.parse_args()
+    benchmark(args.events)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import os
+import time
+import ctypes
+import argparse
+import statistics
+import subprocess
+
+from mp4_index import Mp4Index
+from prefetch import read_timings
+
+# === Configuration ===
+VIDEO_FOLDER = "/home/pi-five/pi_video"
+MERGED_VIDEO = "merged_videos.mp4"
+VIDEO_TIMINGS_FILE = "video_timings.txt"
+RUNS = 3  # Timed seeks per segment; the median is reported
+WORST_COUNT = 5  # Segments listed in the worst-case summary
+VLC_TIMEOUT = 10  # Seconds to wait for libVLC to parse the file or show a frame
+VLC_FRAME_SIZE = (64, 36)  # Frames are rendered into memory at this size (no display needed)
+
+
+def gop_position(index, start):
+    """Where a segment start falls in its GOP
+
+    Returns {"keyframe": time of the keyframe a seek decodes from,
+    "frames_from_key": frames decoded before the start frame,
+    "gop": seconds until the next keyframe}; None without a video track.
+    """
+    track = next((t for t in index.tracks if t.is_video and t.sample_times), None)
+    if track is None:
+        return None
+    first = track.sample_at(start)
+    sync = track.sync_sample_before(first)
+    if track.sync_samples is None:
+        next_sync = sync + 1
+    else:
+        later = [s for s in track.sync_samples if s > sync]
+        next_sync = later[0] if later else len(track.sample_times)
+    end = track.sample_times[next_sync] if next_sync < len(track.sample_times) else track.sample_times[-1] + track.last_duration
+    return {
+        "keyframe": round(track.sample_times[sync] / track.timescale, 3),
+        "frames_from_key": first - sync,
+        "gop": round((end - track.sample_times[sync]) / track.timescale, 3),
+    }
+
+
+def drop_cache(video_path):
+    """Evict the file from the page cache so the next read comes from the card"""
+    try:
+        fd = os.open(video_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except (OSError, AttributeError):
+        pass
+
+
+def ffmpeg_first_frame(video_path, start):
+    """Seconds for a headless ffmpeg to open, seek to `start` and decode the frame there"""
+    started = time.perf_counter()
+    subprocess.run(["ffmpeg", "-v", "error", "-nostdin", "-ss", str(start), "-i", video_path,
+                    "-frames:v", "1", "-an", "-f", "null", "-"], capture_output=True, check=True)
+    return time.perf_counter() - started
+
+
+def ffmpeg_startup():
+    """Seconds ffmpeg needs for one frame with no file and no seek (subtracted from the seek times)"""
+    times = []
+    for _ in range(3):
+        started = time.perf_counter()
+        subprocess.run(["ffmpeg", "-v", "error", "-nostdin", "-f", "lavfi", "-i", "nullsrc=s=16x16",
+                        "-frames:v", "1", "-f", "null", "-"], capture_output=True, check=True)
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+class VlcFirstFrame:
+    """libVLC player rendering into memory, timing play-from-start to the first displayed frame
+
+    The file's length comes from media parsing, not from playing and pausing
+    it. Frames go to a small RV32 buffer through the video callbacks, so the
+    display callback marks the moment a frame would reach the screen.
+    """
+
+    def __init__(self, video_path):
+        import vlc
+        import threading
+        self.vlc = vlc
+        self.video_path = video_path
+        self.instance = vlc.Instance(["--intf=dummy", "--aout=dummy", "--no-audio", "--quiet",
+                                      "--no-video-title-show"])
+        self.player = self.instance.media_player_new()
+        width, height = VLC_FRAME_SIZE
+        self.buffer = (ctypes.c_ubyte * (width * height * 4))()
+        self.shown = threading.Event()
+
+        @vlc.CallbackDecorators.VideoLockCb
+        def lock(opaque, planes):
+            planes[0] = ctypes.addressof(self.buffer)
+            return None
+
+        @vlc.CallbackDecorators.VideoUnlockCb
+        def unlock(opaque, picture, planes):
+            pass
+
+        @vlc.CallbackDecorators.VideoDisplayCb
+        def display(opaque, picture):
+            self.shown.set()
+
+        self._callbacks = (lock, unlock, display)  # Keep references alive while libVLC holds them
+        self.player.video_set_callbacks(lock, unlock, display, None)
+        self.player.video_set_format("RV32", width, height, width * 4)
+
+    def length(self):
+        """Duration in seconds from parsing the file (no playback)"""
+        media = self.instance.media_new(self.video_path)
+        media.parse_with_options(self.vlc.MediaParseFlag.local, VLC_TIMEOUT * 1000)
+        deadline = time.monotonic() + VLC_TIMEOUT
+        while media.get_parsed_status() != self.vlc.MediaParsedStatus.done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        duration = media.get_duration()
+        media.release()
+        return duration / 1000.0 if duration > 0 else 0
+
+    def first_frame(self, start):
+        """Seconds from play() with start-time=`start` to the first displayed frame, or None on timeout"""
+        media = self.instance.media_new(self.video_path, f"start-time={start}", "no-audio")
+        self.player.set_media(media)
+        self.shown.clear()
+        started = time.perf_counter()
+        self.player.play()
+        shown = self.shown.wait(VLC_TIMEOUT)
+        elapsed = time.perf_counter() - started
+        self.player.stop()
+        media.release()
+        return elapsed if shown else None
+
+    def close(self):
+        self.player.release()
+        self.instance.release()
+
+
+def benchmark(video_path, segments, runs=RUNS, cold=False, use_vlc=True, worst_count=WORST_COUNT):
+    """Time seek-to-first-frame for every segment start; returns the per-segment results"""
+    index = Mp4Index(video_path)
+    startup = ffmpeg_startup()
+    player = None
+    if use_vlc:
+        try:
+            player = VlcFirstFrame(video_path)
+            print(f"libVLC: {player.length():.1f}s (parsed)")
+        except Exception as e:
+            print(f"libVLC unavailable ({e}), timing ffmpeg only")
+    print(f"{video_path}: {len(segments)} segments, {runs} runs each, {'cold' if cold else 'warm'} cache; "
+          f"ffmpeg startup {startup * 1000:.0f}ms subtracted")
+
+    print(f"{'segment':<12} {'start':>8} {'keyframe':>9} {'frames':>7} {'gop':>6} {'ffmpeg ms':>10} {'vlc ms':>8}")
+    results = []
+    try:
+        for seg in segments:
+            position = gop_position(index, seg["start"]) or {"keyframe": None, "frames_from_key": 0, "gop": 0}
+            ffmpeg_times = []
+            vlc_times = []
+            for _ in range(runs):
+                if cold:
+                    drop_cache(video_path)
+                ffmpeg_times.append(max(0.0, ffmpeg_first_frame(video_path, seg["start"]) - startup))
+                if player:
+                    if cold:
+                        drop_cache(video_path)
+                    elapsed = player.first_frame(seg["start"])
+                    if elapsed is not None:
+                        vlc_times.append(elapsed)
+            result = dict(position, name=seg["name"], start=seg["start"],
+                          ffmpeg=statistics.median(ffmpeg_times),
+                          vlc=statistics.median(vlc_times) if vlc_times else None)
+            results.append(result)
+            vlc_ms = f"{result['vlc'] * 1000:.0f}" if result["vlc"] is not None else "-"
+            print(f"{seg['name']:<12} {seg['start']:>8} {result['keyframe']:>9} {result['frames_from_key']:>7} "
+                  f"{result['gop']:>6} {result['ffmpeg'] * 1000:>10.0f} {vlc_ms:>8}")
+    finally:
+        if player:
+            player.close()
+
+    if results:
+        key = lambda r: r["vlc"] if r["vlc"] is not None else r["ffmpeg"]
+        print(f"\nWorst {min(worst_count, len(results))} segments:")
+        for r in sorted(results, key=key, reverse=True)[:worst_count]:
+            print(f"  {r['name']}: {key(r) * 1000:.0f}ms, {r['frames_from_key']} frames after the keyframe at "
+                  f"{r['keyframe']}s (GOP {r['gop']}s)")
+        off_key = [r for r in results if r["frames_from_key"]]
+        if off_key:
+            print(f"{len(off_key)}/{len(results)} starts are not on a keyframe; "
+                  f"re-merge so mp4_layout.py forces one at each start")
+        print(f"Median {statistics.median(key(r) for r in results) * 1000:.0f}ms, "
+              f"max {max(key(r) for r in results) * 1000:.0f}ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time seek-to-first-frame for every segment of the merged video")
+    parser.add_argument("--video", default=os.path.join(VIDEO_FOLDER, MERGED_VIDEO), help="Merged video file")
+    parser.add_argument("--timings", default=os.path.join(VIDEO_FOLDER, VIDEO_TIMINGS_FILE), help="video_timings.txt")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--cold", action="store_true", help="Drop the file from the page cache before every seek")
+    parser.add_argument("--no-vlc", action="store_true", help="Only time headless ffmpeg decodes")
+    args = parser.parse_args()
+    benchmark(args.video, read_timings(args.timings), args.runs, args.cold, not args.no_vlc)
+
+if __name__ == "__main__":
+    main()
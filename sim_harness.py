@@ -0,0 +1,650 @@
+import os
+import sys
+import json
+import time
+import heapq
+import types
+import random
+import tempfile
+import argparse
+import importlib
+import threading
+
+import playback_state
+import input_map
+
+# === Configuration ===
+BUTTON_GPIO = 17
+SHUTDOWN_GPIO = 27
+START_EPOCH = 1_700_000_000.0  # Virtual wall clock at the start of a run
+PLAYER_STARTUP = 0.4  # Seconds from cvlc spawn to first frame
+COSTS = {  # Virtual seconds each fake call takes; lets timers interleave with the main thread
+    "popen": 0.02,
+    "call": 0.005,
+    "run": 0.005,
+    "gpio_input": 0.00005,
+}
+EXTRA_BUTTONS = [22, 23]  # Pins of the "multi" scenario's extra buttons
+MULTI_BUTTON_MAP = {BUTTON_GPIO: "random", SHUTDOWN_GPIO: "shutdown", 22: "group:long", 23: "video3"}
+MULTI_GROUPS = {"long": ["video1", "video2"]}
+SEGMENTS = [
+    {"name": "video1", "start": 0, "duration": 45.9},
+    {"name": "video2", "start": 45.9, "duration": 42.2},
+    {"name": "video3", "start": 88.0, "duration": 22.9},
+]
+
+
+class VirtualClock:
+    """Event scheduler and stand-in for the time module
+
+    The main thread owns the clock. Timer callbacks run as virtual threads:
+    real threads that take turns with the main thread, so only one runs at a
+    time. When a virtual thread sleeps, control returns to the main thread
+    until the wake-up time comes due, just as a blocking sleep in a real
+    Timer thread doesn't stall the control loop.
+    """
+
+    def __init__(self, start=START_EPOCH):
+        self.start = start
+        self.now = start
+        self.events = []
+        self.sequence = 0
+        self.checks = []  # Called after every main-thread sleep, i.e. at main loop ticks
+        self.yielded = threading.Event()
+        self.worker_errors = []
+
+    def schedule(self, at, callback):
+        heapq.heappush(self.events, (at, self.sequence, callback))
+        self.sequence += 1
+
+    def elapsed(self):
+        return self.now - self.start
+
+    def advance(self, seconds):
+        """Move time forward, running every event that falls due on the way"""
+        target = self.now + seconds
+        while self.events and self.events[0][0] <= target:
+            at, _, callback = heapq.heappop(self.events)
+            self.now = max(self.now, at)
+            callback()
+        self.now = target
+
+    def sleep_until(self, ready, timeout):
+        """Main-thread sleep that ends early once ready() is true after an event"""
+        target = self.now + timeout
+        while self.events and self.events[0][0] <= target:
+            at, _, callback = heapq.heappop(self.events)
+            self.now = max(self.now, at)
+            callback()
+            if ready():
+                break
+        else:
+            self.now = target
+        for check in self.checks:
+            check()
+
+    # time module API used by app.py
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now - self.start
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        if threading.current_thread() is not threading.main_thread():
+            self._worker_sleep(seconds)
+            return
+        self.advance(seconds)
+        for check in self.checks:
+            check()
+
+    def in_main(self):
+        return threading.current_thread() is threading.main_thread()
+
+    def spawn(self, function):
+        """Run function as a virtual thread starting now"""
+        resume = threading.Event()
+
+        def body():
+            resume.wait()
+            try:
+                function()
+            except Exception as e:
+                self.worker_errors.append((self.elapsed(), repr(e)))
+            finally:
+                self.yielded.set()
+
+        threading.Thread(target=body, daemon=True).start()
+        self._switch_to(resume)
+
+    def _switch_to(self, resume):
+        self.yielded.clear()
+        resume.set()
+        self.yielded.wait()
+
+    def _worker_sleep(self, seconds):
+        resume = threading.Event()
+        self.schedule(self.now + seconds, lambda: self._switch_to(resume))
+        self.yielded.set()
+        resume.wait()
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+class FakeTimer:
+    """threading.Timer running on the virtual clock"""
+
+    def __init__(self, sim, interval, function, args=None, kwargs=None):
+        self.sim = sim
+        self.interval = interval
+        self.function = function
+        self.args = args or ()
+        self.kwargs = kwargs or {}
+        self.daemon = True
+        self.cancelled = False
+        self.generation = sim.play_generation
+
+    def start(self):
+        self.sim.clock.schedule(self.sim.clock.now + self.interval, self._fire)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _fire(self):
+        if self.cancelled:
+            return
+        if self.generation != self.sim.play_generation:
+            self.sim.violation("stale_timer", f"timer from play {self.generation} fired during play {self.sim.play_generation}")
+        self.sim.clock.spawn(lambda: self.function(*self.args, **self.kwargs))
+
+
+class FakeGPIO(types.ModuleType):
+    """RPi.GPIO stand-in: levels are set by the harness, edge callbacks fire synchronously"""
+
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    PUD_UP = 22
+    PUD_DOWN = 21
+    HIGH = 1
+    LOW = 0
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, sim):
+        super().__init__("RPi.GPIO")
+        self.sim = sim
+        self.levels = {}
+        self.callbacks = {}  # pin -> (edge, [callbacks], bouncetime)
+        self.last_callback = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.levels.setdefault(pin, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+
+    def input(self, pin):
+        self.sim.cost("gpio_input")
+        return self.levels.get(pin, self.HIGH)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = (edge, [callback] if callback else [], bouncetime)
+
+    def add_event_callback(self, pin, callback):
+        self.callbacks[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self, pins=None):
+        self.callbacks.clear()
+
+    def set_level(self, pin, level):
+        """Drive a pin from the trace"""
+        previous = self.levels.get(pin, self.HIGH)
+        self.levels[pin] = level
+        if previous == level or pin not in self.callbacks:
+            return
+        edge, callbacks, bouncetime = self.callbacks[pin]
+        if (edge == self.FALLING and level != self.LOW) or (edge == self.RISING and level != self.HIGH):
+            return
+        now = self.sim.clock.now
+        if bouncetime and now - self.last_callback.get(pin, -1e9) < bouncetime / 1000:
+            return
+        self.last_callback[pin] = now
+        for callback in callbacks:
+            callback(pin)
+
+
+class FakePlayer:
+    """cvlc process stand-in: plays [start-time, stop-time) (or to the end of the media) then exits, or loops forever"""
+
+    def __init__(self, sim, cmd):
+        self.sim = sim
+        self.cmd = cmd
+        self.pid = sim.next_pid()
+        self.returncode = None
+        self.spawned_at = sim.clock.now
+        self.looping = "--loop" in cmd
+        self.kind = "black" if self.looping else "video"
+        self.end_at = None
+        if not self.looping:
+            start = stop = None
+            for arg in cmd:
+                if arg.startswith("--start-time="):
+                    start = float(arg.split("=", 1)[1])
+                elif arg.startswith("--stop-time="):
+                    stop = float(arg.split("=", 1)[1])
+            start = start or 0
+            length = (stop if stop is not None else sim.media_length) - start
+            self.end_at = self.spawned_at + PLAYER_STARTUP + length
+            sim.clock.schedule(self.end_at, self._exit)
+
+    def seek(self, position):
+        """Jump to `position` seconds; the player now ends at the end of the media"""
+        self.end_at = self.sim.clock.now + max(0, self.sim.media_length - position)
+        self.sim.clock.schedule(self.end_at, self._exit)
+
+    def _exit(self):
+        # A seek may have moved the end since this was scheduled
+        if self.returncode is None and self.sim.clock.now >= self.end_at:
+            self.returncode = 0
+
+    def alive(self):
+        return self.returncode is None
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None and self.end_at is not None:
+            self.sim.clock.sleep(max(0, self.end_at - self.sim.clock.now))
+        return self.returncode
+
+    def terminate(self):
+        if self.returncode is None:
+            self.returncode = -15
+
+    def kill(self):
+        if self.returncode is None:
+            self.returncode = -9
+
+
+class FakeSubprocess(types.ModuleType):
+    """subprocess stand-in for app.py's cvlc/pkill/systemctl/aplay calls"""
+
+    DEVNULL = -3
+    PIPE = -1
+    STDOUT = -2
+
+    class CalledProcessError(Exception):
+        pass
+
+    def __init__(self, sim):
+        super().__init__("subprocess")
+        self.sim = sim
+
+    def Popen(self, cmd, **kwargs):
+        self.sim.cost("popen")
+        player = FakePlayer(self.sim, cmd)
+        self.sim.on_spawn(player)
+        return player
+
+    def call(self, cmd, **kwargs):
+        self.sim.cost("call")
+        if cmd[:2] == ["pkill", "-f"]:
+            for player in self.sim.players:
+                player.terminate()
+        elif "alsa-state" in cmd:
+            self.sim.stats["audio_resets"] += 1
+        return 0
+
+    def run(self, cmd, **kwargs):
+        self.sim.cost("run")
+        return types.SimpleNamespace(returncode=0, stdout="", stderr="")
+
+
+class FakeVlcRemote:
+    """player_control.VlcRemote stand-in that drives the newest video player"""
+
+    def __init__(self, sim, socket_path=None):
+        self.sim = sim
+
+    def _player(self):
+        players = [p for p in self.sim.players if p.kind == "video" and p.alive()]
+        return players[-1] if players else None
+
+    def seek(self, seconds):
+        self.sim.cost("call")
+        player = self._player()
+        if player is None:
+            return False
+        player.seek(float(-(-seconds // 1)))  # Whole seconds, rounded up like oldrc
+        self.sim.stats["seeks"] += 1
+        return True
+
+    def seek_precise(self, seconds, length):
+        self.sim.cost("call")
+        player = self._player()
+        if player is None:
+            return False
+        player.seek(seconds)
+        self.sim.stats["seeks"] += 1
+        return True
+
+    def get_time(self):
+        return None
+
+    def stats(self):
+        return {}
+
+    def stop(self):
+        self.quit()
+
+    def quit(self):
+        player = self._player()
+        if player:
+            player.terminate()
+
+    def close(self):
+        pass
+
+
+class SimDispatcher(input_map.InputDispatcher):
+    """InputDispatcher whose wait() runs on the virtual clock"""
+
+    sim = None
+
+    def wait(self, timeout):
+        self.sim.clock.sleep_until(lambda: bool(self.events), timeout)
+
+
+class Simulation:
+    """Runs app.main() against fake GPIO, fake players and a virtual clock"""
+
+    def __init__(self, trace, duration, segments=SEGMENTS, log_stream=None, policy=None,
+                 button_map=None, segment_groups=None, continuous=False, chain_order=None):
+        self.trace = trace
+        self.duration = duration
+        self.segments = segments
+        self.media_length = max(seg["start"] + seg["duration"] for seg in segments)
+        self.log_stream = log_stream
+        self.policy = policy
+        self.button_map = button_map
+        self.segment_groups = segment_groups
+        self.continuous = continuous
+        self.chain_order = chain_order
+        self.clock = VirtualClock()
+        self.players = []
+        self.pid = 1000
+        self.play_generation = 0
+        self.violations = []
+        self.stats = {"button_edges": 0, "plays": 0, "black_screens": 0, "audio_resets": 0,
+                      "ticks": 0, "shutdowns": 0, "seeks": 0}
+        self.ongoing = set()
+
+    def next_pid(self):
+        self.pid += 1
+        return self.pid
+
+    def cost(self, kind):
+        if self.clock.in_main():
+            self.clock.advance(COSTS.get(kind, 0))
+
+    def violation(self, kind, detail):
+        self.violations.append((round(self.clock.elapsed(), 3), kind, detail))
+
+    def on_spawn(self, player):
+        self.players.append(player)
+        alive = [p for p in self.players if p is not player and p.alive() and p.kind == player.kind]
+        if player.kind == "video":
+            self.play_generation += 1
+            self.stats["plays"] += 1
+            if alive:
+                self.violation("overlapping_players", f"{len(alive) + 1} video players running")
+        else:
+            self.stats["black_screens"] += 1
+            if alive:
+                self.violation("black_screen_leak", f"{len(alive) + 1} black screen players running")
+            if self.continuous and self.stats["plays"] and self.app.system_running and not self.app.chain_paused:
+                self.violation("black_between_segments", "black screen started during continuous play")
+
+    def condition(self, kind, active, detail):
+        """Record a violation when a condition starts holding, not at every tick"""
+        if active and kind not in self.ongoing:
+            self.violation(kind, detail)
+        if active:
+            self.ongoing.add(kind)
+        else:
+            self.ongoing.discard(kind)
+
+    def check_invariants(self):
+        """Checked at every sleep of the main thread"""
+        app = self.app
+        self.stats["ticks"] += 1
+        alive = [p for p in self.players if p.kind == "video" and p.alive()]
+        state = app.playback.state
+        self.condition("playing_without_process", state == playback_state.PLAYING and app.current_video_process is None,
+                       "PLAYING but no player process")
+        self.condition("untracked_player", state == playback_state.IDLE and bool(alive),
+                       f"IDLE while {len(alive)} player(s) still run")
+        self.condition("orphan_timer", app.current_timer is not None and state == playback_state.IDLE,
+                       "end-of-play timer pending while idle")
+
+    def install(self):
+        """Import app.py with fakes in place of hardware, players and time"""
+        self.gpio = FakeGPIO(self)
+        rpi = types.ModuleType("RPi")
+        rpi.GPIO = self.gpio
+        sys.modules["RPi"] = rpi
+        sys.modules["RPi.GPIO"] = self.gpio
+        sys.modules.pop("app", None)
+        app = importlib.import_module("app")
+        app.logger.stream = self.log_stream or open(os.devnull, "w")
+        app.logger.install_crash_dump = lambda *a, **k: None
+
+        fake_threading = types.ModuleType("threading")
+        fake_threading.__dict__.update(threading.__dict__)
+        fake_threading.Timer = lambda interval, function, args=None, kwargs=None: \
+            FakeTimer(self, interval, function, args, kwargs)
+        fake_os = types.ModuleType("os")
+        fake_os.__dict__.update(os.__dict__)
+        fake_os.system = self.on_system
+        fake_control = types.ModuleType("player_control")
+        fake_control.VlcRemote = lambda socket_path=None: FakeVlcRemote(self, socket_path)
+        fake_control.control_args = app.player_control.control_args
+        fake_control.remove_stale_socket = lambda socket_path=None: None
+
+        app.time = self.clock
+        app.threading = fake_threading
+        app.subprocess = FakeSubprocess(self)
+        app.os = fake_os
+        app.player_control = fake_control
+        fake_input = types.ModuleType("input_map")
+        fake_input.__dict__.update(input_map.__dict__)
+        fake_input.InputDispatcher = type("InputDispatcher", (SimDispatcher,), {"sim": self})
+        app.input_map = fake_input
+        if self.policy:
+            app.PLAYBACK_POLICY = self.policy
+            app.playback = playback_state.PlaybackStateMachine(self.policy)
+        if self.button_map:
+            app.BUTTON_MAP = dict(self.button_map)
+            app.SEGMENT_GROUPS = dict(self.segment_groups or {})
+        app.USE_CUE_PLAYER = False
+        app.PREFETCH_ENABLED = False
+        app.VERIFY_ON_BOOT = False
+        app.AUTO_RENDITION = False
+        app.PLAYER_STATS_INTERVAL = 0
+        app.PLAYER_LOG_STATS = False
+        app.play_quality.path = None
+        app.play_counts.path = None
+        app.METRICS_ENABLED = False
+        app.LOOP_STALL_DETECTION = False  # Real-time watcher; the loop runs on the virtual clock
+
+        # Media paths only need to exist
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for name in ("MERGED_VIDEO", "BLACK_SCREEN_VIDEO"):
+            path = os.path.join(self.tmpdir.name, name.lower() + ".mp4")
+            open(path, "w").close()
+            setattr(app, name, path)
+        app.BOOT_SOUND_FILE = os.path.join(self.tmpdir.name, "missing.wav")
+        app.APP_PID_FILE = os.path.join(self.tmpdir.name, "app.pid")
+        app.PLAYING_FLAG_FILE = os.path.join(self.tmpdir.name, "playing")
+        app.PLAYER_TUNING_FILE = os.path.join(self.tmpdir.name, "player_tuning.json")
+        app.CONTINUOUS_PLAY = self.continuous
+        if self.chain_order:
+            app.CHAIN_ORDER = self.chain_order
+        app.VIDEO_SEGMENTS = [dict(seg) for seg in self.segments]
+        self.app = app
+        self.clock.checks.append(self.check_invariants)
+
+        for at, pin, level in self.trace:
+            self.clock.schedule(self.clock.start + at, lambda pin=pin, level=level: self.on_level(pin, level))
+        self.clock.schedule(self.clock.start + self.duration, self.stop)
+        return app
+
+    def on_level(self, pin, level):
+        if level == self.gpio.LOW and pin != SHUTDOWN_GPIO:
+            self.stats["button_edges"] += 1
+        self.gpio.set_level(pin, level)
+
+    def on_system(self, command):
+        if "shutdown" in command:
+            self.stats["shutdowns"] += 1
+        return 0
+
+    def stop(self):
+        self.app.system_running = False
+
+    def run(self):
+        """Run app.main() to the end of the trace, returns the report"""
+        app = self.install()
+        started = time.perf_counter()
+        app.main()
+        wall = time.perf_counter() - started
+        self.tmpdir.cleanup()
+        return self.report(wall)
+
+    def report(self, wall):
+        counts = {}
+        for _, kind, _ in self.violations:
+            counts[kind] = counts.get(kind, 0) + 1
+        virtual = self.clock.elapsed()
+        return {
+            "virtual_seconds": round(virtual, 1),
+            "wall_seconds": round(wall, 3),
+            "speedup": round(virtual / wall, 1) if wall else None,
+            "ticks_per_second": round(self.stats["ticks"] / wall) if wall else None,
+            "stats": self.stats,
+            "segment_plays": sum(self.app.METRIC_PLAYS.values.values()),
+            "press_results": {"/".join(k): v for k, v in sorted(self.app.METRIC_PRESSES.values.items())},
+            "press_latency_ms": {k[0]: round(v[1] / v[2] * 1000, 1)
+                                 for k, v in sorted(self.app.METRIC_PRESS_LATENCY.values.items()) if v[2]},
+            "violation_counts": counts,
+            "first_violations": self.violations[:20],
+            "timer_errors": self.clock.worker_errors,
+        }
+
+
+def generate_trace(kind, duration, seed=0):
+    """Button trace as [(seconds, pin, level)]: burst, bounce, playback, shutdown, multi or mixed"""
+    rng = random.Random(seed)
+    events = []
+
+    def press(at, pin=BUTTON_GPIO, hold=0.15, bounce=0):
+        for i in range(bounce):  # Contact bounce before the level settles
+            events.append((at + i * 0.002, pin, 0))
+            events.append((at + i * 0.002 + 0.001, pin, 1))
+        settle = at + bounce * 0.002
+        events.append((settle, pin, 0))
+        events.append((settle + hold, pin, 1))
+
+    t = 5.0
+    while t < duration - 5:
+        if kind == "burst":
+            for i in range(rng.randint(3, 10)):
+                press(t + i * 0.2)
+            t += rng.uniform(5, 60)
+        elif kind == "bounce":
+            press(t, bounce=rng.randint(2, 8))
+            t += rng.uniform(1, 30)
+        elif kind == "playback":
+            press(t)
+            t += rng.uniform(0.5, 50)
+        elif kind == "multi":
+            # Several buttons, sometimes pressed together
+            pins = rng.sample([BUTTON_GPIO] + EXTRA_BUTTONS, rng.choice([1, 1, 1, 2, 3]))
+            for i, pin in enumerate(pins):
+                press(t + i * rng.uniform(0, 0.03), pin, bounce=rng.randint(0, 3))
+            t += rng.uniform(0.5, 30)
+        elif kind == "shutdown":
+            press(t, SHUTDOWN_GPIO, hold=rng.choice([0.3, 1.0, 2.5]))
+            t += rng.uniform(5, 60)
+        else:
+            choice = rng.random()
+            if choice < 0.02:
+                press(t, SHUTDOWN_GPIO, hold=rng.choice([0.3, 1.0]))
+            else:
+                press(t, bounce=rng.randint(0, 4))
+            t += rng.expovariate(1 / 10)
+    events.sort()
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay button traces against app.py on simulated hardware")
+    parser.add_argument("--scenario", default="mixed", choices=["burst", "bounce", "playback", "shutdown", "multi", "mixed"])
+    parser.add_argument("--duration", type=float, default=3600, help="Virtual seconds to simulate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", help="Replay a recorded trace (JSON list of [seconds, pin, level])")
+    parser.add_argument("--record", help="Save the generated trace to this JSON file")
+    parser.add_argument("--policy", choices=playback_state.POLICIES, help="Override app.PLAYBACK_POLICY")
+    parser.add_argument("--multi-buttons", action="store_true",
+                        help="Use the multi scenario's button map (implied by --scenario multi)")
+    parser.add_argument("--continuous", action="store_true", help="Run app.py in continuous (chained) play")
+    parser.add_argument("--chain-order", choices=["shuffle", "sequence"], help="Override app.CHAIN_ORDER")
+    parser.add_argument("--log", action="store_true", help="Show app.py log output")
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace) as f:
+            trace = [tuple(e) for e in json.load(f)]
+    else:
+        trace = generate_trace(args.scenario, args.duration, args.seed)
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(trace, f)
+
+    multi = args.scenario == "multi" or args.multi_buttons
+    sim = Simulation(trace, args.duration, log_stream=sys.stdout if args.log else None, policy=args.policy,
+                     button_map=MULTI_BUTTON_MAP if multi else None, segment_groups=MULTI_GROUPS if multi else None,
+                     continuous=args.continuous, chain_order=args.chain_order)
+    report = sim.run()
+
+    print(f"Simulated {report['virtual_seconds']}s in {report['wall_seconds']}s "
+          f"({report['speedup']}x real time, {report['ticks_per_second']} ticks/s)")
+    print(f"Stats: {report['stats']}, segment plays: {report['segment_plays']}")
+    print(f"Presses: {report['press_results']}")
+    print(f"Press dispatch latency (mean ms): {report['press_latency_ms']}")
+    if report["violation_counts"]:
+        print("Invariant violations:")
+        for kind, count in sorted(report["violation_counts"].items()):
+            print(f"  {kind}: {count}")
+        for at, kind, detail in report["first_violations"]:
+            print(f"  t={at}s {kind}: {detail}")
+    else:
+        print("No invariant violations")
+    for at, error in report["timer_errors"]:
+        print(f"  t={at:.3f}s timer callback raised {error}")
+
+if __name__ == "__main__":
+    main()
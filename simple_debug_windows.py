@@ -139,14 +139,15 @@ def get_video_length():
     """Get total video length in seconds"""
     try:
         if vlc_player and vlc_player.get_media():
-            # May need to play briefly to get length
-            was_playing = vlc_player.is_playing()
-            if not was_playing:
-                vlc_player.play()
-                time.sleep(0.5)
-                vlc_player.pause()
+            # Parse the file for its length instead of playing it briefly
+            media = vlc_player.get_media()
+            if media.get_parsed_status() != vlc.MediaParsedStatus.done:
+                media.parse_with_options(vlc.MediaParseFlag.local, 5000)
+                deadline = time.time() + 5
+                while media.get_parsed_status() != vlc.MediaParsedStatus.done and time.time() < deadline:
+                    time.sleep(0.01)
             
-            length_ms = vlc_player.get_length()
+            length_ms = media.get_duration()
             return length_ms / 1000.0 if length_ms > 0 else 0
     except:
         pass
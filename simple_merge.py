@@ -1,6 +1,7 @@
 # not used. only concat file should be run 
 import subprocess
 import os
+import mp4_layout
 
 # === Configuration ===
 VIDEO_FOLDER = "c:/Users/USER/Documents/raspberrypi/pi_video/"
@@ -10,6 +11,7 @@ VIDEO_FILES = [
     "video3.mp4"
 ]
 MERGED_VIDEO = "merged_videos.mp4"
+FRAGMENTED_OUTPUT = False  # Fragmented MP4 instead of moov-at-front (faststart)
 
 def get_video_info(video_path):
     """Get video information"""
@@ -60,6 +62,7 @@ def simple_merge():
     cmd = [
         "ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", "filelist.txt",
         "-c", "copy",  # Copy streams without re-encoding (faster)
+    ] + mp4_layout.movflags_args(FRAGMENTED_OUTPUT) + [
         MERGED_VIDEO
     ]
     
@@ -89,6 +92,7 @@ def reencode_merge():
         "-c:v", "libx264", "-c:a", "aac",
         "-preset", "fast",  # Faster encoding
         "-crf", "23",
+    ] + mp4_layout.movflags_args(FRAGMENTED_OUTPUT) + [
         MERGED_VIDEO
     ]
     
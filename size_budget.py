@@ -0,0 +1,203 @@
+import os
+import math
+import tempfile
+import subprocess
+
+# === Configuration ===
+REFERENCE_CRF = 23  # CRF of the sample encodes the clip bitrates are measured at
+CRF_MIN = 16  # Never spend more than this on quality, however big the budget
+CRF_MAX = 36  # Past this the clips would be too soft; the encode targets a bitrate instead
+CRF_DOUBLING = 6  # x264: six CRF points up roughly halves the bitrate
+POPULARITY_SPREAD = 4  # CRF points the most-played clip gets below an unplayed one
+SAMPLE_POINTS = 3  # Excerpts sampled per clip, spread over it
+SAMPLE_SECONDS = 2.0  # Length of each excerpt (about one GOP of the merged file)
+AUDIO_BITRATE = 128000  # ffmpeg's AAC default, which the merge uses
+CONTAINER_OVERHEAD = 0.01  # Index and headers, as a fraction of the streams
+TOLERANCE = 0.05  # A result up to this fraction under the budget is accepted
+MAX_PASSES = 3  # Full encodes tried before giving up on hitting the budget
+SSIM_SECONDS = 4.0  # Excerpt of each clip compared against its source for the quality report
+
+
+def ram_total():
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def budget_bytes(size_mb=None, ram_percent=None):
+    """Size target in bytes: an explicit size, or a share of this unit's RAM (the page cache / tmpfs copy)"""
+    if size_mb:
+        return int(size_mb * 1024 * 1024)
+    return int(ram_total() * ram_percent / 100)
+
+
+def _run(cmd):
+    return subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+
+def frame_rate(path):
+    """Average frame rate of a file's first video stream"""
+    result = _run(["ffprobe", "-v", "quiet", "-select_streams", "v:0", "-show_entries", "stream=avg_frame_rate",
+                   "-of", "default=noprint_wrappers=1:nokey=1", path])
+    num, _, den = result.stdout.strip().partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 25.0
+
+
+def sample_rate(path, start, duration, vfilter, preset="medium", run=None):
+    """Video bytes per second of a clip at REFERENCE_CRF, from SAMPLE_POINTS short excerpt encodes"""
+    run = run or _run
+    excerpt = min(SAMPLE_SECONDS, duration)
+    points = [start + (duration - excerpt) * (i + 0.5) / SAMPLE_POINTS for i in range(SAMPLE_POINTS)]
+    total = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "sample.mp4")
+        for at in points:
+            run(["ffmpeg", "-y", "-v", "error", "-nostdin", "-ss", f"{at:.3f}", "-t", f"{excerpt:.3f}", "-i", path,
+                 "-vf", vfilter, "-an", "-c:v", "libx264", "-preset", preset, "-crf", str(REFERENCE_CRF), out])
+            total += os.path.getsize(out)
+    return total / (excerpt * len(points))
+
+
+def measure_clips(folder, segments, vfilter, fps=None, preset="medium", run=None):
+    """Per-clip duration, frame count and sampled bitrate, in timeline order"""
+    clips = []
+    for seg in segments:
+        path = os.path.join(folder, seg["file"])
+        start = seg["trim"][0] if seg.get("trim") else 0
+        clip_fps = fps or frame_rate(path)
+        rate = sample_rate(path, start, seg["duration"], vfilter, preset, run)
+        clips.append({"name": seg["name"], "file": seg["file"], "duration": seg["duration"],
+                      "frames": max(1, round(seg["duration"] * clip_fps)), "rate": rate})
+        print(f"  {seg['name']} ({seg['file']}): {rate * 8 / 1000:.0f} kb/s at CRF {REFERENCE_CRF}")
+    return clips
+
+
+def video_bytes(path):
+    """Bytes of the video stream in a file (the rest is audio and container)"""
+    result = _run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=size",
+                   "-of", "csv=p=0", path])
+    return sum(int(line) for line in result.stdout.split() if line.strip().isdigit())
+
+
+def crf_offsets(clips, counts):
+    """CRF points each clip gets below the base CRF, by its share of plays (all zero without counts)"""
+    plays = {clip["name"]: counts.get(clip["file"], counts.get(clip["name"], 0)) for clip in clips}
+    most = max(plays.values(), default=0)
+    return {name: round(POPULARITY_SPREAD * n / most, 2) if most else 0.0 for name, n in plays.items()}
+
+
+def plan(clips, target, offsets, correction=1.0, other_bytes=None, rate_correction=1.0):
+    """Encode settings that should land the merged file in the middle of the accepted window below `target`
+
+    Every clip's video is modelled as its sampled rate scaled by
+    2^((REFERENCE_CRF - crf) / CRF_DOUBLING), times `correction` (actual over
+    predicted video bytes of an earlier pass). `other_bytes` is the audio and
+    container share, estimated until a pass has measured it. The base CRF is
+    solved for directly, and popular clips sit `offsets` below it. If the base
+    would pass CRF_MAX, the plan switches to an average video bitrate with the
+    same split, divided by `rate_correction` (how far an earlier bitrate pass
+    overshot). Aiming at the window's middle rather than `target` keeps a
+    small miss either way inside it.
+    """
+    duration = sum(clip["duration"] for clip in clips)
+    aim = target * (1 - TOLERANCE / 2)
+    if other_bytes is None:
+        other_bytes = AUDIO_BITRATE / 8 * duration + CONTAINER_OVERHEAD * target
+    video_target = aim - other_bytes
+    weighted = sum(clip["duration"] * clip["rate"] * correction * 2 ** (offsets[clip["name"]] / CRF_DOUBLING)
+                   for clip in clips)
+    settings = {"crf": None, "bitrate": 0, "video": None, "predicted": None, "target": target, "aim": int(aim)}
+    if video_target <= 0 or weighted <= 0:
+        return settings
+    base = REFERENCE_CRF - CRF_DOUBLING * math.log2(video_target / weighted)
+    if base > CRF_MAX:
+        settings.update(bitrate=int(video_target * 8 / duration / rate_correction), video=int(video_target),
+                        predicted=int(aim))
+        return settings
+    base = round(max(CRF_MIN + max(offsets.values(), default=0), base), 1)
+    video = int(weighted * 2 ** ((REFERENCE_CRF - base) / CRF_DOUBLING))
+    settings.update(crf=base, bitrate=None, video=video, predicted=int(video + other_bytes))
+    return settings
+
+
+def zones(clips, offsets):
+    """x264 zones giving each clip its CRF offset as a bitrate multiplier (None if all are equal)"""
+    if not any(offsets.values()):
+        return None
+    parts = []
+    frame = 0
+    for clip in clips:
+        factor = 2 ** (offsets[clip["name"]] / CRF_DOUBLING)
+        if factor != 1:
+            parts.append(f"{frame},{frame + clip['frames'] - 1},b={factor:.3f}")
+        frame += clip["frames"]
+    return "/".join(parts)
+
+
+def encode_args(settings, clips, offsets):
+    """libx264 rate-control options for a plan (replacing the fixed -crf of a normal merge)"""
+    if settings["crf"] is not None:
+        args = ["-crf", str(settings["crf"])]
+    else:
+        rate = max(1, settings["bitrate"])
+        args = ["-b:v", str(rate), "-maxrate", str(int(rate * 1.5)), "-bufsize", str(rate * 2)]
+    zone = zones(clips, offsets)
+    if zone:
+        args += ["-x264-params", f"zones={zone}"]
+    return args
+
+
+def fits(size, target):
+    return target * (1 - TOLERANCE) <= size <= target
+
+
+def describe(settings):
+    if settings["crf"] is not None:
+        return f"CRF {settings['crf']}"
+    return f"{settings['bitrate'] / 1000:.0f} kb/s video (CRF would pass {CRF_MAX})"
+
+
+def ssim(merged, segment, source, vfilter, run=None):
+    """SSIM (0-1) of a clip's middle excerpt in the merged file against its source, scaled the same way"""
+    run = run or _run
+    length = min(SSIM_SECONDS, segment["duration"])
+    offset = (segment["duration"] - length) / 2
+    source_start = (segment["trim"][0] if segment.get("trim") else 0) + offset
+    result = run(["ffmpeg", "-v", "info", "-nostdin",
+                  "-ss", f"{segment['start'] + offset:.3f}", "-t", f"{length:.3f}", "-i", merged,
+                  "-ss", f"{source_start:.3f}", "-t", f"{length:.3f}", "-i", source,
+                  "-lavfi", f"[1:v]{vfilter},format=yuv420p[ref];[0:v]setsar=1,format=yuv420p[out];[out][ref]ssim",
+                  "-f", "null", "-"])
+    for line in result.stderr.splitlines():
+        if "SSIM" in line and "All:" in line:
+            return float(line.split("All:")[1].split()[0])
+    return None
+
+
+def report(merged, segments, folder, target, settings, offsets, vfilter, timings, run=None):
+    """Print achieved size against the budget, per-clip CRF and SSIM, and where the encode time went"""
+    size = os.path.getsize(merged)
+    mb = 1024 * 1024
+    status = "within budget" if size <= target else "OVER budget"
+    print(f"Size budget: {size / mb:.1f}MB of {target / mb:.1f}MB ({size / target:.1%}, {status}) with {describe(settings)}")
+    print(f"{'segment':<12} {'file':<28} {'crf':>6} {'ssim':>7}")
+    scores = []
+    for seg in segments:
+        try:
+            score = ssim(merged, seg, os.path.join(folder, seg["file"]), vfilter, run)
+        except subprocess.CalledProcessError:
+            score = None
+        crf = f"{settings['crf'] - offsets[seg['name']]:.1f}" if settings["crf"] is not None else "-"
+        print(f"{seg['name']:<12} {seg['file'][:28]:<28} {crf:>6} {score if score is None else f'{score:.4f}':>7}")
+        if score is not None:
+            scores.append(score)
+    if scores:
+        print(f"SSIM: mean {sum(scores) / len(scores):.4f}, worst {min(scores):.4f}")
+    print("Encode time: " + ", ".join(f"{label} {seconds:.1f}s" for label, seconds in timings)
+          + f" (total {sum(seconds for _, seconds in timings):.1f}s)")
+    return size
@@ -0,0 +1,328 @@
+import hmac
+import time
+import random
+import socket
+import argparse
+import threading
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import input_map
+
+# === Configuration ===
+TRIGGER_BIND = "127.0.0.1"  # Interface to listen on, e.g. the show-control network's address
+UDP_PORT = 9106
+HTTP_PORT = 9107
+RATE_LIMIT = 20  # Triggers per second passed to the main loop
+RATE_BURST = 10
+MAX_DATAGRAM = 512
+HTTP_TIMEOUT = 2  # Seconds a client may take to send its request
+HTTP_CLIENTS = 8  # HTTP requests handled at once; connections beyond this are closed unanswered
+
+# submit() results: UDP reply, HTTP status
+ACCEPTED = ("ok", 202)
+DENIED = ("denied", 401)
+INVALID = ("invalid", 400)
+LIMITED = ("limited", 429)
+FULL = ("busy", 503)
+
+
+class BoundedHTTPServer(ThreadingHTTPServer):
+    """A thread per request, so a slow client can't hold up the others, up to `max_clients` at once"""
+
+    daemon_threads = True
+
+    def __init__(self, address, handler, max_clients=HTTP_CLIENTS):
+        self.slots = threading.BoundedSemaphore(max_clients)
+        super().__init__(address, handler)
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.slots.release()
+
+
+class RateLimiter:
+    """Token bucket shared by the UDP and HTTP listeners"""
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def parse_command(command, segment_names):
+    """'play <segment>', 'random' or 'stop' -> (action, segments); ValueError if malformed"""
+    words = command.split()
+    if words == ["random"]:
+        return input_map.RANDOM, list(segment_names)
+    if words == ["stop"]:
+        return input_map.STOP, None
+    if len(words) == 2 and words[0] == "play":
+        if words[1] not in segment_names:
+            raise ValueError(f"unknown segment {words[1]}")
+        return words[1], [words[1]]
+    raise ValueError(f"bad command {command!r}")
+
+
+class TriggerServer:
+    """UDP and HTTP trigger listeners feeding the button dispatcher
+
+    UDP:  "<token> play <segment>" | "<token> random" | "<token> stop", reply ok/denied/invalid/limited/busy
+    HTTP: POST /play/<segment>, /random or /stop with an "X-Trigger-Token" header, 202 on success
+
+    Both listeners are single threads that only check, parse and queue;
+    everything else happens on the main loop, buttons first.
+    """
+
+    def __init__(self, dispatcher, token, segment_names, host=TRIGGER_BIND, udp_port=UDP_PORT,
+                 http_port=HTTP_PORT, limiter=None, log=print):
+        if not token:
+            raise ValueError("Trigger API needs a token")
+        self.dispatcher = dispatcher
+        self.token = token.encode()
+        self.segment_names = list(segment_names)
+        self.host = host
+        self.udp_port = udp_port
+        self.http_port = http_port
+        self.limiter = limiter or RateLimiter()
+        self.log = log
+        self.stats = {"ok": 0, "denied": 0, "invalid": 0, "limited": 0, "busy": 0}
+        self.udp_socket = None
+        self.http_server = None
+        self.running = False
+
+    def submit(self, source, token, command):
+        """Check and queue one trigger; returns one of the result tuples"""
+        if not hmac.compare_digest(token.encode(), self.token):
+            result = DENIED
+        else:
+            try:
+                action, segments = parse_command(command, self.segment_names)
+            except ValueError:
+                result = INVALID
+            else:
+                if not self.limiter.allow():
+                    result = LIMITED
+                elif self.dispatcher.post(input_map.Button(None, action, segments, name=source, debounce=False)):
+                    result = ACCEPTED
+                else:
+                    result = FULL
+        self.stats[result[0]] += 1
+        return result
+
+    def start(self):
+        self.running = True
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.bind((self.host, self.udp_port))
+        self.udp_port = self.udp_socket.getsockname()[1]
+        threading.Thread(target=self._udp_loop, name="trigger-udp", daemon=True).start()
+
+        self.http_server = BoundedHTTPServer((self.host, self.http_port), self._handler())
+        self.http_port = self.http_server.server_address[1]
+        threading.Thread(target=self.http_server.serve_forever, name="trigger-http", daemon=True).start()
+        self.log(f"Trigger API on udp://{self.host}:{self.udp_port} and http://{self.host}:{self.http_port}")
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+        if self.udp_socket:
+            self.udp_socket.close()
+
+    def _udp_loop(self):
+        while self.running:
+            try:
+                data, address = self.udp_socket.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                break
+            token, _, command = data.decode(errors="replace").strip().partition(" ")
+            reply, _ = self.submit("udp", token, command)
+            try:
+                self.udp_socket.sendto(reply.encode(), address)
+            except OSError:
+                pass
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            timeout = HTTP_TIMEOUT
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(min(length, MAX_DATAGRAM))
+                token = self.headers.get("X-Trigger-Token", "")
+                command = " ".join(part for part in self.path.split("/") if part)
+                reply, status = server.submit("http", token, command)
+                body = (reply + "\n").encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _percentiles(values):
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    p50 = values[len(values) // 2]
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return f"p50 {p50 * 1000:6.2f} ms  p99 {p99 * 1000:6.2f} ms  max {values[-1] * 1000:6.2f} ms  (n={len(values)})"
+
+
+def load_test(duration=10.0, clients=4, handle_ms=0.5, edge_interval=0.1):
+    """Measure button and trigger latency through the dispatcher, idle and with the API flooded
+
+    A thread stands in for RPi.GPIO's callback thread and presses a button
+    every `edge_interval` s; the calling thread runs the main loop's
+    wait/dispatch cycle, spending `handle_ms` on each trigger. Under load,
+    `clients` UDP senders plus one HTTP client fire as fast as they can,
+    a quarter of them with a wrong token.
+    """
+    segment_names = ["video1", "video2", "video3"]
+    dispatcher = input_map.InputDispatcher(gpio=None, clock=time.perf_counter)
+    button = input_map.Button(17, input_map.RANDOM, segment_names)
+    dispatcher.buttons[button.pin] = button
+    server = TriggerServer(dispatcher, "load-test", segment_names, host="127.0.0.1", udp_port=0, http_port=0,
+                           log=lambda message: None).start()
+
+    latencies = {}
+    phase = {"name": None}
+    stop = threading.Event()
+    flood = threading.Event()
+
+    def handler(b, at):
+        latencies.setdefault((phase["name"], b.name), []).append(time.perf_counter() - at)
+        time.sleep(handle_ms / 1000)
+
+    def press_button():
+        while not stop.wait(edge_interval * random.uniform(0.5, 1.5)):
+            dispatcher._on_edge(button.pin)
+
+    sent = {"udp": 0, "http": 0}
+    round_trips = []
+
+    def udp_client(index):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(1)
+        while not stop.is_set():
+            if not flood.wait(0.1):
+                continue
+            token = "wrong" if index == 0 else "load-test"
+            started = time.perf_counter()
+            sock.sendto(f"{token} play {segment_names[sent['udp'] % 3]}".encode(), ("127.0.0.1", server.udp_port))
+            sent["udp"] += 1
+            try:
+                sock.recv(64)
+                round_trips.append(time.perf_counter() - started)
+            except socket.timeout:
+                pass
+        sock.close()
+
+    def http_client():
+        while not stop.is_set():
+            if not flood.wait(0.1):
+                continue
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", server.http_port, timeout=2)
+                conn.request("POST", "/random", headers={"X-Trigger-Token": "load-test"})
+                conn.getresponse().read()
+                conn.close()
+                sent["http"] += 1
+            except OSError:
+                pass
+
+    threads = [threading.Thread(target=press_button, daemon=True),
+               threading.Thread(target=http_client, daemon=True)]
+    threads += [threading.Thread(target=udp_client, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    for name, loaded in (("idle", False), ("flooded", True)):
+        phase["name"] = name
+        if loaded:
+            flood.set()
+        deadline = time.perf_counter() + duration / 2
+        while time.perf_counter() < deadline:
+            dispatcher.wait(0.05)
+            dispatcher.dispatch(handler)
+        flood.clear()
+        dispatcher.dispatch(handler, remote_limit=input_map.REMOTE_QUEUE)
+
+    stop.set()
+    server.stop()
+
+    print(f"Dispatcher load test: {duration}s, {clients} UDP clients + 1 HTTP client, {handle_ms} ms per trigger")
+    for (name, source), values in sorted(latencies.items()):
+        print(f"  {name:<8} {source:<7} queue->handled {_percentiles(values)}")
+    print(f"  UDP round trip (flooded)     {_percentiles(round_trips)}")
+    print(f"  sent: {sent}  server results: {server.stats}")
+    return latencies
+
+
+def send(command, token, host=TRIGGER_BIND, port=UDP_PORT, timeout=1.0):
+    """Send one UDP trigger and return the reply"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(f"{token} {command}".encode(), (host, port))
+        try:
+            return sock.recv(64).decode()
+        except socket.timeout:
+            return "(no reply)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send triggers to app.py or load-test the trigger path")
+    parser.add_argument("command", nargs="*", help='Trigger to send: "play <segment>", "random" or "stop"')
+    parser.add_argument("--token", default="", help="Shared trigger token")
+    parser.add_argument("--host", default=TRIGGER_BIND)
+    parser.add_argument("--port", type=int, default=UDP_PORT)
+    parser.add_argument("--load-test", action="store_true", help="Run the local dispatcher load test")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.load_test:
+        load_test(args.duration, args.clients)
+    elif args.command:
+        started = time.perf_counter()
+        reply = send(" ".join(args.command), args.token, args.host, args.port)
+        print(f"{reply} ({(time.perf_counter() - started) * 1000:.1f} ms)")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
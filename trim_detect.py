@@ -0,0 +1,136 @@
+import os
+import re
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import get_timings
+
+# === Configuration ===
+SCAN_SECONDS = 6  # Only the first and last few seconds of each clip are analysed
+MAX_TRIM = 3.0  # Never cut more than this from either end (a deliberately dark opening stays)
+KEEP_MARGIN = 0.04  # Left before the first frame with content (about one frame)
+BLACK_MIN_DURATION = 0.1  # blackdetect d=
+BLACK_PIXEL_THRESHOLD = 0.10  # blackdetect pix_th= (luma below this fraction counts as black)
+BLACK_PICTURE_RATIO = 0.98  # blackdetect pic_th= (fraction of the picture that has to be black)
+SILENCE_NOISE = "-50dB"  # silencedetect n=
+SILENCE_MIN_DURATION = 0.1  # silencedetect d=
+WORKERS = os.cpu_count() or 1
+
+BLACK_PATTERN = re.compile(r"black_start:\s*([\d.]+)\s+black_end:\s*([\d.]+)")
+SILENCE_START_PATTERN = re.compile(r"silence_start:\s*(-?[\d.]+)")
+SILENCE_END_PATTERN = re.compile(r"silence_end:\s*([\d.]+)")
+
+
+def _scan(video_path, start, seconds, has_audio):
+    """Black intervals and silence intervals (relative to `start`) in part of a clip"""
+    cmd = ["ffmpeg", "-v", "info", "-nostdin", "-hide_banner", "-ss", str(start), "-t", str(seconds), "-i", video_path,
+           "-vf", f"blackdetect=d={BLACK_MIN_DURATION}:pix_th={BLACK_PIXEL_THRESHOLD}:pic_th={BLACK_PICTURE_RATIO}"]
+    if has_audio:
+        cmd += ["-af", f"silencedetect=n={SILENCE_NOISE}:d={SILENCE_MIN_DURATION}"]
+    cmd += ["-f", "null", "-"]
+    stderr = subprocess.run(cmd, capture_output=True, text=True).stderr
+
+    black = [(float(a), float(b)) for a, b in BLACK_PATTERN.findall(stderr)]
+    silence = []
+    opened = None
+    for line in stderr.splitlines():
+        match = SILENCE_START_PATTERN.search(line)
+        if match:
+            opened = max(0.0, float(match.group(1)))
+        match = SILENCE_END_PATTERN.search(line)
+        if match and opened is not None:
+            silence.append((opened, float(match.group(1))))
+            opened = None
+    if opened is not None:  # Silent to the end of the scanned part
+        silence.append((opened, seconds))
+    return black, silence
+
+
+def _leading(intervals, tolerance=0.05):
+    """Length of the interval that starts at 0, or 0"""
+    return next((end for start, end in intervals if start <= tolerance), 0.0)
+
+
+def _trailing(intervals, length, tolerance=0.1):
+    """Length of the interval that runs to `length`, or 0"""
+    return next((length - start for start, end in reversed(intervals) if end >= length - tolerance), 0.0)
+
+
+def detect(video_path, duration=None, has_audio=None):
+    """Trim points of one clip: {"start", "end", "lead", "tail"} in source seconds
+
+    Only a stretch that is both black and silent is cut (black with sound
+    or silence over a picture is content), and at most MAX_TRIM seconds at
+    either end.
+    """
+    if duration is None or has_audio is None:
+        info = get_timings.probe_video(video_path)
+        duration = info.get("duration", 0) if duration is None else duration
+        has_audio = bool(info.get("audio_codec")) if has_audio is None else has_audio
+    if duration <= 0:
+        return {"start": 0.0, "end": duration, "lead": 0.0, "tail": 0.0}
+
+    scan = min(SCAN_SECONDS, duration)
+    black, silence = _scan(video_path, 0, scan, has_audio)
+    lead = _leading(black)
+    if has_audio:
+        lead = min(lead, _leading(silence))
+
+    tail_start = max(0.0, duration - scan)
+    black, silence = _scan(video_path, tail_start, scan, has_audio)
+    tail = _trailing(black, duration - tail_start)
+    if has_audio:
+        tail = min(tail, _trailing(silence, duration - tail_start))
+
+    lead = max(0.0, min(lead - KEEP_MARGIN, MAX_TRIM))
+    tail = max(0.0, min(tail - KEEP_MARGIN, MAX_TRIM))
+    if lead + tail >= duration - 0.5:  # All black and silent: leave it alone
+        lead = tail = 0.0
+    lead, tail = round(lead, 3), round(tail, 3)
+    return {"start": lead, "end": round(duration - tail, 3), "lead": lead, "tail": tail}
+
+
+def detect_all(folder, files, infos=None, workers=WORKERS):
+    """detect() for every file in parallel; returns {file: trim}"""
+    infos = infos or {}
+
+    def one(video_file):
+        info = infos.get(video_file, {})
+        return video_file, detect(os.path.join(folder, video_file), info.get("duration"),
+                                  bool(info.get("audio_codec")) if info else None)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(one, files))
+
+
+def report(trims, bytes_per_second=None):
+    """Print per-clip trims and what they save; returns (lead seconds, total seconds)"""
+    lead_total = sum(t["lead"] for t in trims.values())
+    total = sum(t["lead"] + t["tail"] for t in trims.values())
+    for video_file, trim in trims.items():
+        if trim["lead"] or trim["tail"]:
+            print(f"  {video_file}: -{trim['lead']:.2f}s start, -{trim['tail']:.2f}s end")
+    if trims:
+        worst = max(t["lead"] for t in trims.values())
+        print(f"Trimmed {total:.2f}s from {sum(1 for t in trims.values() if t['lead'] or t['tail'])}/{len(trims)} clips; "
+              f"start latency saved: {lead_total / len(trims):.2f}s per press on average, {worst:.2f}s at most")
+    if bytes_per_second and total:
+        print(f"Merged file about {total * bytes_per_second / (1024*1024):.1f}MB smaller")
+    return lead_total, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find leading/trailing black-and-silent stretches in the source clips")
+    parser.add_argument("--folder", default=get_timings.VIDEO_FOLDER)
+    parser.add_argument("files", nargs="*", help="Clips (default: every video get_timings.py finds)")
+    args = parser.parse_args()
+
+    files = args.files or get_timings.discover_videos(args.folder)
+    infos = get_timings.probe_all(args.folder, files)
+    trims = detect_all(args.folder, files, infos)
+    bitrates = [infos[f]["size"] / infos[f]["duration"] for f in files if infos[f].get("duration")]
+    report(trims, sum(bitrates) / len(bitrates) if bitrates else None)
+
+if __name__ == "__main__":
+    main()
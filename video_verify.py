@@ -0,0 +1,273 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import prefetch
+from mp4_index import Mp4Index
+
+# === Configuration ===
+CHUNK_SIZE = 4 * 1024 * 1024  # Most bytes per hashed chunk; chunks also end where a segment's bytes start or end
+HASH_ALGORITHM = "sha256"
+VERIFY_MAX_AGE = 7 * 24 * 3600  # Re-hash a chunk once its last good check is older than this
+BOOT_BUDGET = 256 * 1024 * 1024  # Bytes of aged chunks re-hashed per boot (changed files are always checked in full)
+WORKERS = os.cpu_count() or 1
+MANIFEST_SUFFIX = ".verify.json"
+
+
+def manifest_path(video_path):
+    return os.path.realpath(video_path) + MANIFEST_SUFFIX  # Next to the release's file, not the link to it
+
+
+def file_identity(path):
+    """Metadata that changes when the file is replaced or rewritten"""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+def _hash_chunk(fd, index, offsets, algorithm):
+    data = os.pread(fd, offsets[index + 1] - offsets[index], offsets[index])
+    return index, len(data), hashlib.new(algorithm, data).hexdigest()  # Hashing releases the GIL
+
+
+def hash_chunks(path, indices, offsets, algorithm=HASH_ALGORITHM, workers=WORKERS):
+    """Hash the given chunks (chunk i is offsets[i] to offsets[i+1]) in parallel; returns ({index: digest}, bytes read)"""
+    digests = {}
+    total = 0
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for index, length, digest in pool.map(lambda i: _hash_chunk(fd, i, offsets, algorithm), indices):
+                digests[index] = digest
+                total += length
+    finally:
+        os.close(fd)
+    return digests, total
+
+
+def chunk_offsets(manifest):
+    """Chunk boundaries of a manifest (fixed-size chunks in version 1 manifests)"""
+    if "offsets" in manifest:
+        return manifest["offsets"]
+    size, chunk_size = manifest["file"]["size"], manifest["chunk_size"]
+    return [min(i * chunk_size, size) for i in range(len(manifest["chunks"]) + 1)]
+
+
+def segment_layout(video_path, segments, size, chunk_size=CHUNK_SIZE):
+    """(chunk offsets, segment name -> chunk indices), with chunks cut where segments' byte ranges start and end
+
+    Each chunk is read by one fixed set of segments, so a bad chunk only
+    affects the segments that really read it. Stretches longer than
+    `chunk_size` are split further. Chunks outside every segment (headers,
+    index) belong to all.
+    """
+    try:
+        ranges = prefetch.segment_byte_ranges(Mp4Index(video_path), segments)
+    except Exception as e:
+        print(f"Could not index {video_path} ({e}), treating every chunk as shared")
+        ranges = {seg["name"]: [] for seg in segments}
+
+    cuts = {0, size}
+    for byte_ranges in ranges.values():
+        for offset, length in byte_ranges:
+            cuts.update((min(offset, size), min(offset + length, size)))
+    cuts = sorted(cuts)
+    readers = [frozenset(name for name, byte_ranges in ranges.items()
+                         if any(offset <= start < offset + length for offset, length in byte_ranges))
+               for start in cuts[:-1]]
+
+    offsets = [0]
+    owners = []
+    for start, end, names in zip(cuts, cuts[1:], readers):
+        if owners and owners[-1] == names and end - offsets[-2] <= chunk_size:
+            offsets[-1] = end  # Same readers as the chunk before: extend it
+            continue
+        for piece in range(start, end, chunk_size):
+            offsets.append(min(piece + chunk_size, end))
+            owners.append(names)
+    mapping = {name: [i for i, names in enumerate(owners) if name in names] for name in ranges}
+    return offsets, mapping
+
+
+def build_manifest(video_path, segments, chunk_size=CHUNK_SIZE, algorithm=HASH_ALGORITHM, workers=WORKERS):
+    """Hash every chunk of a freshly merged video and write the manifest next to it"""
+    started = time.monotonic()
+    size = os.path.getsize(video_path)
+    offsets, mapping = segment_layout(video_path, segments, size, chunk_size)
+    count = len(offsets) - 1
+    digests, total = hash_chunks(video_path, range(count), offsets, algorithm, workers)
+    now = time.time()
+    manifest = {
+        "version": 2,
+        "algorithm": algorithm,
+        "chunk_size": chunk_size,
+        "file": file_identity(video_path),
+        "offsets": offsets,
+        "chunks": [digests[i] for i in range(count)],
+        "verified": [now] * count,
+        "segments": mapping,
+    }
+    save_manifest(video_path, manifest)
+    elapsed = time.monotonic() - started
+    print(f"Hashed {count} chunks ({total / (1024*1024):.1f}MB) in {elapsed:.2f}s "
+          f"({total / (1024*1024) / max(elapsed, 1e-9):.1f}MB/s), manifest: {manifest_path(video_path)}")
+    return manifest
+
+
+def load_manifest(video_path):
+    """The video's manifest, or None if there isn't a readable one"""
+    try:
+        with open(manifest_path(video_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(video_path, manifest):
+    path = manifest_path(video_path)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def affected_segments(manifest, bad_chunks):
+    """Segments that read any of the bad chunks; shared chunks affect every segment"""
+    bad = set(bad_chunks)
+    owned = set()
+    for chunks in manifest["segments"].values():
+        owned.update(chunks)
+    if bad - owned:
+        return sorted(manifest["segments"])
+    return sorted(name for name, chunks in manifest["segments"].items() if bad.intersection(chunks))
+
+
+def verify(video_path, max_age=VERIFY_MAX_AGE, budget=BOOT_BUDGET, full=False, workers=WORKERS):
+    """Re-hash the chunks that need it and compare with the manifest
+
+    A file whose size, mtime or inode differ from the manifest is checked in
+    full. Otherwise only chunks not verified within `max_age` are checked,
+    oldest first, up to `budget` bytes. Good results are written back, so
+    successive boots work through the whole file.
+    Returns a result dict (status "ok", "bad", "missing" or "no-manifest").
+    """
+    started = time.monotonic()
+    if not os.path.exists(video_path):
+        return {"status": "missing", "bad_segments": [], "bad_chunks": []}
+    manifest = load_manifest(video_path)
+    if manifest is None:
+        return {"status": "no-manifest", "bad_segments": [], "bad_chunks": []}
+
+    offsets = chunk_offsets(manifest)
+    count = len(manifest["chunks"])
+    identity = file_identity(video_path)
+    changed = identity != manifest["file"]
+    if identity["size"] != manifest["file"]["size"]:
+        # Different length: the file isn't the one the manifest describes
+        return {"status": "bad", "reason": "size changed", "bad_segments": sorted(manifest["segments"]),
+                "bad_chunks": list(range(count)), "checked": 0, "bytes": 0, "seconds": 0.0}
+
+    now = time.time()
+    if full or changed:
+        indices = list(range(count))
+    else:
+        indices = []
+        planned = 0
+        for _, i in sorted((t, i) for i, t in enumerate(manifest["verified"]) if now - t > max_age):
+            if indices and planned + offsets[i + 1] - offsets[i] > budget:
+                break
+            indices.append(i)
+            planned += offsets[i + 1] - offsets[i]
+
+    digests, total = hash_chunks(video_path, indices, offsets, manifest["algorithm"], workers)
+    bad_chunks = sorted(i for i, digest in digests.items() if digest != manifest["chunks"][i])
+    for i in digests:
+        if i not in bad_chunks:
+            manifest["verified"][i] = now
+    if changed and not bad_chunks:
+        manifest["file"] = identity  # Same content, new metadata (e.g. copied back from a backup)
+    if digests:
+        try:
+            save_manifest(video_path, manifest)
+        except OSError as e:
+            print(f"Could not update {manifest_path(video_path)}: {e}")
+
+    elapsed = time.monotonic() - started
+    return {
+        "status": "bad" if bad_chunks else "ok",
+        "reason": "metadata changed" if changed else ("full check" if full else "aged chunks"),
+        "checked": len(indices),
+        "bytes": total,
+        "seconds": elapsed,
+        "throughput": total / elapsed if elapsed > 0 else 0.0,
+        "bad_chunks": bad_chunks,
+        "bad_segments": affected_segments(manifest, bad_chunks) if bad_chunks else [],
+    }
+
+
+def _decode_segment(video_path, segment):
+    """Decode one segment to nowhere; returns (name, seconds, error or None)"""
+    started = time.monotonic()
+    result = subprocess.run([
+        "ffmpeg", "-v", "error", "-nostdin", "-threads", "1",
+        "-ss", str(segment["start"]), "-t", str(segment["duration"]),
+        "-i", video_path, "-f", "null", "-"
+    ], capture_output=True, text=True)
+    error = result.stderr.strip().splitlines()
+    if result.returncode != 0 or error:
+        return segment["name"], time.monotonic() - started, error[0] if error else f"exit {result.returncode}"
+    return segment["name"], time.monotonic() - started, None
+
+
+def decode_check(video_path, segments, workers=WORKERS):
+    """Full decode of every segment, one single-threaded ffmpeg per core; returns {name: error}"""
+    started = time.monotonic()
+    failures = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, seconds, error in pool.map(lambda seg: _decode_segment(video_path, seg), segments):
+            print(f"  {name}: {'OK' if error is None else 'FAILED ' + error} ({seconds:.1f}s)")
+            if error is not None:
+                failures[name] = error
+    elapsed = time.monotonic() - started
+    media = sum(seg["duration"] for seg in segments)
+    size = os.path.getsize(video_path)
+    print(f"Decoded {media:.1f}s of video in {elapsed:.1f}s with {workers} workers "
+          f"({media / max(elapsed, 1e-9):.1f}x real time, {size / (1024*1024) / max(elapsed, 1e-9):.1f}MB/s)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk-hash and decode verification of the merged video")
+    parser.add_argument("mode", choices=["build", "check", "decode"])
+    parser.add_argument("video", nargs="?", default=prefetch.MERGED_VIDEO)
+    parser.add_argument("--timings", default=prefetch.VIDEO_TIMINGS_FILE, help="video_timings.txt")
+    parser.add_argument("--full", action="store_true", help="check: re-hash every chunk")
+    parser.add_argument("--max-age", type=float, default=VERIFY_MAX_AGE, help="check: seconds before a chunk is due")
+    parser.add_argument("--budget", type=int, default=BOOT_BUDGET, help="check: bytes of aged chunks per run")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    if args.mode == "check":
+        result = verify(args.video, args.max_age, args.budget, args.full, args.workers)
+        print(f"{result['status']}: {result.get('reason', '')}")
+        if "checked" in result:
+            print(f"Checked {result['checked']} chunks, {result['bytes'] / (1024*1024):.1f}MB in "
+                  f"{result['seconds']:.2f}s ({result['throughput'] / (1024*1024):.1f}MB/s)")
+        if result["bad_segments"]:
+            print(f"Bad chunks: {result['bad_chunks']}")
+            print(f"Affected segments: {', '.join(result['bad_segments'])}")
+        return
+
+    segments = prefetch.read_timings(args.timings)
+    if args.mode == "build":
+        build_manifest(args.video, segments, workers=args.workers)
+    else:
+        failures = decode_check(args.video, segments, args.workers)
+        if failures:
+            print(f"Decode errors in: {', '.join(sorted(failures))}")
+
+if __name__ == "__main__":
+    main()
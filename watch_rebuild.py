@@ -0,0 +1,217 @@
+import os
+import time
+import fnmatch
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import argparse
+
+import get_timings
+import merge_and_extract
+
+# === Configuration ===
+VIDEO_FOLDER = merge_and_extract.VIDEO_FOLDER
+APP_PID_FILE = "/tmp/pi_video_app.pid"  # Written by app.py; it reloads the media on SIGHUP
+SETTLE_SECONDS = 10  # Quiet time after the last change before rebuilding (copies arrive in many writes)
+RESCAN_SECONDS = 300  # Also compare the folder listing this often, in case an event was missed
+BACKGROUND = True  # Rebuild within encode_budget.py's limits, pausing while app.py plays (--foreground to lift)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ATTRIB
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+
+class FolderWatch:
+    """inotify watch on a folder and its subfolders (skipping releases and hidden ones)"""
+
+    def __init__(self, folder, skip=(merge_and_extract.RELEASES_DIR,)):
+        self.folder = folder
+        self.skip = set(skip)
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}  # wd -> folder
+        for root, dirs, _ in os.walk(folder):
+            dirs[:] = [d for d in dirs if not self._skipped(os.path.join(root, d))]
+            self.add(root)
+
+    def _skipped(self, path):
+        rel = os.path.relpath(path, self.folder)
+        return rel.split(os.sep)[0] in self.skip or os.path.basename(path).startswith(".")
+
+    def add(self, path):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            print(f"Cannot watch {path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.paths[wd] = path
+
+    def read(self, timeout):
+        """Changed paths (relative to the folder) seen within `timeout` seconds; None on queue overflow"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            folder = self.paths.get(wd)
+            if folder is None:
+                continue
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self._skipped(path):
+                    for root, dirs, _ in os.walk(path):  # Files may land before the new watch exists
+                        dirs[:] = [d for d in dirs if not d.startswith(".")]
+                        self.add(root)
+                    changed.append(os.path.relpath(path, self.folder) + os.sep)
+                continue
+            if mask & IN_DELETE_SELF:
+                del self.paths[wd]
+                continue
+            changed.append(os.path.relpath(path, self.folder))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_source(rel_path):
+    """Whether a changed path can affect the merge (a new folder always can)"""
+    if rel_path.endswith(os.sep):
+        return True
+    name = os.path.basename(rel_path)
+    if not any(fnmatch.fnmatch(name.lower(), p) for p in get_timings.INCLUDE_PATTERNS):
+        return False
+    return not any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in get_timings.EXCLUDE_PATTERNS)
+
+
+def source_state(folder):
+    """(name, size, mtime) of every source video; a change means a rebuild is due"""
+    state = []
+    for rel in merge_and_extract.source_files(folder):
+        try:
+            st = os.stat(os.path.join(folder, rel))
+        except OSError:
+            continue
+        state.append((rel, st.st_size, st.st_mtime_ns))
+    return state
+
+
+def notify_app(pid_file=APP_PID_FILE):
+    """Ask the running app.py to switch to the new media between plays"""
+    try:
+        with open(pid_file) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, signal.SIGHUP)
+        print(f"Sent SIGHUP to app.py (pid {pid})")
+        return True
+    except (OSError, ValueError) as e:
+        print(f"Could not signal app.py ({e}); it will use the new media after a restart")
+        return False
+
+
+def rebuild(pid_file=APP_PID_FILE):
+    started = time.monotonic()
+    try:
+        release = merge_and_extract.build_release()
+    except Exception as e:
+        print(f"Rebuild failed: {e}")
+        return False
+    if not release:
+        print("Rebuild failed, keeping the current media")
+        return False
+    print(f"Rebuilt in {time.monotonic() - started:.0f}s")
+    notify_app(pid_file)
+    return True
+
+
+def run(folder=VIDEO_FOLDER, settle=SETTLE_SECONDS, pid_file=APP_PID_FILE):
+    """Rebuild and publish whenever the source videos change and then stay unchanged for `settle` s"""
+    watch = FolderWatch(folder)
+    print(f"Watching {folder} ({len(watch.paths)} folders)")
+    built_state = None
+    current = os.path.join(folder, merge_and_extract.CURRENT_LINK)
+    if os.path.exists(current):
+        built_state = source_state(folder)  # Assume the published release matches what's there
+    dirty_since = None if built_state is not None else time.monotonic()
+    last_scan = time.monotonic()
+
+    try:
+        while True:
+            changed = watch.read(1.0)
+            now = time.monotonic()
+            if changed is None or any(is_source(path) for path in changed):
+                if dirty_since is None:
+                    print(f"Change detected: {', '.join(changed) if changed else 'event queue overflow'}")
+                dirty_since = now  # Restart the settle time on every change
+            elif now - last_scan > RESCAN_SECONDS:
+                last_scan = now
+                if source_state(folder) != built_state:
+                    dirty_since = dirty_since or now
+
+            if dirty_since is None or now - dirty_since < settle:
+                continue
+            # Sizes still growing (a copy in progress) count as a change
+            state = source_state(folder)
+            time.sleep(1)
+            if source_state(folder) != state:
+                dirty_since = time.monotonic()
+                continue
+            dirty_since = None
+            if state == built_state:
+                print("Sources unchanged since the last build")
+                continue
+            if rebuild(pid_file):
+                built_state = state
+            last_scan = time.monotonic()
+    finally:
+        watch.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the merged video when VIDEO_FOLDER changes and hot-swap it into app.py")
+    parser.add_argument("--folder", default=VIDEO_FOLDER)
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS, help="Quiet seconds before rebuilding")
+    parser.add_argument("--pid-file", default=APP_PID_FILE)
+    parser.add_argument("--once", action="store_true", help="Rebuild, publish and signal once, then exit")
+    parser.add_argument("--foreground", action="store_true", help="Rebuild at full speed (nothing is playing)")
+    args = parser.parse_args()
+
+    merge_and_extract.VIDEO_FOLDER = args.folder
+    if BACKGROUND and not args.foreground:
+        merge_and_extract.use_background_budget()
+    if args.once:
+        rebuild(args.pid_file)
+        return
+    try:
+        run(args.folder, args.settle, args.pid_file)
+    except KeyboardInterrupt:
+        print("Stopped")
+
+if __name__ == "__main__":
+    main()